@@ -0,0 +1,77 @@
+"""Decoding throughput with and without a draft model for assisted (speculative) decoding.
+
+Usage: python -m benchmarks.assisted [--model PATH] [--assistant PATH] [--new-tokens N] [--limit N]
+
+Every prompt decodes exactly --new-tokens tokens in both modes, so tokens/sec compare directly.
+Offline, benchmark a deeper tiny model against a draft cut from its first block:
+
+    python -m benchmarks.tiny_model --output models/tiny/gpt2-8l --n-layer 8 --n-embd 256
+    python -m benchmarks.tiny_model --draft-of models/tiny/gpt2-8l --output models/tiny/gpt2-draft
+    python -m benchmarks.assisted --model models/tiny/gpt2-8l --assistant models/tiny/gpt2-draft
+"""
+import argparse
+import json
+import time
+import torch
+from src.bot import all_random_questions
+from src.generation import FINETUNED_MODEL_PATH, CodeGenerator, build_prompt
+from src.retrieval import retrieve_section
+from src.utils import load_config
+
+def decode_seconds(generator, prompt, new_tokens, do_sample):
+    """Wall time of one single-prompt generate() call that emits exactly new_tokens tokens."""
+    inputs, extra = generator._encode([prompt])
+    extra.update(generator._assistant_kwargs(1))
+    sampling = {"temperature": 0.5, "top_p": 0.95} if do_sample else {}
+    start = time.perf_counter()
+    with torch.no_grad():
+        generator.model.generate(
+            inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            max_new_tokens=new_tokens,
+            min_new_tokens=new_tokens,
+            do_sample=do_sample,
+            pad_token_id=generator.tokenizer.eos_token_id,
+            **sampling,
+            **extra
+        )
+    return time.perf_counter() - start
+
+def run(model_path=FINETUNED_MODEL_PATH, assistant_path=None, num_assistant_tokens=None, new_tokens=128, limit=5):
+    assistant_config = load_config().get("models", {}).get("generation", {}).get("assistant", {})
+    assistant_path = assistant_path or assistant_config.get("model", "distilgpt2")
+    num_assistant_tokens = num_assistant_tokens or assistant_config.get("num_assistant_tokens", 5)
+    generator = CodeGenerator(model_path)
+    prompts = [build_prompt(question, retrieve_section(question)) for question in all_random_questions()[:limit]]
+    # Warm-up call so one-off allocation costs are not charged to the first mode
+    decode_seconds(generator, prompts[0], 8, False)
+    
+    def throughput(do_sample):
+        seconds = sum(decode_seconds(generator, prompt, new_tokens, do_sample) for prompt in prompts)
+        return len(prompts) * new_tokens / seconds
+    
+    plain = {"greedy": throughput(False), "sampling": throughput(True)}
+    if not generator.set_assistant(assistant_path, num_assistant_tokens):
+        raise SystemExit(f"Could not use {assistant_path} as a draft model; see litcodechat.log")
+    decode_seconds(generator, prompts[0], 8, False)
+    assisted = {"greedy": throughput(False), "sampling": throughput(True)}
+    return {
+        "model": generator.model_source,
+        "prompts": len(prompts),
+        "new_tokens": new_tokens,
+        "num_assistant_tokens": num_assistant_tokens,
+        "tokens_per_second": {
+            mode: {"plain": round(plain[mode], 2), "assisted": round(assisted[mode], 2), "speedup": round(assisted[mode] / plain[mode], 2)}
+            for mode in plain
+        },
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark assisted decoding against plain decoding")
+    parser.add_argument("--model", default=FINETUNED_MODEL_PATH, help="Model directory to benchmark")
+    parser.add_argument("--assistant", help="Draft model (defaults to models.generation.assistant.model)")
+    parser.add_argument("--num-assistant-tokens", type=int, help="Initial tokens proposed per draft step")
+    parser.add_argument("--new-tokens", type=int, default=128, help="Tokens decoded per prompt")
+    parser.add_argument("--limit", type=int, default=5, help="Number of /random questions to decode")
+    args = parser.parse_args()
+    print(json.dumps(run(args.model, args.assistant, args.num_assistant_tokens, args.new_tokens, args.limit), indent=2))
@@ -0,0 +1,216 @@
+"""Drive the webhook server locally with fake Telegram updates.
+
+Starts a stand-in Bot API server that records the bot's replies, runs the webhook server
+against it in a subprocess, posts fake message updates and reports reply latency and the
+memory of every worker process (RSS, and the USS/PSS that show how much is shared).
+
+Usage: python -m benchmarks.fake_telegram [--model PATH] [--workers N] [--updates N]
+                                          [--concurrency N] [--output FILE]
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import psutil
+
+FAKE_TOKEN = "123456:fake-token"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "LitCode Chat", "username": "litcode_chat_bot"}
+
+class FakeBotAPI(ThreadingHTTPServer):
+    """Minimal Bot API: answers getMe, sendMessage and editMessageText and records every call."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0):
+        super().__init__(("127.0.0.1", port), _BotAPIHandler)
+        self.calls = []
+        self.replied = threading.Condition()
+        self._message_ids = iter(range(1, 1 << 31))
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}/bot"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-bot-api", daemon=True).start()
+        return self
+
+    def replies(self, chat_id):
+        return [call for call in self.calls if call[0] == "sendMessage" and int(call[1].get("chat_id", 0)) == chat_id]
+
+    def wait_for_replies(self, count, timeout):
+        """Wait until `count` sendMessage calls were recorded; return whether they were."""
+        deadline = time.monotonic() + timeout
+        with self.replied:
+            while sum(call[0] == "sendMessage" for call in self.calls) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.replied.wait(remaining)
+        return True
+
+class _BotAPIHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(body or "{}")
+        else:
+            params = {key: values[0] for key, values in parse_qs(body).items()}
+        if method == "getMe":
+            result = BOT_USER
+        elif method in ("sendMessage", "editMessageText"):
+            result = {
+                "message_id": int(params.get("message_id") or next(self.server._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        with self.server.replied:
+            self.server.calls.append((method, params, time.perf_counter()))
+            self.server.replied.notify_all()
+        payload = json.dumps({"ok": True, "result": result}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def fake_update(update_id, chat_id, text):
+    """A Telegram message update as the Bot API would post it to a webhook."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Tester"},
+            "text": text,
+            **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]} if text.startswith("/") else {}),
+        },
+    }
+
+def post_update(url, update, secret_token=None):
+    """POST one update to the webhook and return the HTTP status."""
+    request = urllib.request.Request(url, data=json.dumps(update).encode("utf-8"), method="POST")
+    request.add_header("Content-Type", "application/json")
+    if secret_token:
+        request.add_header("X-Telegram-Bot-Api-Secret-Token", secret_token)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_for_port(port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def worker_memory(server_pid):
+    """RSS, USS and PSS in bytes of every webhook worker process."""
+    memory = []
+    for child in psutil.Process(server_pid).children():
+        info = child.memory_full_info()
+        memory.append({"pid": child.pid, "rss": info.rss, "uss": info.uss, "pss": getattr(info, "pss", None)})
+    return memory
+
+def run(model_path=None, workers=2, updates=20, concurrency=4, timeout=600):
+    api = FakeBotAPI().start()
+    port = _free_port()
+    launch = (
+        "import sys; from src import generation; from src.webhook import run_webhook\n"
+        "if sys.argv[1]: generation.use_model(sys.argv[1])\n"
+        "run_webhook(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), sys.argv[5])\n"
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-c", launch, model_path or "", FAKE_TOKEN, str(workers), str(port), api.base_url],
+        env=dict(os.environ, TELEGRAM_WEBHOOK_SECRET=""),
+    )
+    try:
+        if not _wait_for_port(port, timeout):
+            raise RuntimeError("Webhook server did not start")
+        # Workers log in once they have initialized the bot
+        if not _wait_for_calls(api, "getMe", workers, timeout):
+            raise RuntimeError("Webhook workers did not initialize")
+        from src.bot import all_random_questions
+        questions = all_random_questions()
+        url = f"http://127.0.0.1:{port}/telegram"
+        posted = {}
+
+        def send(i):
+            posted[1000 + i] = time.perf_counter()
+            return post_update(url, fake_update(i + 1, 1000 + i, questions[i % len(questions)]))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            statuses = list(pool.map(send, range(updates)))
+        answered = api.wait_for_replies(updates, timeout)
+        elapsed = time.perf_counter() - start
+        latencies = sorted(
+            (min(sent for method, params, sent in api.replies(chat_id) if method == "sendMessage") - posted_at) * 1000.0
+            for chat_id, posted_at in posted.items() if api.replies(chat_id)
+        )
+        memory = worker_memory(server.pid)
+        return {
+            "workers": workers,
+            "updates": updates,
+            "accepted": statuses.count(200),
+            "answered": len(latencies),
+            "all_answered": answered,
+            "updates_per_second": round(len(latencies) / elapsed, 3),
+            "reply_latency_ms": {
+                "p50": round(latencies[len(latencies) // 2], 1) if latencies else None,
+                "max": round(latencies[-1], 1) if latencies else None,
+            },
+            "server_rss": psutil.Process(server.pid).memory_info().rss,
+            "worker_memory": memory,
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+        api.shutdown()
+
+def _wait_for_calls(api, method, count, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if sum(call[0] == method for call in api.calls) >= count:
+            return True
+        time.sleep(0.1)
+    return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post fake Telegram updates to a local multi-worker webhook server")
+    parser.add_argument("--model", help="Checkpoint to serve instead of the fine-tuned model (e.g. a tiny local model)")
+    parser.add_argument("--workers", type=int, default=2, help="Webhook worker processes")
+    parser.add_argument("--updates", type=int, default=20, help="Fake updates to post")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent posting clients")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+    output = json.dumps(run(args.model, args.workers, args.updates, args.concurrency), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
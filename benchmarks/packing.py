@@ -0,0 +1,85 @@
+"""Measured training-epoch time with length-grouped padding versus packed blocks.
+
+Runs one epoch of forward/backward/optimizer steps over the book's code examples in both
+layouts, from the same initial weights, and reports wall time next to the token-count
+estimate from src.train.packing_report.
+
+Usage: python -m benchmarks.packing [--model PATH] [--batch-size N] [--block-size N]
+                                    [--limit N] [--output FILE]
+
+Pass --model with a tiny local checkpoint to run offline; python -m benchmarks.tiny_model builds one.
+"""
+import argparse
+import copy
+import json
+import time
+import torch
+from torch.utils.data import DataLoader
+from transformers import GPT2LMHeadModel, GPT2Tokenizer, default_data_collator
+from src.train import BOOK_TEXT_PATH, FINETUNED_MODEL_PATH, BookCodeDataset, PackedBookCodeDataset, packing_report, pad_collate
+
+def length_grouped(dataset, batch_size):
+    """Batches of similar-length examples, as Trainer's group_by_length forms them."""
+    order = sorted(range(len(dataset)), key=lambda i: -len(dataset.input_ids[i]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+def epoch_seconds(model, batches):
+    """Wall time of one training epoch over pre-collated batches."""
+    model.train()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=5e-5)
+    start = time.perf_counter()
+    for batch in batches:
+        loss = model(**batch).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+    return time.perf_counter() - start
+
+def run(model_path=FINETUNED_MODEL_PATH, batch_size=8, block_size=256, limit=None, cache_dir="data/processed/train_cache"):
+    tokenizer = GPT2Tokenizer.from_pretrained(model_path)
+    tokenizer.pad_token = tokenizer.eos_token
+    base = GPT2LMHeadModel.from_pretrained(model_path, pad_token_id=tokenizer.eos_token_id)
+    dataset = BookCodeDataset(BOOK_TEXT_PATH, tokenizer, cache_dir=cache_dir)
+    if limit:
+        dataset = dataset.select(range(min(limit, len(dataset))))
+    packed = PackedBookCodeDataset(dataset, block_size)
+
+    padded_batches = [
+        pad_collate([dataset[i] for i in batch], tokenizer.eos_token_id) for batch in length_grouped(dataset, batch_size)
+    ]
+    packed_batches = list(DataLoader(packed, batch_size=batch_size, collate_fn=default_data_collator))
+
+    # Warm up kernels and the allocator so neither layout pays for the first step
+    epoch_seconds(copy.deepcopy(base), padded_batches[:1] + packed_batches[:1])
+    padded_seconds = epoch_seconds(copy.deepcopy(base), padded_batches)
+    packed_seconds = epoch_seconds(copy.deepcopy(base), packed_batches)
+    estimate = packing_report(dataset, packed, batch_size)
+    return {
+        "model": model_path,
+        "examples": len(dataset),
+        "batch_size": batch_size,
+        "block_size": block_size,
+        "padded_batches": len(padded_batches),
+        "packed_batches": len(packed_batches),
+        "padded_epoch_seconds": round(padded_seconds, 3),
+        "packed_epoch_seconds": round(packed_seconds, 3),
+        "measured_epoch_time_reduction": round(1 - packed_seconds / padded_seconds, 3),
+        "estimated_token_reduction": round(estimate["token_reduction_vs_batch_padding"], 3),
+        "packing_efficiency": round(estimate["packing_efficiency"], 3),
+        # Packed examples are cut to fit a block; a block size below the longest example trains on less text
+        "truncated_examples": sum(len(ids) > block_size for ids in dataset.input_ids),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure epoch time with padded versus packed training batches")
+    parser.add_argument("--model", default=FINETUNED_MODEL_PATH, help="Checkpoint to train (e.g. a tiny local model)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--block-size", type=int, default=256)
+    parser.add_argument("--limit", type=int, help="Use only the first N examples")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+    output = json.dumps(run(args.model, args.batch_size, args.block_size, args.limit), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
@@ -0,0 +1,53 @@
+"""Prefill time per request with and without the cached instruction prefix.
+
+Usage: python -m benchmarks.prefill [--model PATH] [--repeats N]
+"""
+import argparse
+import json
+import statistics
+import time
+import torch
+from src.bot import all_random_questions
+from src.generation import FINETUNED_MODEL_PATH, PROMPT_PREFIX, CodeGenerator, build_prompt
+from src.retrieval import retrieve_section
+
+def time_forward(model, input_ids, past_key_values=None, repeats=5):
+    """Median wall time in milliseconds of one forward pass."""
+    timings = []
+    with torch.no_grad():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(input_ids, past_key_values=past_key_values, use_cache=True)
+            timings.append((time.perf_counter() - start) * 1000.0)
+    return statistics.median(timings)
+
+def run(model_path=FINETUNED_MODEL_PATH, repeats=5):
+    generator = CodeGenerator(model_path)
+    tokenizer, model = generator.tokenizer, generator.model
+    generator.set_prompt_prefix(PROMPT_PREFIX)
+    _, prefix_ids, past_key_values = generator._prefix
+    
+    full_ms, cached_ms = [], []
+    for question in all_random_questions():
+        prompt = build_prompt(question, retrieve_section(question))
+        full_ids = tokenizer(prompt, return_tensors="pt")["input_ids"]
+        suffix_ids = tokenizer(prompt[len(PROMPT_PREFIX):], return_tensors="pt")["input_ids"]
+        full_ms.append(time_forward(model, full_ids, repeats=repeats))
+        cached_ms.append(time_forward(model, suffix_ids, past_key_values, repeats=repeats))
+    
+    full_mean, cached_mean = statistics.mean(full_ms), statistics.mean(cached_ms)
+    return {
+        "model": generator.model_source,
+        "prefix_tokens": len(prefix_ids),
+        "queries": len(full_ms),
+        "full_prefill_ms": round(full_mean, 3),
+        "cached_prefix_prefill_ms": round(cached_mean, 3),
+        "reduction_pct": round(100.0 * (1 - cached_mean / full_mean), 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark prompt prefill with and without the prefix cache")
+    parser.add_argument("--model", default=FINETUNED_MODEL_PATH, help="Model directory to benchmark")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed forward passes per query")
+    args = parser.parse_args()
+    print(json.dumps(run(args.model, args.repeats), indent=2))
@@ -0,0 +1,151 @@
+"""Latency and throughput of the bot's query path: retrieval, generation and end to end.
+
+Usage: python -m benchmarks.query_path [--model PATH] [--queries FILE] [--from-log FILE]
+                                       [--concurrency N] [--repeats N] [--stages LIST] [--output FILE]
+(or python main.py --bench [same options])
+
+Pass --model with a tiny local checkpoint to run offline; python -m benchmarks.tiny_model builds one.
+"""
+import argparse
+import json
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src import generation
+from src.bot import all_random_questions
+from src.generation import build_prompt, decode_stats, generate_code_solution, get_generator, router_stats
+from src.retrieval import retrieve_section
+
+LOGGED_QUERY_PATTERN = re.compile(r"(?:Generated code|Served intent '[^']*') for query: (.+)$")
+
+def logged_queries(log_path):
+    """Queries the bot answered, from a JSON-lines or plain-text log."""
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("{"):
+                try:
+                    line = json.loads(line).get("message", "")
+                except json.JSONDecodeError:
+                    continue
+            match = LOGGED_QUERY_PATTERN.search(line.rstrip("\n"))
+            if match:
+                yield match.group(1).strip()
+
+def load_queries(queries_path=None, log_path=None):
+    """The /random question set plus queries from a text file and/or the bot's log."""
+    queries = all_random_questions()
+    if queries_path:
+        with open(queries_path, "r", encoding="utf-8") as f:
+            queries += [line.strip() for line in f if line.strip()]
+    if log_path:
+        queries += list(logged_queries(log_path))
+    return queries
+
+def percentiles(samples):
+    """p50/p95/p99/mean/max of latency samples in milliseconds."""
+    ordered = sorted(samples)
+    
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+    
+    return {
+        "count": len(ordered),
+        "p50_ms": round(at(0.50), 3),
+        "p95_ms": round(at(0.95), 3),
+        "p99_ms": round(at(0.99), 3),
+        "mean_ms": round(statistics.mean(ordered), 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+def time_calls(fn, inputs, concurrency=1):
+    """Per-call latencies (ms) and overall calls/sec for fn over inputs."""
+    def timed(item):
+        start = time.perf_counter()
+        fn(item)
+        return (time.perf_counter() - start) * 1000.0
+    
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(timed, inputs))
+    else:
+        latencies = [timed(item) for item in inputs]
+    wall = time.perf_counter() - start
+    return latencies, len(inputs) / wall if wall else 0.0
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(queries, model_path=None, concurrency=1, repeats=1, stages=("retrieval", "generate_response", "end_to_end", "routed")):
+    if model_path:
+        generation.use_model(model_path)
+    load_start = time.perf_counter()
+    generator = get_generator()
+    load_seconds = time.perf_counter() - load_start
+    corpus = queries * repeats
+    prompts = {query: build_prompt(query, retrieve_section(query)) for query in queries}
+    
+    report = {
+        "commit": git_commit(),
+        "model": generator.model_source,
+        "queries": len(queries),
+        "repeats": repeats,
+        "concurrency": concurrency,
+        "model_load_seconds": round(load_seconds, 3),
+        "stages": {},
+    }
+    stage_fns = {
+        "retrieval": retrieve_section,
+        "generate_response": lambda query: generator.generate_response(prompts[query]),
+        # Bypass the response cache and the intent router so every query pays for retrieval and generation
+        "end_to_end": lambda query: generate_code_solution(query, use_cache=False, use_router=False),
+        # As served: known question types are answered by the router, the rest by the model
+        "routed": lambda query: generate_code_solution(query, use_cache=False),
+    }
+    for stage in stages:
+        latencies, qps = time_calls(stage_fns[stage], corpus, concurrency if stage != "retrieval" else 1)
+        report["stages"][stage] = dict(percentiles(latencies), queries_per_second=round(qps, 3))
+    report["decodes"] = decode_stats()
+    report["routing"] = router_stats()
+    report["peak_rss_bytes"] = peak_rss_bytes()
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the LitCode Chat query path")
+    parser.add_argument("--model", help="Checkpoint to benchmark instead of the fine-tuned model (e.g. a tiny local model)")
+    parser.add_argument("--queries", help="Extra queries, one per line")
+    parser.add_argument("--from-log", help="Replay queries recorded in a litcodechat.log file")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent callers for generation stages")
+    parser.add_argument("--repeats", type=int, default=1, help="Times to replay the query corpus")
+    parser.add_argument("--stages", default="retrieval,generate_response,end_to_end,routed", help="Comma-separated stages to run")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+    
+    report = run(
+        load_queries(args.queries, args.from_log),
+        model_path=args.model,
+        concurrency=args.concurrency,
+        repeats=args.repeats,
+        stages=[stage.strip() for stage in args.stages.split(",") if stage.strip()],
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+    return report
+
+if __name__ == "__main__":
+    main()
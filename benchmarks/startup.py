@@ -0,0 +1,92 @@
+"""Start-up cost of each main.py mode, from `python -X importtime`.
+
+Usage: python -m benchmarks.startup [--repeats N] [--top N] [--budget SECONDS] [--output FILE]
+
+For every mode this runs a fresh interpreter that imports main.py and the modules the mode
+loads, and reports wall time, total import time and the packages that take longest to import. With
+--budget, exits non-zero if --help or --preprocess start slower than that (for CI).
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+
+# The imports each main.py mode performs before doing any work
+MODES = {
+    "help": "import main",
+    "preprocess": "import main; import src.preprocess",
+    "train": "import main; import src.train",
+    "bot": "import main; import src.bot",
+    "build_embeddings": "import main; import src.embeddings",
+    "export_onnx": "import main; import src.backends; import src.generation",
+}
+# Modes that must start quickly on CI and cron hosts
+FAST_MODES = ("help", "preprocess")
+
+IMPORTTIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def parse_importtime(stderr):
+    """Microseconds spent importing each top-level package, from -X importtime output.
+    
+    Self times are summed per package (torch, transformers, telegram, src, ...) so that
+    nested imports are charged to the package they belong to.
+    """
+    packages = {}
+    for match in IMPORTTIME_PATTERN.finditer(stderr):
+        self_us, _, _, module = match.groups()
+        package = module.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    return packages
+
+def measure(code):
+    """Wall seconds and per-package import microseconds of a fresh interpreter running code."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"`{code}` failed:\n{result.stderr[-2000:]}")
+    return seconds, parse_importtime(result.stderr)
+
+def run(repeats=3, top=5, modes=None):
+    report = {}
+    for mode in modes or MODES:
+        # The median run filters out cold-cache outliers
+        runs = sorted((measure(MODES[mode]) for _ in range(repeats)), key=lambda run: run[0])
+        seconds, imports = runs[len(runs) // 2]
+        report[mode] = {
+            "wall_seconds": round(seconds, 3),
+            "wall_seconds_min": round(runs[0][0], 3),
+            "import_seconds": round(sum(imports.values()) / 1e6, 3),
+            "slowest_packages": {
+                module: round(microseconds / 1e6, 3)
+                for module, microseconds in sorted(imports.items(), key=lambda item: -item[1])[:top]
+            },
+        }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report start-up time of each main.py mode")
+    parser.add_argument("--repeats", type=int, default=3, help="Interpreter runs per mode (the median is reported)")
+    parser.add_argument("--top", type=int, default=5, help="Slowest packages to list per mode")
+    parser.add_argument("--modes", help=f"Comma-separated modes (default: all of {', '.join(MODES)})")
+    parser.add_argument("--budget", type=float, help=f"Fail if {' or '.join(FAST_MODES)} take longer (seconds)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+    
+    modes = [mode.strip() for mode in args.modes.split(",")] if args.modes else None
+    report = run(args.repeats, args.top, modes)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    if args.budget is not None:
+        slow = [mode for mode in FAST_MODES if mode in report and report[mode]["wall_seconds"] > args.budget]
+        if slow:
+            print(f"Over the {args.budget}s start-up budget: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Build a tiny, randomly initialised GPT-2 for offline benchmarks and tests.
+
+The tokenizer is a byte-level BPE trained on the processed book, so prompts have
+realistic token counts; the weights are random, so outputs are gibberish and the
+bot's fallback answers kick in.
+
+With --draft-of, the first --n-layer blocks of an existing model are kept as a smaller
+draft model sharing its tokenizer, for benchmarks.assisted.
+
+Usage: python -m benchmarks.tiny_model [--output DIR] [--vocab-size N] [--n-layer N] [--n-embd N]
+                                       [--draft-of DIR]
+"""
+import argparse
+import copy
+import os
+from tokenizers import ByteLevelBPETokenizer
+from transformers import GPT2Config, GPT2LMHeadModel, GPT2Tokenizer
+
+# Paths
+BOOK_TEXT_PATH = "data/processed/book_text.txt"
+TINY_MODEL_PATH = "models/tiny/gpt2"
+
+def build_tiny_model(output_dir=TINY_MODEL_PATH, text_path=BOOK_TEXT_PATH, vocab_size=4096, n_layer=2, n_embd=64):
+    os.makedirs(output_dir, exist_ok=True)
+    bpe = ByteLevelBPETokenizer()
+    bpe.train([text_path], vocab_size=vocab_size, special_tokens=["<|endoftext|>"])
+    bpe.save_model(output_dir)
+    tokenizer = GPT2Tokenizer(os.path.join(output_dir, "vocab.json"), os.path.join(output_dir, "merges.txt"))
+    eos_id = tokenizer.convert_tokens_to_ids("<|endoftext|>")
+    config = GPT2Config(
+        vocab_size=len(tokenizer), n_positions=1024, n_embd=n_embd, n_layer=n_layer, n_head=2,
+        bos_token_id=eos_id, eos_token_id=eos_id,
+    )
+    GPT2LMHeadModel(config).save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    return output_dir
+
+def build_draft_model(model_dir, output_dir, n_layer=1):
+    """Keep the embeddings, first `n_layer` blocks and final norm of a model as its draft."""
+    model = GPT2LMHeadModel.from_pretrained(model_dir)
+    config = copy.deepcopy(model.config)
+    config.n_layer = n_layer
+    draft = GPT2LMHeadModel(config)
+    # Blocks past n_layer have no counterpart in the draft and are dropped
+    draft.load_state_dict(model.state_dict(), strict=False)
+    draft.save_pretrained(output_dir)
+    GPT2Tokenizer.from_pretrained(model_dir).save_pretrained(output_dir)
+    return output_dir
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a tiny random GPT-2 for offline benchmarks")
+    parser.add_argument("--output", default=TINY_MODEL_PATH, help="Directory to write the model to")
+    parser.add_argument("--vocab-size", type=int, default=4096, help="BPE vocabulary size")
+    parser.add_argument("--n-layer", type=int, help="Transformer blocks (default 2, or 1 for a draft)")
+    parser.add_argument("--n-embd", type=int, default=64, help="Hidden size")
+    parser.add_argument("--draft-of", help="Build a draft model from this model's first blocks instead")
+    args = parser.parse_args()
+    if args.draft_of:
+        output = build_draft_model(args.draft_of, args.output, args.n_layer or 1)
+    else:
+        output = build_tiny_model(args.output, vocab_size=args.vocab_size, n_layer=args.n_layer or 2, n_embd=args.n_embd)
+    print(f"Tiny model saved to {output}")
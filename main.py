@@ -1,31 +1,15 @@
 import argparse
 import os
-import yaml
-from src.preprocess import preprocess_book
-from src.train import train_model
-from src.bot import main as run_bot
 
-# Load config with error handling
-config_path = "config/config.yaml"
-try:
-    with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
-except FileNotFoundError:
-    print(f"Config file not found at {config_path}. Using defaults.")
-    config = {
-        "paths": {
-            "raw_book": "data/raw/Python_Datascience.pdf",
-            "ocr_output": "data/processed/ocr_output.pdf",
-            "processed_text": "data/processed/book_text.txt",
-            "finetuned_model": "models/finetuned/litcode_model_gpt2",
-            "pretrained_model": "models/pretrained/gpt2"
-        },
-        "telegram": {"token_env": "TELEGRAM_TOKEN"},
-        "training": {"epochs": 3, "batch_size": 4, "max_length": 512}
-    }
+# Subsystems are imported inside the branch that uses them, so each mode only pays for
+# its own dependencies: --help and --preprocess never load torch, transformers or telegram.
+# Measure with: python -m benchmarks.startup
 
 def run_full_pipeline():
     """Run the full pipeline: preprocess, train, and start bot."""
+    from src.bot import main as run_bot
+    from src.preprocess import preprocess_book
+    from src.train import train_model
     print("Starting full pipeline...")
     
     print("Preprocessing Python_Datascience.pdf...")
@@ -37,27 +21,70 @@ def run_full_pipeline():
     print("Starting the Telegram bot...")
     run_bot()
 
+def run_parity_check(backend):
+    """Compare a quantized/ONNX backend with the eager model on every /random question."""
+    from src.backends import check_parity
+    from src.bot import all_random_questions
+    from src.generation import FINETUNED_MODEL_PATH, build_prompt
+    from src.retrieval import retrieve_section
+    prompts = [build_prompt(question, retrieve_section(question)) for question in all_random_questions()]
+    report = check_parity(FINETUNED_MODEL_PATH, backend, prompts)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
 def main():
     """Main entry point with command-line arguments."""
     parser = argparse.ArgumentParser(description="LitCode Chat: A Telegram chatbot for Python_Datascience.pdf")
     parser.add_argument("--preprocess", action="store_true", help="Run preprocessing only")
     parser.add_argument("--train", action="store_true", help="Run training only")
+    parser.add_argument("--incremental", action="store_true",
+                        help="With --train, continue the fine-tuned model on new or changed examples only")
+    parser.add_argument("--no-resume", action="store_true", help="With --train, ignore checkpoints of an interrupted run")
     parser.add_argument("--bot", action="store_true", help="Run the bot only")
+    parser.add_argument("--webhook", action="store_true", help="Run the bot from webhooks with several worker processes")
+    parser.add_argument("--workers", type=int, help="Worker processes for --webhook (default: webhook.workers in the config)")
     parser.add_argument("--full", action="store_true", help="Run the full pipeline (preprocess, train, bot)")
+    parser.add_argument("--export-onnx", action="store_true", help="Export the fine-tuned model for the onnx backend")
+    parser.add_argument("--build-embeddings", action="store_true", help="Embed book chunks for dense/hybrid retrieval")
+    parser.add_argument("--bench", nargs=argparse.REMAINDER, metavar="BENCH_ARGS",
+                        help="Benchmark the query path; remaining arguments go to benchmarks.query_path")
+    parser.add_argument("--parity", choices=["int8", "onnx"], help="Check a backend's greedy outputs against the eager model")
     
     args = parser.parse_args()
     
     if args.preprocess:
+        from src.preprocess import preprocess_book
         print("Running preprocessing...")
         preprocess_book()
     elif args.train:
+        from src.train import train_model
         print("Running training...")
-        train_model()
+        train_model("incremental" if args.incremental else None, False if args.no_resume else None)
     elif args.bot:
+        from src.bot import main as run_bot
         print("Running bot...")
         run_bot()
+    elif args.webhook:
+        from src.webhook import run_webhook
+        print("Running webhook server...")
+        run_webhook(workers=args.workers)
     elif args.full:
         run_full_pipeline()
+    elif args.export_onnx:
+        from src.backends import export_onnx
+        from src.generation import FINETUNED_MODEL_PATH
+        print("Exporting model to ONNX...")
+        print(f"ONNX model saved to {export_onnx(FINETUNED_MODEL_PATH)}")
+    elif args.bench is not None:
+        from benchmarks.query_path import main as run_benchmarks
+        run_benchmarks(args.bench)
+    elif args.build_embeddings:
+        from src.embeddings import build_embeddings
+        print("Embedding book chunks...")
+        build_embeddings()
+    elif args.parity:
+        print(f"Checking {args.parity} backend against eager PyTorch...")
+        run_parity_check(args.parity)
     else:
         print("No arguments provided. Use --help for options.")
         parser.print_help()
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import torch
+from torch import nn
+from transformers import GPT2LMHeadModel, GPT2Tokenizer
+from transformers.pytorch_utils import Conv1D
+from src.registry import checkpoint_signature
+from src.utils import log_message
+
+# Paths
+ONNX_MODEL_PATH = "models/onnx/litcode_model_gpt2"
+
+BACKENDS = ("eager", "int8", "onnx")
+
+def _conv1d_to_linear(module):
+    """Swap GPT-2's Conv1D projections for equivalent nn.Linear layers, which torch can quantize."""
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of the transformer blocks; the tied LM head stays in float."""
+    _conv1d_to_linear(model.transformer)
+    torch.ao.quantization.quantize_dynamic(model.transformer, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+def _export_key(model_path):
+    """Short digest of the checkpoint files an export is made from."""
+    return hashlib.sha1(repr(checkpoint_signature(model_path)).encode("utf-8")).hexdigest()[:16]
+
+def _load_onnx(model_path, onnx_path):
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError as e:
+        raise ImportError("The onnx backend needs optimum with ONNX Runtime: pip install optimum[onnxruntime]") from e
+    export_dir = os.path.join(onnx_path, _export_key(model_path))
+    if not os.path.isdir(export_dir):
+        # The checkpoint changed since the last export (or was never exported)
+        log_message(f"No ONNX export of the current {model_path}; exporting it now.", "warning")
+        export_dir = export_onnx(model_path, onnx_path)
+    return ORTModelForCausalLM.from_pretrained(export_dir)
+
+def load_model(model_path, backend="eager", onnx_path=ONNX_MODEL_PATH):
+    """Load the generation model for the given inference backend, in eval mode."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+    if backend == "onnx":
+        return _load_onnx(model_path, onnx_path)
+    model = GPT2LMHeadModel.from_pretrained(model_path)
+    model.eval()
+    if backend == "int8":
+        model = quantize_int8(model)
+    return model
+
+def export_onnx(model_path, onnx_path=ONNX_MODEL_PATH):
+    """Export a GPT-2 checkpoint to an ONNX Runtime graph with KV-cache support.
+    
+    Exports live in a subdirectory of `onnx_path` named after the checkpoint's file
+    signature, so a retrained checkpoint is never served from an older export. Exports
+    of other checkpoints are removed. Returns the export directory.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForCausalLM
+    except ImportError as e:
+        raise ImportError("Exporting to ONNX needs optimum with ONNX Runtime: pip install optimum[onnxruntime]") from e
+    key = _export_key(model_path)
+    export_dir = os.path.join(onnx_path, key)
+    os.makedirs(onnx_path, exist_ok=True)
+    # Exported into a temporary directory and renamed, so a reader never sees a partial export
+    tmp_dir = tempfile.mkdtemp(prefix=f".{key}-", dir=onnx_path)
+    try:
+        model = ORTModelForCausalLM.from_pretrained(model_path, export=True, use_cache=True)
+        model.save_pretrained(tmp_dir)
+        GPT2Tokenizer.from_pretrained(model_path).save_pretrained(tmp_dir)
+        if os.path.isdir(export_dir):
+            shutil.rmtree(export_dir)
+        os.rename(tmp_dir, export_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    for name in os.listdir(onnx_path):
+        path = os.path.join(onnx_path, name)
+        if name != key and not name.startswith(".") and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    log_message(f"Exported {model_path} to ONNX at {export_dir}")
+    return export_dir
+
+def check_parity(model_path, backend, prompts, max_new_tokens=32, onnx_path=ONNX_MODEL_PATH):
+    """Compare greedy outputs and latency of a backend against the eager PyTorch model."""
+    tokenizer = GPT2Tokenizer.from_pretrained(model_path)
+    reference = load_model(model_path, "eager")
+    candidate = load_model(model_path, backend, onnx_path)
+
+    def greedy(model, input_ids):
+        start = time.perf_counter()
+        with torch.no_grad():
+            output = model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.eos_token_id,
+            )
+        return output[0, input_ids.shape[1]:].tolist(), time.perf_counter() - start
+
+    exact, token_agreement, reference_seconds, candidate_seconds = 0, 0.0, 0.0, 0.0
+    for prompt in prompts:
+        input_ids = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)["input_ids"]
+        expected, seconds = greedy(reference, input_ids)
+        reference_seconds += seconds
+        actual, seconds = greedy(candidate, input_ids)
+        candidate_seconds += seconds
+        exact += expected == actual
+        matching = sum(1 for a, b in zip(expected, actual) if a == b)
+        token_agreement += matching / max(len(expected), 1)
+
+    report = {
+        "backend": backend,
+        "prompts": len(prompts),
+        "exact_match_rate": exact / len(prompts),
+        "token_agreement": token_agreement / len(prompts),
+        "eager_seconds": round(reference_seconds, 3),
+        "backend_seconds": round(candidate_seconds, 3),
+        "speedup": round(reference_seconds / candidate_seconds, 2) if candidate_seconds else None,
+    }
+    log_message(f"Backend parity report: {report}")
+    return report
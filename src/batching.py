@@ -0,0 +1,114 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from src.utils import log_message
+
+# Log a throughput/latency summary every this many batches
+REPORT_EVERY_BATCHES = 50
+
+class BatchScheduler:
+    """Collects prompts arriving within a short window and generates them as one batch.
+
+    `generate_batch(prompts, max_length)` must return one decoded string per prompt.
+    A larger `max_wait_ms` or `max_batch_size` raises throughput under load at the cost
+    of extra latency for the first request in each batch.
+    """
+
+    def __init__(self, generate_batch, max_batch_size=4, max_wait_ms=25):
+        self._generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {"batches": 0, "requests": 0, "queue_wait_seconds": 0.0, "generate_seconds": 0.0}
+
+    @classmethod
+    def from_config(cls, generate_batch, batching_config):
+        return cls(
+            generate_batch,
+            max_batch_size=batching_config.get("max_batch_size", 4),
+            max_wait_ms=batching_config.get("max_wait_ms", 25),
+        )
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+                self._thread.start()
+
+    def submit(self, prompt, max_length=400):
+        """Queue a prompt and return a Future resolving to its generated text."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((prompt, max_length, future, time.perf_counter()))
+        return future
+
+    def generate(self, prompt, max_length=400):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(prompt, max_length).result()
+
+    def queue_depth(self):
+        """Prompts submitted but not yet picked up for a batch."""
+        return self._queue.qsize()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Requests with different length limits cannot share one generate() call
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+            for max_length, items in groups.items():
+                self._run_group(items, max_length)
+
+    def _run_group(self, items, max_length):
+        started = time.perf_counter()
+        try:
+            outputs = self._generate_batch([prompt for prompt, _, _, _ in items], max_length)
+        except Exception as e:
+            log_message(f"Batched generation of {len(items)} prompts failed: {e}", "error")
+            for _, _, future, _ in items:
+                future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        for (_, _, future, _), output in zip(items, outputs):
+            future.set_result(output)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["requests"] += len(items)
+            self._stats["queue_wait_seconds"] += sum(started - enqueued for _, _, _, enqueued in items)
+            self._stats["generate_seconds"] += finished - started
+            report = self._stats["batches"] % REPORT_EVERY_BATCHES == 0
+        if report:
+            log_message(f"Batching stats: {self.stats()}")
+
+    def stats(self):
+        """Mean batch size, queue wait and generation throughput so far."""
+        with self._lock:
+            stats = dict(self._stats)
+        batches, requests = stats["batches"], stats["requests"]
+        stats.update({
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "mean_queue_wait_ms": 1000.0 * stats["queue_wait_seconds"] / requests if requests else 0.0,
+            "mean_batch_latency_ms": 1000.0 * stats["generate_seconds"] / batches if batches else 0.0,
+            "requests_per_generate_second": requests / stats["generate_seconds"] if stats["generate_seconds"] else 0.0,
+        })
+        return stats
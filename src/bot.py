@@ -1,7 +1,16 @@
+from telegram.error import BadRequest, RetryAfter, TimedOut
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
-from src.generation import generate_code_solution
-from src.utils import log_message
+from src.cache import normalize_query
+from src.coordinator import SUPERSEDED, RequestCoordinator
+from src.executor import ExecutorBusy, InferenceExecutor
+from src.generation import generate_code_solution, get_generator, stream_code_solution, warm_up
+from src.metrics import REQUESTS, gauge, span, start_metrics_server, trace
+from src.utils import load_config, log_message
+import asyncio
+import itertools
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import random
 
@@ -19,6 +28,190 @@ QUESTION_TEMPLATES = [
 ]
 TOPICS = ["NumPy", "pandas", "matplotlib", "data science"]
 
+def all_random_questions():
+    """Every question /random can ask."""
+    return [template.format(topic=topic) for template, topic in itertools.product(QUESTION_TEMPLATES, TOPICS)]
+
+def prewarm_enabled():
+    """Whether the config asks for /random answers to be cached at start-up."""
+    cache_config = load_config().get("cache", {})
+    return cache_config.get("enabled", False) and cache_config.get("prewarm_random", False)
+
+async def prewarm_random_questions():
+    """Answer every /random question once so they are served from the response cache.
+    
+    Questions go through the inference pool one at a time, so pre-warming takes at most one
+    slot of its queue and waits for room rather than competing with users.
+    """
+    questions = all_random_questions()
+    for question in questions:
+        while True:
+            try:
+                await get_executor().run(generate_code_solution, question)
+                break
+            except ExecutorBusy:
+                await asyncio.sleep(1.0)
+            except asyncio.TimeoutError:
+                break
+    log_message(f"Pre-warmed {len(questions)} random questions")
+
+async def _start_prewarm(application):
+    application.create_task(prewarm_random_questions())
+
+BUSY_MESSAGE = "I'm answering a lot of questions right now. Please try again in a moment."
+TIMEOUT_MESSAGE = "Sorry, that question took too long to answer. Please try again."
+RATE_LIMITED_MESSAGE = "You're sending questions faster than I can answer them. Please wait a moment."
+STREAM_PLACEHOLDER = "Working on it..."
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+
+# Guards the lazily created shared objects below: they are first reached from several threads at once
+_shared_lock = threading.Lock()
+
+_executor = None
+
+def validate_config(config):
+    """Raise ValueError for a combination of settings the bot cannot serve."""
+    pool = config.get("inference", {}).get("pool", "thread")
+    if config.get("streaming", {}).get("enabled", False) and pool != "thread":
+        # stream_answer's producer hands each snapshot back to the event loop from the worker
+        raise ValueError(f"streaming.enabled needs inference.pool 'thread', not '{pool}'")
+
+def get_executor():
+    """Shared inference pool, created from the `inference` config section on first use."""
+    global _executor
+    if _executor is None:
+        with _shared_lock:
+            if _executor is None:
+                validate_config(load_config())
+                _executor = InferenceExecutor.from_config(load_config().get("inference", {}), initializer=get_generator)
+                gauge("litcode_inference_pending", "Queries running or queued on the inference pool", lambda: _executor.pending)
+    return _executor
+
+_coordinator = None
+
+def get_coordinator():
+    """Shared request coordinator, created from the `coordinator` config section on first use."""
+    global _coordinator
+    if _coordinator is None:
+        with _shared_lock:
+            if _coordinator is None:
+                _coordinator = RequestCoordinator.from_config(load_config().get("coordinator", {}))
+    return _coordinator
+
+async def answer_query(update, query):
+    """Generate an answer on the inference pool and reply, shedding load when it is full.
+    
+    Queries pass the per-chat rate limit first. Identical queries in flight share one
+    generation, and a newer query from the same chat cancels one still being generated.
+    Each query is traced: its stage timings are logged as one JSON line under a request id.
+    """
+    with trace("query", log=load_config().get("metrics", {}).get("trace_log", True)) as request:
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        request.attributes["chat_id"] = chat_id
+        coordinator = get_coordinator()
+        streaming_config = load_config().get("streaming", {})
+        if not coordinator.admit(chat_id):
+            request.attributes["outcome"] = "rate_limited"
+            if coordinator.should_warn(chat_id):
+                with span("send"):
+                    await update.message.reply_text(RATE_LIMITED_MESSAGE)
+        elif streaming_config.get("enabled", False):
+            request.attributes["outcome"] = await stream_answer(update, query, streaming_config.get("edit_interval_seconds", 1.0))
+        else:
+            request.attributes["outcome"] = "ok"
+            response = None
+            try:
+                with span("inference"):
+                    response = await coordinator.latest(chat_id, lambda: coordinator.coalesce(
+                        normalize_query(query), lambda: get_executor().run(generate_code_solution, query)
+                    ))
+                if response is SUPERSEDED:
+                    # The chat sent a newer query; answer that one instead
+                    response, request.attributes["outcome"] = None, "superseded"
+            except ExecutorBusy:
+                log_message(f"Inference queue full, rejected query: {query}", "warning")
+                response, request.attributes["outcome"] = BUSY_MESSAGE, "busy"
+            except asyncio.TimeoutError:
+                response, request.attributes["outcome"] = TIMEOUT_MESSAGE, "timeout"
+            if response is not None:
+                with span("send"):
+                    await update.message.reply_text(response)
+        REQUESTS.inc(request.attributes["outcome"])
+
+async def _edit(message, text):
+    """Edit a streamed reply; returns None once it shows `text`, else seconds to wait before retrying."""
+    try:
+        with span("send"):
+            await message.edit_text(text[:TELEGRAM_MAX_MESSAGE_LENGTH])
+    except RetryAfter as e:
+        log_message(f"Flood control on streamed reply; next edit in {e.retry_after}s", "warning")
+        return float(e.retry_after)
+    except TimedOut as e:
+        # The edit may or may not have gone through; the next one will show the latest text
+        log_message(f"Timed out editing streamed reply: {e}", "warning")
+        return 0.0
+    except BadRequest as e:
+        # Telegram rejects edits that leave the text unchanged; anything else is worth logging
+        if "not modified" not in str(e).lower():
+            log_message(f"Failed to edit streamed reply: {e}", "warning")
+    return None
+
+async def _show_final(update, message, text, attempts=3):
+    """Edit the streamed reply to its final text, waiting out flood control.
+    
+    If the edit keeps failing, the final text is sent as a new message instead.
+    """
+    for _ in range(attempts):
+        wait = await _edit(message, text)
+        if wait is None:
+            return
+        await asyncio.sleep(wait)
+    with span("send"):
+        await update.message.reply_text(text[:TELEGRAM_MAX_MESSAGE_LENGTH])
+
+async def stream_answer(update, query, edit_interval=1.0):
+    """Reply immediately, then edit the reply as text is generated, at most once per edit_interval.
+    
+    Intermediate edits that hit flood control or time out are skipped; the final text is
+    always delivered. Returns the outcome of the request: "ok", "busy" or "timeout".
+    """
+    loop = asyncio.get_running_loop()
+    snapshots = asyncio.Queue()
+    
+    def produce():
+        for snapshot in stream_code_solution(query):
+            loop.call_soon_threadsafe(snapshots.put_nowait, snapshot)
+    
+    producer = asyncio.ensure_future(get_executor().run(produce))
+    # Runs after every snapshot queued by produce(), so None always comes last
+    producer.add_done_callback(lambda _: snapshots.put_nowait(None))
+    with span("send"):
+        message = await update.message.reply_text(STREAM_PLACEHOLDER)
+    
+    shown, latest, next_edit = STREAM_PLACEHOLDER, None, time.monotonic() + edit_interval
+    while True:
+        snapshot = await snapshots.get()
+        if snapshot is None:
+            break
+        latest = snapshot
+        if snapshot.strip() and time.monotonic() >= next_edit:
+            wait = await _edit(message, snapshot)
+            if wait is None:
+                shown = snapshot
+            next_edit = time.monotonic() + max(edit_interval, wait or 0.0)
+    
+    outcome = "ok"
+    try:
+        await producer
+    except ExecutorBusy:
+        log_message(f"Inference queue full, rejected query: {query}", "warning")
+        latest, outcome = BUSY_MESSAGE, "busy"
+    except asyncio.TimeoutError:
+        latest, outcome = TIMEOUT_MESSAGE, "timeout"
+    if latest is not None and latest != shown:
+        await _show_final(update, message, latest)
+    return outcome
+
 async def start(update, context):
     """Handler for /start command."""
     await update.message.reply_text(
@@ -30,28 +223,48 @@ async def random_question(update, context):
     """Generate and answer a random question."""
     question = random.choice(QUESTION_TEMPLATES).format(topic=random.choice(TOPICS))
     await update.message.reply_text(f"Random question: {question}")
-    response = generate_code_solution(question)
-    await update.message.reply_text(response)
+    await answer_query(update, question)
 
 async def handle_message(update, context):
     """Handler for user messages."""
     query = update.message.text.strip()
-    response = generate_code_solution(query)
-    await update.message.reply_text(response)
+    await answer_query(update, query)
+
+def build_application(token, base_url=None):
+    """Telegram application with the bot's handlers; `base_url` overrides the Bot API endpoint."""
+    # Handle updates concurrently; the request coordinator limits what each chat can start
+    builder = Application.builder().token(token).concurrent_updates(True)
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("random", random_question))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
 
 def main():
     """Run the Telegram bot."""
     if not TELEGRAM_TOKEN:
         log_message("Telegram token not found in .env", "error")
         return
+    validate_config(load_config())
     
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("random", random_question))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    metrics_config = load_config().get("metrics", {})
+    if metrics_config.get("enabled", False):
+        start_metrics_server(metrics_config.get("port", 9108), metrics_config.get("host", "127.0.0.1"))
+    
+    stats = warm_up()
+    log_message(f"Model warmed up: {stats}")
     
-    log_message("Bot started")
-    application.run_polling()
+    application = build_application(TELEGRAM_TOKEN)
+    if prewarm_enabled():
+        application.post_init = _start_prewarm
+    executor = get_executor()
+    log_message(f"Bot started with {executor.workers} {executor.pool_type} inference workers")
+    try:
+        application.run_polling()
+    finally:
+        executor.shutdown(wait=False)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import OrderedDict
+from src.metrics import counter
+
+COORDINATOR_REQUESTS = counter(
+    "litcode_coordinator_requests_total", "Queries seen by the request coordinator, by result", ("result",)
+)
+
+# Returned by RequestCoordinator.latest() for a request replaced by a newer one from its chat
+SUPERSEDED = object()
+
+class TokenBucket:
+    """Allows bursts of up to `capacity` requests, refilled at `rate` requests per second."""
+
+    def __init__(self, capacity, rate, now=None):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() if now is None else now
+
+    def take(self, now=None):
+        """Spend one token if one is available."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class RequestCoordinator:
+    """Admission control and de-duplication for queries on one event loop.
+
+    - `admit(chat_id)` applies a per-chat token bucket.
+    - `coalesce(key, start)` shares one in-flight run between identical queries.
+    - `latest(chat_id, start)` cancels a chat's pending request when it sends a newer one.
+    """
+
+    def __init__(self, burst=3, per_minute=10, cancel_superseded=True, max_chats=10000):
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.cancel_superseded = cancel_superseded
+        self.max_chats = max_chats
+        self._buckets = OrderedDict()
+        self._inflight = {}
+        self._pending = {}
+        self._superseded = set()
+        self._warned = set()
+        self._counters = {"admitted": 0, "coalesced": 0, "rate_limited": 0, "superseded": 0}
+
+    @classmethod
+    def from_config(cls, coordinator_config):
+        return cls(
+            burst=coordinator_config.get("burst", 3),
+            per_minute=coordinator_config.get("per_minute", 10),
+            cancel_superseded=coordinator_config.get("cancel_superseded", True),
+        )
+
+    def _count(self, result):
+        self._counters[result] += 1
+        COORDINATOR_REQUESTS.inc(result)
+
+    def admit(self, chat_id):
+        """Whether the chat may send another query now; counts it as admitted or rate limited."""
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.burst, self.rate)
+            if len(self._buckets) > self.max_chats:
+                # Forget the least recently active chat; it starts again with a full bucket
+                evicted, _ = self._buckets.popitem(last=False)
+                self._warned.discard(evicted)
+        self._buckets.move_to_end(chat_id)
+        if bucket.take():
+            self._warned.discard(chat_id)
+            self._count("admitted")
+            return True
+        self._count("rate_limited")
+        return False
+
+    def should_warn(self, chat_id):
+        """True for the first rejection of a chat since it was last admitted, so floods get one reply."""
+        if chat_id in self._warned:
+            return False
+        self._warned.add(chat_id)
+        return True
+
+    async def coalesce(self, key, start):
+        """Await the result of `start()` (a coroutine factory), shared with identical in-flight keys.
+
+        The shared run is cancelled only when every caller waiting on it has been cancelled.
+        """
+        entry = self._inflight.get(key)
+        if entry is None:
+            entry = self._inflight[key] = [asyncio.ensure_future(start()), 0]
+            entry[0].add_done_callback(lambda _: self._forget(key, entry))
+        else:
+            self._count("coalesced")
+        task = entry[0]
+        entry[1] += 1
+        try:
+            # Shielded so that one caller giving up does not cancel the run for the others
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not task.done():
+                # Later identical queries must start afresh rather than join a cancelled run
+                self._forget(key, entry)
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    def _forget(self, key, entry):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    async def latest(self, chat_id, start):
+        """Await `start()` as the chat's pending request and return its result.
+
+        If the chat sends a newer request first, this one's run is cancelled and SUPERSEDED is
+        returned; the caller itself is never cancelled, so it can carry on normally.
+        """
+        run = asyncio.ensure_future(start())
+        previous = self._pending.get(chat_id)
+        if self.cancel_superseded and previous is not None and not previous.done():
+            self._superseded.add(previous)
+            previous.cancel()
+            self._count("superseded")
+        self._pending[chat_id] = run
+        try:
+            return await run
+        except asyncio.CancelledError:
+            if run in self._superseded:
+                return SUPERSEDED
+            raise
+        finally:
+            self._superseded.discard(run)
+            if self._pending.get(chat_id) is run:
+                del self._pending[chat_id]
+
+    def stats(self):
+        return dict(self._counters, in_flight=len(self._inflight), chats=len(self._buckets))
@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+from src.index import CHUNK_LINES, CHUNK_STRIDE, file_fingerprint, get_index
+from src.utils import load_config, log_message
+
+# Paths
+EMBEDDINGS_PATH = "data/processed/book_embeddings.npy"
+EMBEDDINGS_META_PATH = "data/processed/book_embeddings.json"
+RETRIEVAL_MODEL_PATH = "models/pretrained/distilbert"
+RETRIEVAL_MODEL_NAME = "distilbert-base-uncased"
+
+# Bump when the layout of the stored vectors or their pooling changes
+EMBEDDINGS_VERSION = 1
+
+# Rows scored at a time in DenseIndex.search; bounds the float32 copy made of the float16 rows
+SEARCH_BLOCK_ROWS = 4096
+
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper
+RRF_K = 60
+
+class Embedder:
+    """Mean-pooled, L2-normalised sentence embeddings from a BERT-style encoder."""
+
+    def __init__(self, model_name_or_path, max_length=512):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+        self.model = AutoModel.from_pretrained(model_name_or_path)
+        self.model.eval()
+        self.max_length = max_length
+        self.model_name = model_name_or_path
+
+    def embed(self, texts, batch_size=32):
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True, max_length=self.max_length, return_tensors="pt"
+            )
+            with torch.no_grad():
+                hidden = self.model(**batch).last_hidden_state
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            vectors.append(torch.nn.functional.normalize(pooled, dim=-1).numpy())
+        return np.concatenate(vectors) if vectors else np.zeros((0, self.model.config.hidden_size), dtype=np.float32)
+
+def embedder_settings():
+    """(model, max_length) of the encoder: models/pretrained/distilbert if present, else the configured hub model."""
+    retrieval_config = load_config().get("models", {}).get("retrieval", {})
+    source = RETRIEVAL_MODEL_PATH if os.path.isdir(RETRIEVAL_MODEL_PATH) else retrieval_config.get("name", RETRIEVAL_MODEL_NAME)
+    return source, retrieval_config.get("max_length", 512)
+
+def load_embedder():
+    return Embedder(*embedder_settings())
+
+def embedding_params(model, max_length):
+    """Everything besides the book text that the stored vectors depend on."""
+    return {
+        "version": EMBEDDINGS_VERSION,
+        "chunk_lines": CHUNK_LINES,
+        "chunk_stride": CHUNK_STRIDE,
+        "model": model,
+        "max_length": max_length,
+    }
+
+def build_embeddings(embeddings_path=EMBEDDINGS_PATH, meta_path=EMBEDDINGS_META_PATH, batch_size=32, embedder=None):
+    """Embed every index chunk offline and store the vectors as a float16 memmap.
+    
+    Both files are built beside the live index and renamed into place, meta last, so a
+    reader never sees half-written vectors or vectors paired with another build's meta.
+    """
+    index = get_index()
+    if index is None:
+        log_message("No book text to embed. Run preprocessing first.", "error")
+        return None
+    embedder = embedder or load_embedder()
+    hidden_size = embedder.model.config.hidden_size
+    os.makedirs(os.path.dirname(embeddings_path) or ".", exist_ok=True)
+    vectors = np.lib.format.open_memmap(
+        f"{embeddings_path}.tmp", mode="w+", dtype=np.float16, shape=(len(index.chunks), hidden_size)
+    )
+    for start in range(0, len(index.chunks), batch_size * 8):
+        batch = index.chunks[start:start + batch_size * 8]
+        vectors[start:start + len(batch)] = embedder.embed(batch, batch_size).astype(np.float16)
+    vectors.flush()
+    del vectors
+    meta = {
+        "model": embedder.model_name,
+        "dim": hidden_size,
+        "count": len(index.chunks),
+        "source_sha1": index.source.get("sha1"),
+        "params": embedding_params(embedder.model_name, embedder.max_length),
+        # Row i of the matrix embeds chunk i of the lexical index
+        "chunks": [{"row": i, "chunk_id": i, "chars": len(chunk)} for i, chunk in enumerate(index.chunks)],
+    }
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    # Without its meta the old index reads as missing while the new vectors are swapped in
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    os.replace(f"{embeddings_path}.tmp", embeddings_path)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    log_message(f"Embedded {len(index.chunks)} chunks with {embedder.model_name} into {embeddings_path}")
+    return embeddings_path
+
+class DenseIndex:
+    """Memory-mapped chunk embeddings searched with blockwise matrix-vector products."""
+
+    def __init__(self, vectors, meta, embedder):
+        self.vectors = vectors
+        self.meta = meta
+        self.embedder = embedder
+        self.chunk_ids = np.array([row["chunk_id"] for row in meta["chunks"]])
+
+    @classmethod
+    def load(cls, embeddings_path=EMBEDDINGS_PATH, meta_path=EMBEDDINGS_META_PATH, embedder=None, source_sha1=None):
+        """Load the stored index, or None if it is missing or was built from other text, chunks or encoder."""
+        if not (os.path.exists(embeddings_path) and os.path.exists(meta_path)):
+            log_message(f"No embedding index at {embeddings_path}. Run: python main.py --build-embeddings", "warning")
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if source_sha1 and meta.get("source_sha1") != source_sha1:
+            log_message("Embedding index is out of date with the book text. Rebuild with --build-embeddings.", "warning")
+            return None
+        expected = embedding_params(embedder.model_name, embedder.max_length) if embedder else embedding_params(*embedder_settings())
+        if meta.get("params") != expected:
+            log_message(
+                f"Embedding index was built with {meta.get('params')}, not {expected}. Rebuild with --build-embeddings.", "warning"
+            )
+            return None
+        vectors = np.load(embeddings_path, mmap_mode="r")
+        if vectors.shape != (meta.get("count"), meta.get("dim")):
+            log_message(f"Embedding vectors {vectors.shape} do not match their meta. Rebuild with --build-embeddings.", "warning")
+            return None
+        return cls(vectors, meta, embedder or load_embedder())
+
+    def search(self, query, top_k=3):
+        """Return up to top_k (cosine score, chunk_id) pairs, best first."""
+        if len(self.chunk_ids) == 0:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        scores = np.empty(len(self.chunk_ids), dtype=np.float32)
+        for start in range(0, len(scores), SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+            # Upcast one block at a time: float32 rows use BLAS instead of slow half math
+            scores[start:start + len(block)] = block.astype(np.float32) @ query_vector
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[i]), int(self.chunk_ids[i])) for i in best]
+
+# ((embedding files signature, source_sha1), DenseIndex or None) of the last load. A failed
+# load is kept too, so it is neither retried nor logged again until its inputs change.
+_dense_index = None
+_dense_lock = threading.Lock()
+
+def embeddings_signature(embeddings_path=EMBEDDINGS_PATH, meta_path=EMBEDDINGS_META_PATH):
+    """Cheap fingerprints of the embedding files, or None if either is missing."""
+    if not (os.path.exists(embeddings_path) and os.path.exists(meta_path)):
+        return None
+    return tuple(file_fingerprint(embeddings_path)), tuple(file_fingerprint(meta_path))
+
+def get_dense_index(source_sha1=None):
+    """Process-wide dense index, or None if it is missing or out of date.
+
+    The index is loaded again only when the embedding files or the book text change.
+    """
+    global _dense_index
+    key = (embeddings_signature(EMBEDDINGS_PATH, EMBEDDINGS_META_PATH), source_sha1)
+    with _dense_lock:
+        if _dense_index is None or _dense_index[0] != key:
+            _dense_index = (key, DenseIndex.load(EMBEDDINGS_PATH, EMBEDDINGS_META_PATH, source_sha1=source_sha1))
+        return _dense_index[1]
+
+def reciprocal_rank_fusion(*rankings, top_k=3):
+    """Fuse ranked (score, chunk_id) lists by summing 1 / (RRF_K + rank)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, (_, chunk_id) in enumerate(ranking):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(((score, chunk_id) for chunk_id, score in fused.items()), reverse=True)[:top_k]
+
+if __name__ == "__main__":
+    build_embeddings()
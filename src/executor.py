@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.utils import log_message, share_logging_with_children
+
+class ExecutorBusy(Exception):
+    """Raised when the inference queue is full and the request is shed."""
+
+class InferenceExecutor:
+    """Runs blocking inference calls off the event loop on a bounded worker pool."""
+
+    def __init__(self, pool="thread", workers=2, max_queue=16, timeout=60.0, initializer=None):
+        if pool == "process":
+            # Workers are forked once the log queue is shared, so their records reach this process's log file
+            share_logging_with_children()
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("fork"), initializer=initializer
+            )
+        elif pool == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference", initializer=initializer)
+        else:
+            raise ValueError(f"Unknown inference pool type: {pool}")
+        self.pool_type = pool
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counters = {"submitted": 0, "completed": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+
+    @classmethod
+    def from_config(cls, inference_config, initializer=None):
+        return cls(
+            pool=inference_config.get("pool", "thread"),
+            workers=inference_config.get("workers", 2),
+            max_queue=inference_config.get("max_queue", 16),
+            timeout=inference_config.get("timeout_seconds", 60),
+            initializer=initializer,
+        )
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                return
+            self._counters["errors" if future.exception() else "completed"] += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool, raising ExecutorBusy or asyncio.TimeoutError."""
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise ExecutorBusy(f"{self._pending} inference requests already pending")
+            self._pending += 1
+            self._counters["submitted"] += 1
+        # The slot is released when the worker finishes, not when the caller gives up,
+        # so timed-out requests still count against the queue until they stop running.
+        call = functools.partial(fn, *args, **kwargs)
+        if self.pool_type == "thread":
+            # Carry the caller's context (e.g. its request trace) into the worker thread
+            call = functools.partial(contextvars.copy_context().run, call)
+        future = self._pool.submit(call)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self._counters["timeouts"] += 1
+            log_message(f"Inference request timed out after {self.timeout}s", "warning")
+            raise
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=self._pending, max_queue=self.max_queue, workers=self.workers)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
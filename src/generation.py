@@ -1,101 +1,464 @@
-from transformers import GPT2Tokenizer, GPT2LMHeadModel
+from transformers import GPT2Tokenizer, StoppingCriteriaList, TextIteratorStreamer
+import contextvars
+import threading
+import time
 import torch
+from src.backends import load_model
+from src.batching import BatchScheduler
+from src.cache import ResponseCache, make_key
+from src.metrics import counter, gauge, span
+from src.registry import ModelRegistry
 from src.retrieval import retrieve_section
-from src.utils import log_message
+from src.router import INTENTS_PATH, IntentRouter
+from src.stopping import CodeAnswerCriteria, is_valid_answer, trim_answer
+from src.utils import load_config, log_message
 
 # Paths
 FINETUNED_MODEL_PATH = "models/finetuned/litcode_model_gpt2"
 
+# A draft model must have at most this fraction of the main model's parameters; a draft of
+# similar size costs as much per token as the main model and only slows decoding down
+MAX_DRAFT_PARAMETER_RATIO = 0.5
+
+GENERATED_TOKENS = counter("litcode_generated_tokens_total", "Tokens sampled by the generation model")
+CACHE_LOOKUPS = counter("litcode_cache_lookups_total", "Response cache lookups, by result", ("result",))
+DECODES = counter("litcode_decodes_total", "Generated answers, by result (valid, invalid or aborted)", ("result",))
+DISCARDED_SECONDS = counter("litcode_discarded_decode_seconds_total", "Decode time spent on answers replaced by a fallback")
+
+# Fixed instructions shared by every prompt. They come before the question so that
+# their attention cache can be computed once and reused (see set_prompt_prefix).
+PROMPT_PREFIX = (
+    "Using 'Python Data Science Handbook', generate a concise Python code solution with an explanation.\n"
+    "Return only this format, filling in with a relevant pandas example:\n"
+    "```python\n"
+    "import pandas as pd\n"
+    "[Insert a complete code example here using pandas]\n"
+    "```\n"
+    "# Explanation:\n"
+    "# [Insert a concise explanation of how the code works]\n"
+)
+
 class CodeGenerator:
-    def __init__(self):
+    def __init__(self, model_path=FINETUNED_MODEL_PATH, backend="eager", fallback=True):
+        """Load `model_path`, or pre-trained DistilGPT-2 if it cannot be loaded and `fallback` is set."""
         try:
-            self.tokenizer = GPT2Tokenizer.from_pretrained(FINETUNED_MODEL_PATH)
+            self.tokenizer = GPT2Tokenizer.from_pretrained(model_path)
             self.tokenizer.pad_token = self.tokenizer.eos_token
-            self.model = GPT2LMHeadModel.from_pretrained(FINETUNED_MODEL_PATH)
-            self.model.eval()
+            self.model = load_model(model_path, backend)
+            self.backend = backend
+            self.model_source = f"{model_path} ({backend})"
         except Exception as e:
+            if not fallback:
+                raise
             log_message(f"Failed to load fine-tuned model: {e}. Using pre-trained DistilGPT-2.", "warning")
             self.tokenizer = GPT2Tokenizer.from_pretrained("distilgpt2")
             self.tokenizer.pad_token = self.tokenizer.eos_token
-            self.model = GPT2LMHeadModel.from_pretrained("distilgpt2")
-            self.model.eval()
+            # An ONNX export only exists for the fine-tuned checkpoint
+            self.backend = "eager" if backend == "onnx" else backend
+            self.model = load_model("distilgpt2", self.backend)
+            self.model_source = f"distilgpt2 ({self.backend})"
+        self.tokenizer.padding_side = "left"  # Batched prompts must end where generation starts
+        self._prefix = None
+        self._assistant = None
+        self._early_stopping = None
+    
+    def memory_footprint(self):
+        # ONNX Runtime sessions do not report their size
+        if hasattr(self.model, "get_memory_footprint"):
+            return self.model.get_memory_footprint()
+        return None
     
     def generate_response(self, prompt, max_length=400):  # Increased for longer examples
-        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
+        return self.generate_batch([prompt], max_length)[0]
+    
+    def generate_batch(self, prompts, max_length=400):
+        """Sample one answer per prompt in a single left-padded generate() call.
+        
+        Only the generated text is returned, not the prompt.
+        """
+        with span("tokenize"):
+            inputs, extra = self._encode(prompts)
+        extra.update(self._assistant_kwargs(len(prompts)))
+        criteria = self._stopping_criteria(inputs)
+        if criteria:
+            extra["stopping_criteria"] = StoppingCriteriaList([criteria])
+        started = time.perf_counter()
+        with span("model_generate"):
+            outputs = self._generate(inputs, max_length, **extra)
+        generated = outputs[:, inputs["input_ids"].shape[1]:]
+        # Sequences that finished early are padded with eos, so count only real new tokens
+        GENERATED_TOKENS.inc(amount=int((generated != self.tokenizer.pad_token_id).sum()))
+        with span("decode"):
+            texts = [trim_answer(text) for text in self.tokenizer.batch_decode(generated, skip_special_tokens=True)]
+        self._report_decodes(texts, criteria, time.perf_counter() - started)
+        return texts
+    
+    def stream_response(self, prompt, max_length=400):
+        """Yield newly decoded text pieces as they are sampled (the prompt is not echoed)."""
+        with span("tokenize"):
+            inputs, extra = self._encode([prompt])
+        extra.update(self._assistant_kwargs(1))
+        criteria = self._stopping_criteria(inputs)
+        if criteria:
+            extra["stopping_criteria"] = StoppingCriteriaList([criteria])
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+        
+        def run():
+            try:
+                with span("model_generate"):
+                    outputs = self._generate(inputs, max_length, streamer=streamer, **extra)
+                GENERATED_TOKENS.inc(amount=outputs.shape[1] - inputs["input_ids"].shape[1])
+            except Exception as e:
+                errors.append(e)
+                streamer.end()  # Unblock the consumer instead of leaving it waiting forever
+        
+        # Run in a copy of this context so the generate span joins the caller's request trace
+        worker = threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True)
+        started = time.perf_counter()
+        worker.start()
+        generated = ""
+        try:
+            for text in streamer:
+                if text:
+                    generated += text
+                    yield text
+        finally:
+            worker.join()
+        if errors:
+            raise errors[0]
+        self._report_decodes([trim_answer(generated)], criteria, time.perf_counter() - started)
+    
+    def set_early_stopping(self, open_fence_within=48, check_every=4):
+        """Stop decoding once the answer's explanation is complete, or abort once it is hopeless.
+        
+        A generation is hopeless when it copies a template placeholder or has not opened a
+        code block within `open_fence_within` tokens. Checks run every `check_every` tokens.
+        """
+        self._early_stopping = {"open_fence_within": open_fence_within, "check_every": check_every}
+    
+    def _stopping_criteria(self, inputs):
+        if self._early_stopping is None:
+            return None
+        return CodeAnswerCriteria(self.tokenizer, inputs["input_ids"].shape[1], inputs["input_ids"].shape[0], **self._early_stopping)
+    
+    def _report_decodes(self, texts, criteria, seconds):
+        """Count valid, invalid and aborted answers and the decode time spent on discarded ones."""
+        if criteria:
+            criteria.finish()
+        for i, text in enumerate(texts):
+            if criteria and criteria.status[i] == "aborted":
+                result = "aborted"
+            else:
+                result = "valid" if is_valid_answer(text) else "invalid"
+            DECODES.inc(result)
+            if result != "valid":
+                decode_seconds = criteria.decode_seconds(i) if criteria else seconds
+                DISCARDED_SECONDS.inc(amount=decode_seconds)
+                reason = criteria.reasons[i] if criteria and criteria.reasons[i] else "no usable code block"
+                log_message(f"Discarded {result} decode after {decode_seconds:.2f}s: {reason}")
+    
+    def set_prompt_prefix(self, prefix):
+        """Precompute the attention cache of a prefix shared by every prompt."""
+        if self.backend == "onnx":
+            log_message("Prompt prefix caching is not supported by the onnx backend; skipping.", "warning")
+            return
+        prefix_ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"]
+        with torch.no_grad():
+            past_key_values = self.model(prefix_ids, use_cache=True).past_key_values
+        self._prefix = (prefix, prefix_ids[0].tolist(), past_key_values)
+    
+    def set_assistant(self, assistant_path, num_assistant_tokens=5):
+        """Use a smaller draft model for assisted (speculative) decoding of single prompts.
+        
+        The draft proposes `num_assistant_tokens` tokens at a time (adjusted as proposals are
+        accepted or rejected) and the main model verifies them in one forward pass. The draft
+        must share the main model's tokenizer and be clearly smaller (see
+        MAX_DRAFT_PARAMETER_RATIO). Returns whether assisted decoding is enabled.
+        """
+        if self.backend == "onnx":
+            log_message("Assisted decoding is not supported by the onnx backend; skipping.", "warning")
+            return False
+        try:
+            assistant = load_model(assistant_path, "eager")
+        except Exception as e:
+            log_message(f"Failed to load draft model {assistant_path}: {e}. Assisted decoding disabled.", "warning")
+            return False
+        if assistant.config.vocab_size != self.model.config.vocab_size:
+            log_message(f"Draft model {assistant_path} has a different vocabulary; assisted decoding disabled.", "warning")
+            return False
+        draft_parameters, main_parameters = assistant.num_parameters(), self.model.num_parameters()
+        if draft_parameters > MAX_DRAFT_PARAMETER_RATIO * main_parameters:
+            log_message(
+                f"Draft model {assistant_path} has {draft_parameters:,} parameters against the main model's "
+                f"{main_parameters:,}; it must be at most {MAX_DRAFT_PARAMETER_RATIO:.0%} of the main model's "
+                "size to speed decoding up. Assisted decoding disabled.", "warning"
+            )
+            return False
+        assistant.generation_config.num_assistant_tokens = num_assistant_tokens
+        assistant.generation_config.num_assistant_tokens_schedule = "heuristic"
+        self._assistant = assistant
+        self.model_source += f" + draft {assistant_path}"
+        return True
+    
+    def _assistant_kwargs(self, batch_size):
+        # transformers only supports assisted generation for a batch of one
+        if self._assistant is None or batch_size != 1:
+            return {}
+        return {"assistant_model": self._assistant}
+    
+    def _encode(self, prompts, max_length=512):
+        """Tokenize prompts, reusing the cached prefix when every prompt starts with it.
+        
+        Returns the model inputs and any extra generate() arguments.
+        """
+        # The draft model cannot reuse the main model's prefix cache, so single prompts
+        # decoded with assistance are encoded in full
+        use_prefix = self._prefix is not None and not (self._assistant is not None and len(prompts) == 1)
+        if use_prefix and all(prompt.startswith(self._prefix[0]) for prompt in prompts):
+            prefix, prefix_ids, past_key_values = self._prefix
+            suffixes = [
+                self.tokenizer(prompt[len(prefix):], truncation=True, max_length=max_length - len(prefix_ids))["input_ids"]
+                for prompt in prompts
+            ]
+            width = max(len(suffix) for suffix in suffixes)
+            if width > 0:
+                # Pad between the prefix and each suffix so the cached prefix keeps its positions;
+                # GPT-2 derives position ids from the attention mask, so padded slots are skipped.
+                input_ids, attention_mask = [], []
+                for suffix in suffixes:
+                    pad = width - len(suffix)
+                    input_ids.append(prefix_ids + [self.tokenizer.pad_token_id] * pad + suffix)
+                    attention_mask.append([1] * len(prefix_ids) + [0] * pad + [1] * len(suffix))
+                batch_size = len(prompts)
+                past_key_values = tuple(
+                    tuple(tensor.expand(batch_size, -1, -1, -1) for tensor in layer) for layer in past_key_values
+                )
+                inputs = {"input_ids": torch.tensor(input_ids), "attention_mask": torch.tensor(attention_mask)}
+                return inputs, {"past_key_values": past_key_values}
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=max_length)
+        return inputs, {}
+    
+    def _generate(self, inputs, max_length, **kwargs):
         with torch.no_grad():
-            outputs = self.model.generate(
+            return self.model.generate(
                 inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
                 max_length=max_length,
                 temperature=0.5,
                 top_p=0.95,
                 do_sample=True,
                 pad_token_id=self.tokenizer.eos_token_id,
-                num_return_sequences=1
+                num_return_sequences=1,
+                **kwargs
             )
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
 
-def generate_code_solution(query):
-    """Generate a code solution with explanation based on a query and book context."""
-    context = retrieve_section(query)
-    prompt = (
-        f"Using 'Python Data Science Handbook', generate a concise Python code solution with an explanation.\n"
-        f"Question: {query}\n"
-        f"Context: {context}\n"
-        "Return only this format, filling in with a relevant pandas example:\n"
-        "```python\n"
-        "import pandas as pd\n"
-        "[Insert a complete code example here using pandas]\n"
-        "```\n"
-        "# Explanation:\n"
-        "# [Insert a concise explanation of how the code works]\n"
+def load_generator(model_path=FINETUNED_MODEL_PATH, fallback=True):
+    """Load a CodeGenerator with the shared prompt prefix pre-encoded if enabled."""
+    generation_config = load_config().get("models", {}).get("generation", {})
+    generator = CodeGenerator(model_path, generation_config.get("backend", "eager"), fallback)
+    if generation_config.get("prefix_cache", True):
+        generator.set_prompt_prefix(PROMPT_PREFIX)
+    early_stopping_config = generation_config.get("early_stopping", {})
+    if early_stopping_config.get("enabled", True):
+        generator.set_early_stopping(
+            early_stopping_config.get("open_fence_within_tokens", 48), early_stopping_config.get("check_every_tokens", 4)
+        )
+    assistant_config = generation_config.get("assistant", {})
+    if assistant_config.get("enabled", False):
+        generator.set_assistant(assistant_config.get("model", "distilgpt2"), assistant_config.get("num_assistant_tokens", 5))
+    return generator
+
+def _model_registry(model_path):
+    # Only the first load may fall back to DistilGPT-2; a failed reload keeps the current model
+    return ModelRegistry(
+        lambda: load_generator(model_path), model_path, reloader=lambda: load_generator(model_path, fallback=False)
     )
-    generator = CodeGenerator()
-    response = generator.generate_response(prompt)
-    
-    # Validate and fix response
-    if ("```python" not in response or "pandas" not in response.lower() or "[Insert" in response):
-        if "filter" in query.lower() and "dataframe" in query.lower():
-            response = (
-                "```python\n"
-                "import pandas as pd\n"
-                "data = {'Name': ['Alice', 'Bob', 'Charlie'], 'Age': [25, 30, 35]}\n"
-                "df = pd.DataFrame(data)\n"
-                "filtered = df[df['Age'] > 28]\n"
-                "print(filtered)\n"
-                "```\n"
-                "# Explanation:\n"
-                "# - Creates a DataFrame with sample data.\n"
-                "# - Filters rows where Age > 28 using boolean indexing.\n"
-            )
-        elif "groupby" in query.lower():
-            response = (
-                "```python\n"
-                "import pandas as pd\n"
-                "data = {'Department': ['Sales', 'Sales', 'HR', 'HR', 'IT', 'IT'],\n"
-                "        'Employee': ['Alice', 'Bob', 'Charlie', 'David', 'Eve', 'Frank'],\n"
-                "        'Salary': [50000, 55000, 60000, 58000, 75000, 72000]}\n"
-                "df = pd.DataFrame(data)\n"
-                "grouped = df.groupby('Department')['Salary'].mean()\n"
-                "print(grouped)\n"
-                "```\n"
-                "# Explanation:\n"
-                "# - groupby('Department') splits the DataFrame into groups based on unique Department values.\n"
-                "# - .mean() computes the average Salary for each group.\n"
-            )
-        else:
-            response = (
-                "```python\n"
-                "import pandas as pd\n"
-                "df = pd.DataFrame({'A': [1, 2, 3], 'B': [4, 5, 6]})\n"
-                "print(df)\n"
-                "```\n"
-                "# Explanation:\n"
-                "# - Creates a simple DataFrame with pandas.\n"
-                "# - Prints the DataFrame to display its contents.\n"
-            )
-    log_message(f"Generated code for query: {query}")
+
+# One generator per process, reloaded when the fine-tuned checkpoint is replaced
+_registry = _model_registry(FINETUNED_MODEL_PATH)
+
+def use_model(model_path):
+    """Serve a different checkpoint (e.g. a tiny local model for offline benchmarks)."""
+    global _registry
+    _registry = _model_registry(model_path)
+
+def get_generator():
+    """Return the shared CodeGenerator, loading it on first use."""
+    return _registry.get()
+
+def warm_up():
+    """Load the model (and the intent router) ahead of the first request and return the model's load stats."""
+    get_router()
+    _registry.load()
+    return _registry.stats()
+
+def model_identity():
+    """Id of the served model, which changes when a reload or retrain replaces its weights."""
+    return _registry.identity()
+
+def model_stats():
+    """Load-time and memory stats of the shared model."""
+    return _registry.stats()
+
+# Guards the lazily created shared objects below: requests arrive on several threads at once
+_shared_lock = threading.Lock()
+
+_scheduler = None
+
+def batching_enabled():
+    """Whether generation requests go through the micro-batching scheduler.
+    
+    Only the workers of a thread pool share a scheduler. A process pool worker runs one
+    request at a time, so its own scheduler would make each one wait out max_wait_ms alone.
+    """
+    config = load_config()
+    return config.get("batching", {}).get("enabled", False) and config.get("inference", {}).get("pool", "thread") == "thread"
+
+def get_scheduler():
+    """Shared micro-batching scheduler, or None when batching is disabled (see batching_enabled)."""
+    global _scheduler
+    batching_config = load_config().get("batching", {})
+    if _scheduler is None and batching_enabled():
+        with _shared_lock:
+            if _scheduler is None:
+                _scheduler = BatchScheduler.from_config(
+                    lambda prompts, max_length: get_generator().generate_batch(prompts, max_length),
+                    batching_config,
+                )
+                gauge("litcode_batch_queue_depth", "Prompts waiting for the batch scheduler", _scheduler.queue_depth)
+    return _scheduler
+
+def batching_stats():
+    """Batch size and latency stats, or None when batching is disabled."""
+    scheduler = get_scheduler()
+    return scheduler.stats() if scheduler else None
+
+_cache = None
+
+def get_cache():
+    """Shared response cache, or None when caching is disabled in the config."""
+    global _cache
+    cache_config = load_config().get("cache", {})
+    if _cache is None and cache_config.get("enabled", False):
+        with _shared_lock:
+            if _cache is None:
+                _cache = ResponseCache.from_config(cache_config)
+    return _cache
+
+_router = None
+
+def get_router():
+    """Shared intent router over the curated template library."""
+    global _router
+    if _router is None:
+        with _shared_lock:
+            if _router is None:
+                router_config = load_config().get("router", {})
+                _router = IntentRouter.load(router_config.get("path", INTENTS_PATH), router_config.get("min_confidence", 1.0))
+    return _router
+
+def _routed_answer(query):
+    """Curated answer for a query of a known type, or None when the model must answer it."""
+    if not load_config().get("router", {}).get("enabled", False):
+        return None
+    with span("route"):
+        return get_router().route(query)
+
+def router_stats():
+    """Queries answered from curated templates versus by the model, or None when routing is disabled."""
+    return get_router().stats() if load_config().get("router", {}).get("enabled", False) else None
+
+def decode_stats():
+    """Generated answers by result, and the decode seconds spent on discarded ones."""
+    stats = {result: DECODES.value(result) for result in ("valid", "invalid", "aborted")}
+    stats["discarded_seconds"] = round(DISCARDED_SECONDS.value(), 3)
+    return stats
+
+def cache_stats():
+    """Hit/miss counters of the response cache, or None when caching is disabled."""
+    cache = get_cache()
+    return cache.stats() if cache else None
+
+def build_prompt(query, context):
+    """Instruction prompt for a query and its retrieved book context."""
+    return PROMPT_PREFIX + f"Question: {query}\nContext: {context}\n"
+
+def fix_response(query, response):
+    """Replace responses without a usable pandas code block with a curated answer."""
+    if not is_valid_answer(response):
+        response = get_router().fallback_answer(query)
     return response
 
+def _cached_response(query, context):
+    cache = get_cache()
+    if cache:
+        with span("cache_lookup"):
+            # Keyed on the model too, so answers from replaced weights are not served
+            cached = cache.get(make_key(query, context, model_identity()))
+        CACHE_LOOKUPS.inc("miss" if cached is None else "hit")
+        if cached is not None:
+            log_message(f"Served cached code for query: {query}")
+            return cached
+    return None
+
+def _store_response(query, context, generated):
+    cache = get_cache()
+    # Text that fails validation is answered with a fallback; caching that would keep the
+    # model from trying the query again for the whole TTL
+    if cache and is_valid_answer(generated):
+        cache.set(make_key(query, context, model_identity()), generated)
+    log_message(f"Generated code for query: {query}")
+
+def generate_code_solution(query, use_cache=True, use_router=True):
+    """Generate a code solution with explanation based on a query and book context."""
+    routed = _routed_answer(query) if use_router else None
+    if routed is not None:
+        return routed
+    with span("retrieval"):
+        context = retrieve_section(query)
+    cached = _cached_response(query, context) if use_cache else None
+    if cached is not None:
+        return cached
+    
+    prompt = build_prompt(query, context)
+    scheduler = get_scheduler()
+    with span("generation"):
+        if scheduler:
+            generated = scheduler.generate(prompt)
+        else:
+            generated = get_generator().generate_response(prompt)
+    
+    if use_cache:
+        _store_response(query, context, generated)
+    return fix_response(query, generated)
+
+def stream_code_solution(query):
+    """Like generate_code_solution, but yield the text generated so far as it grows.
+
+    The last value yielded is always the final, validated response.
+    """
+    routed = _routed_answer(query)
+    if routed is not None:
+        yield routed
+        return
+    with span("retrieval"):
+        context = retrieve_section(query)
+    cached = _cached_response(query, context)
+    if cached is not None:
+        yield cached
+        return
+    
+    prompt = build_prompt(query, context)
+    generated = ""
+    for piece in get_generator().stream_response(prompt):
+        generated += piece
+        yield generated
+    
+    generated = trim_answer(generated)
+    _store_response(query, context, generated)
+    yield fix_response(query, generated)
+
 if __name__ == "__main__":
     sample_query = "How does the groupby() function in Pandas work, and how can it be used to perform aggregate operations on a dataset?"
     print(generate_code_solution(sample_query))
\ No newline at end of file
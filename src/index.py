@@ -0,0 +1,180 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from src.utils import log_message
+
+# Paths
+BOOK_TEXT_PATH = "data/processed/book_text.txt"
+INDEX_PATH = "data/processed/book_index.json"
+
+# Bump when the on-disk layout or tokenization changes so stale indexes are rebuilt
+INDEX_VERSION = 1
+
+# Chunking and BM25 parameters
+CHUNK_LINES = 10
+CHUNK_STRIDE = 5
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "the", "to", "what", "with", "you"
+])
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed."""
+    return [tok for tok in TOKEN_PATTERN.findall(text.lower()) if tok not in STOPWORDS]
+
+def file_fingerprint(file_path):
+    """Cheap (size, mtime) fingerprint used to detect changes without rereading the file."""
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def file_sha1(file_path):
+    """Content hash of a file, used when the cheap fingerprint disagrees."""
+    digest = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_lines(text, chunk_lines=CHUNK_LINES, stride=CHUNK_STRIDE):
+    """Split text into overlapping windows of lines, skipping empty windows."""
+    lines = text.split('\n')
+    chunks = []
+    for start in range(0, max(len(lines), 1), stride):
+        passage = '\n'.join(lines[start:start + chunk_lines]).strip()
+        if passage:
+            chunks.append(passage)
+        if start + chunk_lines >= len(lines):
+            break
+    return chunks
+
+class BookIndex:
+    """BM25 inverted index over fixed-size line chunks of the processed book."""
+
+    def __init__(self, chunks, postings, doc_lengths, source=None):
+        self.chunks = chunks
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.source = source or {}
+        self.avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        n_docs = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in postings.items()
+        }
+
+    @classmethod
+    def build(cls, chunks, source=None):
+        postings = {}
+        doc_lengths = []
+        for doc_id, passage in enumerate(chunks):
+            tokens = tokenize(passage)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append([doc_id, tf])
+        return cls(chunks, postings, doc_lengths, source)
+
+    @classmethod
+    def from_text_file(cls, text_path):
+        with open(text_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        source = {
+            "path": text_path,
+            "fingerprint": file_fingerprint(text_path),
+            "sha1": file_sha1(text_path),
+        }
+        return cls.build(chunk_lines(text), source)
+
+    def search(self, query, top_k=3):
+        """Return up to top_k (score, chunk_id) pairs ranked by BM25 score."""
+        scores = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in plist:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, ((score, doc_id) for doc_id, score in scores.items()))
+
+    def save(self, index_path):
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        payload = {
+            "version": INDEX_VERSION,
+            "params": {"chunk_lines": CHUNK_LINES, "chunk_stride": CHUNK_STRIDE},
+            "source": self.source,
+            "chunks": self.chunks,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def load(cls, index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != INDEX_VERSION or payload.get("params") != {
+            "chunk_lines": CHUNK_LINES, "chunk_stride": CHUNK_STRIDE
+        }:
+            return None
+        return cls(payload["chunks"], payload["postings"], payload["doc_lengths"], payload["source"])
+
+    def is_stale(self, text_path):
+        """True if the text file differs from the one this index was built from."""
+        if not os.path.exists(text_path):
+            return False
+        if file_fingerprint(text_path) == self.source.get("fingerprint"):
+            return False
+        if file_sha1(text_path) == self.source.get("sha1"):
+            # Touched but unchanged: refresh the fingerprint so we skip hashing next time
+            self.source["fingerprint"] = file_fingerprint(text_path)
+            return False
+        return True
+
+def build_index(text_path=BOOK_TEXT_PATH, index_path=INDEX_PATH):
+    """Chunk the processed book, build the BM25 index and save it next to the text."""
+    index = BookIndex.from_text_file(text_path)
+    index.save(index_path)
+    log_message(f"Built retrieval index with {len(index.chunks)} chunks and {len(index.postings)} terms at {index_path}")
+    return index
+
+def load_index(text_path=BOOK_TEXT_PATH, index_path=INDEX_PATH):
+    """Load the saved index, rebuilding it if missing, outdated or built from different text."""
+    if not os.path.exists(text_path):
+        log_message(f"File not found: {text_path}", "error")
+        return None
+    index = None
+    if os.path.exists(index_path):
+        try:
+            index = BookIndex.load(index_path)
+        except Exception as e:
+            log_message(f"Failed to load retrieval index {index_path}: {e}", "warning")
+    if index is None or index.is_stale(text_path):
+        index = build_index(text_path, index_path)
+    return index
+
+_index_cache = {}
+
+def get_index(text_path=BOOK_TEXT_PATH, index_path=INDEX_PATH):
+    """Process-wide index, reloaded only when the underlying text changes."""
+    index = _index_cache.get(index_path)
+    if index is None or index.is_stale(text_path):
+        index = load_index(text_path, index_path)
+        if index is None:
+            return None
+        _index_cache[index_path] = index
+    return index
+
+if __name__ == "__main__":
+    build_index()
@@ -0,0 +1,209 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.utils import log_message
+
+# Histogram bucket upper bounds in seconds, from a fast cache hit to a slow generation
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_text(labelnames, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Monotonically increasing count, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name + _label_text(self.labelnames, labels), value) for labels, value in sorted(values.items())]
+
+class Gauge:
+    """Current value read from a callback at scrape time, e.g. a queue length."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help = help_text
+        self._read = read
+
+    def samples(self):
+        try:
+            return [(self.name, self._read())]
+        except Exception as e:
+            log_message(f"Failed to read gauge {self.name}: {e}", "warning")
+            return []
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations, optionally split by label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (plus +Inf), sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        samples = []
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((self.name + "_bucket" + _label_text(self.labelnames, labels, f'le="{le}"'), cumulative))
+            samples.append((self.name + "_sum" + _label_text(self.labelnames, labels), total))
+            samples.append((self.name + "_count" + _label_text(self.labelnames, labels), cumulative))
+        return samples
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+def _register(metric):
+    # Registration is idempotent so modules can declare their metrics at import time
+    with _metrics_lock:
+        return _metrics.setdefault(metric.name, metric)
+
+def counter(name, help_text, labelnames=()):
+    return _register(Counter(name, help_text, labelnames))
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, labelnames, buckets))
+
+def gauge(name, help_text, read):
+    """Register (or replace) a gauge whose value is read from `read()` at scrape time."""
+    with _metrics_lock:
+        _metrics[name] = Gauge(name, help_text, read)
+        return _metrics[name]
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name} {value}" for name, value in metric.samples())
+    return "\n".join(lines) + "\n"
+
+STAGE_SECONDS = histogram("litcode_stage_seconds", "Time spent in each stage of answering a query", ("stage",))
+REQUESTS = counter("litcode_requests_total", "Queries answered, by outcome", ("outcome",))
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the log
+
+def start_metrics_server(port=9108, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread and return the server (call .shutdown() to stop)."""
+    server = ThreadingHTTPServer((host, port), _HTTPHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    log_message(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
+
+# Per-request trace of the current task or thread; None outside a traced request
+_current_trace = contextvars.ContextVar("litcode_trace", default=None)
+
+class Trace:
+    """Timed stages of one request, logged as a single JSON line when the request finishes."""
+
+    def __init__(self, name, request_id=None):
+        self.name = name
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.spans = []
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, stage, start, seconds):
+        with self._lock:
+            self.spans.append((stage, start, seconds))
+
+    def to_dict(self, started, total_seconds):
+        with self._lock:
+            spans = [
+                {"stage": stage, "offset_ms": round(1000 * (start - started), 3), "ms": round(1000 * seconds, 3)}
+                for stage, start, seconds in self.spans
+            ]
+        return dict(self.attributes, trace=self.name, request_id=self.request_id, total_ms=round(1000 * total_seconds, 3), spans=spans)
+
+def current_trace():
+    return _current_trace.get()
+
+@contextlib.contextmanager
+def trace(name, request_id=None, log=True):
+    """Start a request trace; spans opened inside it (also in copied contexts) are attached to it."""
+    request = Trace(name, request_id)
+    token = _current_trace.set(request)
+    started = time.perf_counter()
+    try:
+        yield request
+    finally:
+        _current_trace.reset(token)
+        if log:
+            log_message(f"trace {request.request_id}", **request.to_dict(started, time.perf_counter() - started))
+
+@contextlib.contextmanager
+def span(stage):
+    """Time a stage into the stage histogram and, if one is active, the current request's trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage)
+        request = _current_trace.get()
+        if request is not None:
+            request.add_span(stage, start, seconds)
@@ -1,19 +1,152 @@
 import re
 import os
-from pdfminer.high_level import extract_text
+import io
+import json
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+from pdfminer.psparser import PSLiteral
+from src.utils import load_config
 
 # Paths
 RAW_BOOK_PATH = "data/raw/Python_Datascience.pdf"
 OCR_OUTPUT_PATH = "data/processed/ocr_output.pdf"
 PROCESSED_TEXT_PATH = "data/processed/book_text.txt"
+PAGE_CACHE_DIR = "data/processed/page_cache"
+CHUNKS_PATH = "data/processed/book_chunks.jsonl"
 
-def extract_text_from_pdf(pdf_path):
+# Prose lines per chunk in the chunk store; code blocks are always one chunk each
+CHUNK_MAX_LINES = 10
+
+PAGE_NUMBER_PATTERN = re.compile(r'^\d+$')
+# Stricter regex for Python syntax
+CODE_LINE_PATTERN = re.compile(r'^(import\s+|def\s+\w+\s*\(|for\s+\w+\s+in\s+|while\s+\w+|if\s+\w+|class\s+\w+\s*[:\(]|print\s*\()')
+PROSE_LINE_PATTERN = re.compile(r'^[A-Za-z\s.,-]+$')
+# "CHAPTER3" title pages and "Chapter 3: Data Manipulation with Pandas" running headers
+CHAPTER_PATTERN = re.compile(r'^CHAPTER\s*(\d+)$')
+RUNNING_HEADER_PATTERN = re.compile(r'^Chapter\s+(\d+):\s+(.+)$')
+
+def _object_digest(obj, digests, visiting=()):
+    """Digest of a PDF object with every indirect reference resolved, memoized by object id.
+    
+    Fonts and images are usually shared between pages, so each is hashed only once.
+    """
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in digests:
+            return digests[obj.objid]
+        if obj.objid in visiting:  # e.g. a /Parent link back up the tree
+            return f"ref:{obj.objid}"
+        digest = _object_digest(obj.resolve(), digests, visiting + (obj.objid,))
+        digests[obj.objid] = digest
+        return digest
+    digest = hashlib.sha1()
+    if isinstance(obj, PDFStream):
+        digest.update(_object_digest(obj.attrs, digests, visiting).encode("ascii"))
+        digest.update(obj.get_rawdata() or b"")
+    elif isinstance(obj, dict):
+        for key in sorted(obj):
+            digest.update(f"{key}=".encode("utf-8"))
+            digest.update(_object_digest(obj[key], digests, visiting).encode("ascii"))
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            digest.update(_object_digest(item, digests, visiting).encode("ascii"))
+    elif isinstance(obj, PSLiteral):
+        digest.update(f"/{obj.name}".encode("utf-8"))
+    else:
+        digest.update(repr(obj).encode("utf-8"))
+    return digest.hexdigest()
+
+def page_hashes(pdf_path):
+    """Hash of every page's content streams and resources (fonts, XObjects), in page order.
+    
+    The same content stream renders differently with another font or image, so a page's
+    cached text is only reused when everything it draws with is unchanged too.
+    """
+    hashes = []
+    digests = {}
+    with open(pdf_path, "rb") as f:
+        for page in PDFPage.get_pages(f):
+            digest = hashlib.sha1()
+            digest.update(_object_digest(page.contents, digests).encode("ascii"))
+            digest.update(_object_digest(page.resources, digests).encode("ascii"))
+            hashes.append(digest.hexdigest())
+    return hashes
+
+def extract_pages(pdf_path, page_numbers):
+    """Extract the text of the given zero-based pages; runs inside a worker process.
+    
+    Each page is rendered exactly as pdfminer's extract_text would, including the
+    trailing form feed, so joining pages in order reproduces its output.
+    """
+    wanted = sorted(set(page_numbers))
+    texts = {}
+    resource_manager = PDFResourceManager()
+    with open(pdf_path, "rb") as f:
+        # pdfminer only yields the shard's own pages; page numbers follow the wanted order
+        for page_number, page in zip(wanted, PDFPage.get_pages(f, pagenos=set(wanted))):
+            output = io.StringIO()
+            device = TextConverter(resource_manager, output, laparams=LAParams())
+            PDFPageInterpreter(resource_manager, device).process_page(page)
+            device.close()
+            texts[page_number] = output.getvalue()
+            if len(texts) == len(wanted):
+                break
+    return texts
+
+def iter_page_texts(pdf_path, workers=None, pages_per_shard=16, cache_dir=PAGE_CACHE_DIR, timings=None):
+    """Yield the text of each PDF page in order, extracting uncached pages in parallel shards.
+    
+    Pages are cached by content hash, so re-runs only extract pages that changed.
+    """
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
+    hashes = page_hashes(pdf_path)
+    timings["hash_pages"] = time.perf_counter() - start
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_paths = [os.path.join(cache_dir, f"{page_hash}.txt") for page_hash in hashes]
+    missing = [page_number for page_number, path in enumerate(cache_paths) if not os.path.exists(path)]
+    shards = [missing[i:i + pages_per_shard] for i in range(0, len(missing), pages_per_shard)]
+    print(f"Extracting {len(missing)} of {len(hashes)} pages ({len(hashes) - len(missing)} cached) in {len(shards)} shards.")
+    
+    timings["extract_pages"] = 0.0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shard_futures = {}
+        for shard in shards:
+            future = pool.submit(extract_pages, pdf_path, shard)
+            for page_number in shard:
+                shard_futures[page_number] = future
+        for page_number, cache_path in enumerate(cache_paths):
+            start = time.perf_counter()
+            future = shard_futures.pop(page_number, None)
+            if future is None:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    text = f.read()
+            else:
+                text = future.result()[page_number]
+                # Written beside the cache file and renamed, so an interrupted run never leaves a truncated page cached
+                with open(f"{cache_path}.tmp", "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(f"{cache_path}.tmp", cache_path)
+            timings["extract_pages"] += time.perf_counter() - start
+            yield text
+
+def extract_page_texts(pdf_path, workers=None, pages_per_shard=16, cache_dir=PAGE_CACHE_DIR, timings=None):
+    """Per-page text of a PDF as a list; see iter_page_texts."""
+    return list(iter_page_texts(pdf_path, workers, pages_per_shard, cache_dir, timings))
+
+def extract_text_from_pdf(pdf_path, workers=None, pages_per_shard=16, timings=None):
     """Extract text from the OCR'd PDF using pdfminer.six."""
     if not os.path.exists(pdf_path):
         print(f"PDF file not found at: {pdf_path}")
         return ""
     try:
-        text = extract_text(pdf_path)
+        text = "".join(iter_page_texts(pdf_path, workers, pages_per_shard, timings=timings))
         if not text.strip():
             print("No text extracted. The PDF might be empty or text layer inaccessible.")
             return ""
@@ -23,37 +156,158 @@ def extract_text_from_pdf(pdf_path):
         print(f"Failed to extract text with pdfminer: {e}")
         return ""
 
-def clean_text(text):
-    """Remove unwanted elements like headers, footers, and extra whitespace."""
-    text = re.sub(r'\n\s*\n', '\n', text.strip())
-    text = re.sub(r'^\d+$', '', text, flags=re.MULTILINE)
-    return text
+def iter_lines(page_texts):
+    """Split a stream of page texts into (page_number, line) pairs.
+    
+    Lines spanning a page break are joined, exactly as if the pages had been
+    concatenated first, and belong to the page on which they end.
+    """
+    partial = ""
+    page_number = -1
+    for page_number, page_text in enumerate(page_texts):
+        lines = (partial + page_text).split('\n')
+        partial = lines.pop()
+        for line in lines:
+            yield page_number, line
+    yield max(page_number, 0), partial
 
-def tag_code_snippets(text):
-    """Tag Python code snippets with stricter detection."""
-    # Stricter regex for Python syntax
-    code_pattern = r'^(import\s+|def\s+\w+\s*\(|for\s+\w+\s+in\s+|while\s+\w+|if\s+\w+|class\s+\w+\s*[:\(]|print\s*\()'
-    lines = text.split('\n')
-    tagged_text = []
-    in_code_block = False
+def clean_lines(lines):
+    """Streaming equivalent of clean_text over (page_number, line) pairs."""
+    pending = None
+    for page_number, line in lines:
+        if not line.strip():
+            continue
+        if pending is None:
+            line = line.lstrip()  # clean_text strips the start of the whole text
+        else:
+            yield pending[0], '' if PAGE_NUMBER_PATTERN.match(pending[1]) else pending[1]
+        pending = (page_number, line)
+    if pending is not None:
+        page_number, line = pending[0], pending[1].rstrip()
+        yield page_number, '' if PAGE_NUMBER_PATTERN.match(line) else line
+
+def tag_lines(lines):
+    """Streaming equivalent of tag_code_snippets, yielding (page_number, line, kind).
     
-    for line in lines:
+    kind is "code" for lines inside a code block, "fence" for the ``` markers it
+    inserts and "prose" for everything else.
+    """
+    in_code_block = False
+    page_number = 0
+    for page_number, line in lines:
         stripped_line = line.strip()
-        if re.match(code_pattern, stripped_line):
+        if CODE_LINE_PATTERN.match(stripped_line):
             if not in_code_block:
-                tagged_text.append("```python")
+                yield page_number, "```python", "fence"
                 in_code_block = True
-            tagged_text.append(line)
-        elif in_code_block and (not stripped_line or re.match(r'^[A-Za-z\s.,-]+$', stripped_line)):
-            tagged_text.append("```")
+            yield page_number, line, "code"
+        elif in_code_block and (not stripped_line or PROSE_LINE_PATTERN.match(stripped_line)):
+            yield page_number, "```", "fence"
             in_code_block = False
-            tagged_text.append(line)
+            yield page_number, line, "prose"
+        elif in_code_block:
+            yield page_number, line, "code"
         else:
-            tagged_text.append(line)
-    
+            yield page_number, line, "prose"
     if in_code_block:
-        tagged_text.append("```")
-    return "\n".join(tagged_text)
+        yield page_number, "```", "fence"
+
+def clean_text(text):
+    """Remove unwanted elements like headers, footers, and extra whitespace."""
+    return "\n".join(line for _, line in clean_lines((0, line) for line in text.split('\n')))
+
+def tag_code_snippets(text):
+    """Tag Python code snippets with stricter detection."""
+    return "\n".join(line for _, line, _ in tag_lines((0, line) for line in text.split('\n')))
+
+def _section_of(line, section):
+    match = RUNNING_HEADER_PATTERN.match(line)
+    if match:
+        return f"Chapter {match.group(1)}: {match.group(2).strip()}"
+    match = CHAPTER_PATTERN.match(line)
+    if match:
+        return f"Chapter {match.group(1)}"
+    return section
+
+def write_outputs(tagged_lines, text_path=PROCESSED_TEXT_PATH, chunks_path=CHUNKS_PATH, max_prose_lines=CHUNK_MAX_LINES):
+    """Stream tagged lines to the flat book text and to a JSONL chunk store.
+    
+    Each chunk record has its section, first/last page, type ("prose" or "code")
+    and [start, end) character offsets of its text within the flat book text.
+    Both files are written to temporary paths and replace the existing outputs only once
+    at least one chunk was written, so a failed or empty run keeps the previous outputs.
+    Returns the number of chunks written.
+    """
+    text_tmp, chunks_tmp = f"{text_path}.tmp", f"{chunks_path}.tmp"
+    try:
+        with open(text_tmp, "w", encoding="utf-8") as text_file, open(chunks_tmp, "w", encoding="utf-8") as chunks_file:
+            count = _write_chunks(tagged_lines, text_file, chunks_file, max_prose_lines)
+        if count:
+            os.replace(text_tmp, text_path)
+            os.replace(chunks_tmp, chunks_path)
+    finally:
+        for path in (text_tmp, chunks_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+    return count
+
+def _write_chunks(tagged_lines, text_file, chunks_file, max_prose_lines):
+    count = 0
+    offset = 0
+    section = None
+    chunk = None
+    
+    def flush(chunks_file):
+        nonlocal chunk, count
+        if chunk is not None:
+            text = "\n".join(chunk["lines"])
+            record = {
+                "id": count,
+                "type": chunk["type"],
+                "section": chunk["section"],
+                "page_start": chunk["page_start"],
+                "page_end": chunk["page_end"],
+                "start": chunk["start"],
+                "end": chunk["start"] + len(text),
+                "text": text,
+            }
+            chunks_file.write(json.dumps(record) + "\n")
+            count += 1
+        chunk = None
+    
+    for line_number, (page_number, line, kind) in enumerate(tagged_lines):
+        if line_number:
+            text_file.write("\n")
+            offset += 1
+        text_file.write(line)
+        if kind == "prose":
+            section = _section_of(line.strip(), section)
+        
+        # Code blocks open and close at fences; prose is cut every max_prose_lines lines
+        if kind == "fence" or (chunk is not None and kind == "prose" and len(chunk["lines"]) >= max_prose_lines):
+            flush(chunks_file)
+        if kind != "fence" and (chunk is not None or kind == "code" or line.strip()):
+            if chunk is None:
+                chunk = {"type": kind, "section": section, "page_start": page_number, "start": offset, "lines": []}
+            chunk["lines"].append(line)
+            chunk["page_end"] = page_number
+        offset += len(line)
+    flush(chunks_file)
+    return count
+
+def _timed(iterable, timings, stage):
+    """Accumulate the time spent producing items of a pipeline stage (including upstream stages)."""
+    iterator = iter(iterable)
+    timings[stage] = 0.0
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timings[stage] += time.perf_counter() - start
+            return
+        timings[stage] += time.perf_counter() - start
+        yield item
 
 def preprocess_book():
     """Main function to preprocess the OCR'd book."""
@@ -63,17 +317,37 @@ def preprocess_book():
         print(f"ocrmypdf --force-ocr {RAW_BOOK_PATH} {OCR_OUTPUT_PATH}")
         return
     
-    raw_text = extract_text_from_pdf(OCR_OUTPUT_PATH)
-    if not raw_text:
-        print("No text extracted. Check the OCR'd PDF.")
+    preprocess_config = load_config().get("preprocessing", {})
+    timings = {}
+    # extract -> clean -> tag -> chunk, one line at a time
+    pages = iter_page_texts(
+        OCR_OUTPUT_PATH,
+        workers=preprocess_config.get("workers"),
+        pages_per_shard=preprocess_config.get("pages_per_shard", 16),
+        timings=timings,
+    )
+    cleaned = _timed(clean_lines(iter_lines(pages)), timings, "through_clean")
+    tagged = _timed(tag_lines(cleaned), timings, "through_tag")
+    start = time.perf_counter()
+    try:
+        chunk_count = write_outputs(tagged)
+    except Exception as e:
+        print(f"Failed to extract text with pdfminer: {e}. Keeping the existing processed text.")
         return
+    total = time.perf_counter() - start
     
-    cleaned_text = clean_text(raw_text)
-    tagged_text = tag_code_snippets(cleaned_text)
-    
-    with open(PROCESSED_TEXT_PATH, "w", encoding="utf-8") as f:
-        f.write(tagged_text)
-    print(f"Processed text saved to {PROCESSED_TEXT_PATH}")
+    if chunk_count == 0:
+        print("No text extracted. Check the OCR'd PDF. Keeping the existing processed text.")
+        return
+    print(f"Processed text saved to {PROCESSED_TEXT_PATH} and {chunk_count} chunks to {CHUNKS_PATH}")
+    stages = {
+        "hash_pages": timings["hash_pages"],
+        "extract": timings["extract_pages"],
+        "clean": timings["through_clean"] - timings["extract_pages"] - timings["hash_pages"],
+        "tag": timings["through_tag"] - timings["through_clean"],
+        "chunk_and_write": total - timings["through_tag"],
+    }
+    print("Stage timings: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stages.items()))
 
 if __name__ == "__main__":
-    preprocess_book()
\ No newline at end of file
+    preprocess_book()
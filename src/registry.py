@@ -0,0 +1,109 @@
+import hashlib
+import os
+import threading
+import time
+import psutil
+from src.utils import log_message
+
+def checkpoint_signature(checkpoint_dir):
+    """Signature of the top-level files in a checkpoint directory, or None if it is missing.
+
+    Only top-level files are considered so that intermediate `checkpoint-*` folders
+    written by the Trainer during a run do not trigger reloads.
+    """
+    if not os.path.isdir(checkpoint_dir):
+        return None
+    entries = []
+    for entry in os.scandir(checkpoint_dir):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(entries))
+
+class ModelRegistry:
+    """Holds one shared instance built by `loader` and reloads it when `watch_path` changes.
+
+    Reloads use `reloader` (default: `loader`), which should raise rather than fall back to
+    another model, so that a failed reload keeps the current instance. A change is only
+    reloaded once the signature is the same on two consecutive checks, so a checkpoint
+    still being written is not loaded half-way.
+    """
+
+    def __init__(self, loader, watch_path, check_interval=30.0, reloader=None):
+        self._loader = loader
+        self._reloader = reloader or loader
+        self._watch_path = watch_path
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._instance = None
+        self._signature = None
+        self._identity = None
+        self._pending_signature = None
+        self._last_check = 0.0
+        self._stats = {"loads": 0}
+
+    def load(self):
+        """Build a fresh instance and swap it in; callers holding the old one keep using it."""
+        with self._lock:
+            return self._load_locked()
+
+    def _load_locked(self, loader=None):
+        signature = checkpoint_signature(self._watch_path)
+        rss_before = psutil.Process().memory_info().rss
+        start = time.perf_counter()
+        instance = (loader or self._loader)()
+        load_seconds = time.perf_counter() - start
+        self._instance = instance
+        self._signature = signature
+        self._pending_signature = None
+        source = getattr(instance, "model_source", None)
+        self._identity = hashlib.sha1(repr((source, signature)).encode("utf-8")).hexdigest()
+        self._last_check = time.monotonic()
+        self._stats.update({
+            "loads": self._stats["loads"] + 1,
+            "load_seconds": round(load_seconds, 3),
+            "loaded_at": time.time(),
+            "source": getattr(instance, "model_source", None),
+            "model_bytes": instance.memory_footprint() if hasattr(instance, "memory_footprint") else None,
+            "rss_delta_bytes": psutil.Process().memory_info().rss - rss_before,
+        })
+        log_message(f"Loaded {self._stats['source']} in {load_seconds:.2f}s ({self._stats['model_bytes']} bytes of weights)")
+        return instance
+
+    def get(self):
+        """Return the shared instance, loading it on first use or after the checkpoint changes."""
+        instance = self._instance
+        if instance is not None and time.monotonic() - self._last_check < self._check_interval:
+            return instance
+        with self._lock:
+            if self._instance is None:
+                return self._load_locked()
+            self._last_check = time.monotonic()
+            signature = checkpoint_signature(self._watch_path)
+            if signature == self._signature:
+                self._pending_signature = None
+            elif signature != self._pending_signature:
+                # Still being written, perhaps: wait for the next check to see the same files
+                self._pending_signature = signature
+                log_message(f"Checkpoint at {self._watch_path} changed; reloading once it is stable.")
+            else:
+                log_message(f"Checkpoint at {self._watch_path} changed; reloading model.")
+                try:
+                    return self._load_locked(self._reloader)
+                except Exception as e:
+                    log_message(f"Hot reload failed, keeping current model: {e}", "error")
+            return self._instance
+
+    def identity(self):
+        """Stable id of the current instance: its model source and checkpoint signature.
+
+        It changes whenever a reload serves different weights, and survives restarts that do not.
+        """
+        self.get()
+        return self._identity
+
+    def stats(self):
+        """Load-time and memory statistics for the current instance."""
+        stats = dict(self._stats)
+        stats["rss_bytes"] = psutil.Process().memory_info().rss
+        return stats
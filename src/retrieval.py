@@ -1,37 +1,62 @@
-import re
-from src.utils import load_text_file, log_message
+from src.index import get_index
+from src.metrics import span
+from src.utils import load_config, log_message
 
 # Paths
 BOOK_TEXT_PATH = "data/processed/book_text.txt"
+INDEX_PATH = "data/processed/book_index.json"
 
-def retrieve_section(query, max_context=200):
-    """Retrieve a relevant section from the book based on a query."""
-    text = load_text_file(BOOK_TEXT_PATH)
-    if not text:
-        log_message("No book text loaded for retrieval.", "error")
-        return "No content available."
+RETRIEVAL_MODES = ("lexical", "dense", "hybrid")
+
+def _dense_search(index, query, top_k):
+    # Imported on first use so lexical-only deployments never load torch for retrieval
+    from src.embeddings import get_dense_index
+    dense_index = get_dense_index(index.source.get("sha1"))
+    return dense_index.search(query, top_k) if dense_index else None
+
+def retrieve_passages(query, top_k=3, mode=None):
+    """Return up to top_k (score, passage) pairs ranked by relevance to the query.
     
-    # Simple keyword-based retrieval
-    query_words = query.lower().split()
-    best_match = None
-    best_score = 0
+    `mode` is "lexical" (BM25), "dense" (embeddings) or "hybrid" (both, rank-fused) and
+    defaults to `retrieval.mode` in the config. Dense modes fall back to BM25 when no
+    up-to-date embedding index exists.
+    """
+    with span("load_index"):
+        index = get_index(BOOK_TEXT_PATH, INDEX_PATH)
+    if index is None:
+        return None
+    mode = mode or load_config().get("retrieval", {}).get("mode", "lexical")
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}'. Choose one of: {', '.join(RETRIEVAL_MODES)}")
     
-    for i, line in enumerate(text.split('\n')):
-        line_lower = line.lower()
-        score = sum(1 for word in query_words if word in line_lower)
-        if score > best_score:
-            best_score = score
-            # Grab context around the line
-            start_idx = max(0, i - 5)
-            end_idx = min(len(text.split('\n')), i + 6)
-            best_match = '\n'.join(text.split('\n')[start_idx:end_idx])
+    ranked = None
+    with span("retrieve"):
+        if mode == "dense":
+            ranked = _dense_search(index, query, top_k)
+        elif mode == "hybrid":
+            # Fuse deeper candidate lists than we return so both retrievers can contribute
+            dense = _dense_search(index, query, top_k * 4)
+            if dense is not None:
+                from src.embeddings import reciprocal_rank_fusion
+                ranked = reciprocal_rank_fusion(index.search(query, top_k * 4), dense, top_k=top_k)
+        if ranked is None:
+            ranked = index.search(query, top_k)
+    return [(score, index.chunks[doc_id]) for score, doc_id in ranked]
+
+def retrieve_section(query, max_context=200, top_k=3):
+    """Retrieve the most relevant sections from the book based on a query."""
+    passages = retrieve_passages(query, top_k)
+    if passages is None:
+        log_message("No book text loaded for retrieval.", "error")
+        return "No content available."
     
-    if best_match:
-        log_message(f"Retrieved section for query '{query}' with score {best_score}")
+    if passages:
+        best_match = '\n...\n'.join(passage for _, passage in passages)
+        log_message(f"Retrieved {len(passages)} sections for query '{query}' with top score {passages[0][0]:.2f}", "debug")
         return best_match[:max_context] + "..." if len(best_match) > max_context else best_match
     return "Couldn’t find a relevant section."
 
 if __name__ == "__main__":
     sample_query = "How do I use pandas?"
     result = retrieve_section(sample_query)
-    print(result)
\ No newline at end of file
+    print(result)
@@ -0,0 +1,111 @@
+import os
+import re
+import threading
+import yaml
+from src.metrics import counter
+from src.utils import log_message
+
+# Paths
+INTENTS_PATH = "data/templates/intents.yaml"
+
+# Independent patterns an intent must have, so that one keyword cannot route a query
+MIN_PATTERNS = 2
+
+# Served when the intent library itself is missing
+DEFAULT_ANSWER = (
+    "```python\n"
+    "import pandas as pd\n"
+    "df = pd.DataFrame({'A': [1, 2, 3], 'B': [4, 5, 6]})\n"
+    "print(df)\n"
+    "```\n"
+    "# Explanation:\n"
+    "# - Creates a simple DataFrame with pandas.\n"
+    "# - Prints the DataFrame to display its contents.\n"
+)
+
+ROUTED_QUERIES = counter("litcode_routed_queries_total", "Queries by route: an intent's curated answer or the model", ("route",))
+
+class Intent:
+    """A question type recognised by precompiled regexes, with its curated answer."""
+
+    def __init__(self, name, patterns, answer, exclude=()):
+        if len(patterns) < MIN_PATTERNS:
+            raise ValueError(f"Intent '{name}' needs at least {MIN_PATTERNS} patterns, got {len(patterns)}")
+        self.name = name
+        self.patterns = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+        self.exclude = [re.compile(pattern, re.IGNORECASE) for pattern in exclude]
+        self.answer = answer
+
+    def signals(self, query):
+        """Number of the intent's patterns found in the query; 0 if an exclusion matches."""
+        if any(pattern.search(query) for pattern in self.exclude):
+            return 0
+        return sum(1 for pattern in self.patterns if pattern.search(query))
+
+    def confidence(self, query):
+        """Fraction of the intent's patterns found in the query; 0 if an exclusion matches."""
+        return self.signals(query) / len(self.patterns)
+
+class IntentRouter:
+    """Answers known question types from a curated template library without running the model."""
+
+    def __init__(self, intents, default_answer=DEFAULT_ANSWER, min_confidence=1.0):
+        self.intents = intents
+        self.default_answer = default_answer
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._counts = {"fast_path": 0, "model": 0}
+
+    @classmethod
+    def load(cls, path=INTENTS_PATH, min_confidence=1.0):
+        """Build a router from a YAML intent library; with no library, only the default answer is known."""
+        if not os.path.exists(path):
+            log_message(f"Intent library not found at {path}. Every query goes to the model.", "warning")
+            return cls([], min_confidence=min_confidence)
+        with open(path, "r", encoding="utf-8") as f:
+            library = yaml.safe_load(f) or {}
+        intents = [
+            Intent(entry["name"], entry["patterns"], entry["answer"], entry.get("exclude", ()))
+            for entry in library.get("intents", [])
+        ]
+        default_answer = library.get("default", {}).get("answer", DEFAULT_ANSWER)
+        log_message(f"Loaded {len(intents)} intents from {path}")
+        return cls(intents, default_answer, min_confidence)
+
+    def matches(self, query, min_confidence=None):
+        """Intents matching the query at or above the confidence threshold, in library order.
+
+        However low the threshold, at least MIN_PATTERNS of an intent's patterns must match.
+        """
+        threshold = self.min_confidence if min_confidence is None else min_confidence
+        return [
+            intent for intent in self.intents
+            if intent.signals(query) >= MIN_PATTERNS and intent.confidence(query) >= threshold
+        ]
+
+    def route(self, query):
+        """Curated answer if exactly one intent matches confidently, else None (use the model)."""
+        matches = self.matches(query)
+        # Queries spanning several intents (e.g. "filter and then plot") need a real answer
+        intent = matches[0] if len(matches) == 1 else None
+        route = "fast_path" if intent else "model"
+        with self._lock:
+            self._counts[route] += 1
+        ROUTED_QUERIES.inc(intent.name if intent else "model")
+        if intent:
+            log_message(f"Served intent '{intent.name}' for query: {query}")
+            return intent.answer
+        return None
+
+    def fallback_answer(self, query):
+        """Best curated answer for a query whose generated answer was unusable."""
+        matches = self.matches(query)
+        return matches[0].answer if matches else self.default_answer
+
+    def stats(self):
+        """Queries served by the fast path versus the model, and the fast-path fraction."""
+        with self._lock:
+            stats = dict(self._counts)
+        routed = stats["fast_path"] + stats["model"]
+        stats["fast_path_fraction"] = stats["fast_path"] / routed if routed else 0.0
+        return stats
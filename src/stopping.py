@@ -0,0 +1,84 @@
+import re
+import time
+import torch
+from transformers import StoppingCriteria
+
+# A fenced code block, then an explanation header with at least one comment line, then the
+# first character of whatever follows the explanation
+COMPLETE_ANSWER = re.compile(r"```python\n.*?\n```[ \t]*\n+#\s*Explanation:[^\n]*\n(?:#[^\n]*\n)+(?=[^#])", re.DOTALL | re.IGNORECASE)
+
+def is_valid_answer(text):
+    """Whether generated text is a usable answer: a pandas code block with no template placeholders."""
+    return "```python" in text and "pandas" in text.lower() and "[Insert" not in text
+
+def answer_end(text):
+    """Offset where a complete answer ends (code block plus explanation), or None if it is not complete."""
+    match = COMPLETE_ANSWER.search(text)
+    return match.end() if match else None
+
+def trim_answer(text):
+    """Drop anything generated after the end of a complete answer."""
+    end = answer_end(text)
+    return text[:end].rstrip() + "\n" if end is not None else text
+
+def hopeless_reason(text, generated_tokens, open_fence_within):
+    """Why a partial answer can no longer become valid, or None while it still can."""
+    if "[Insert" in text:
+        return "copied a template placeholder"
+    if "```python" not in text and generated_tokens >= open_fence_within:
+        return f"no code block within {open_fence_within} tokens"
+    return None
+
+class CodeAnswerCriteria(StoppingCriteria):
+    """Stops each sequence once its answer is complete, or aborts it once it is hopeless.
+
+    Only the tokens after `prompt_length` are inspected, every `check_every` new tokens.
+    After generate() returns, `status[i]` is "complete", "aborted" or "finished" (end of text
+    or the length limit), `reasons[i]` says why a sequence was aborted, and `stopped_at[i]`
+    is the time it stopped, so callers can account for the time spent on discarded decodes.
+    """
+
+    def __init__(self, tokenizer, prompt_length, batch_size, open_fence_within=48, check_every=4):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.open_fence_within = open_fence_within
+        self.check_every = check_every
+        self.status = ["running"] * batch_size
+        self.reasons = [None] * batch_size
+        self.stopped_at = [None] * batch_size
+        self.started = time.perf_counter()
+        self._last_checked = 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids.shape[1] - self.prompt_length
+        done = torch.tensor([status != "running" for status in self.status], device=input_ids.device)
+        if generated - self._last_checked < self.check_every:
+            return done
+        self._last_checked = generated
+        now = time.perf_counter()
+        for i, status in enumerate(self.status):
+            if status != "running":
+                continue
+            tokens = input_ids[i, self.prompt_length:]
+            if self.tokenizer.eos_token_id in tokens:
+                self.status[i], self.stopped_at[i] = "finished", now
+                continue
+            text = self.tokenizer.decode(tokens, skip_special_tokens=True)
+            if answer_end(text) is not None:
+                self.status[i], self.stopped_at[i] = "complete", now
+            else:
+                reason = hopeless_reason(text, generated, self.open_fence_within)
+                if reason:
+                    self.status[i], self.reasons[i], self.stopped_at[i] = "aborted", reason, now
+            done[i] = self.status[i] != "running"
+        return done
+
+    def finish(self):
+        """Mark sequences that ran to the end of generate() as finished."""
+        now = time.perf_counter()
+        for i, status in enumerate(self.status):
+            if status == "running":
+                self.status[i], self.stopped_at[i] = "finished", now
+
+    def decode_seconds(self, i):
+        return (self.stopped_at[i] or time.perf_counter()) - self.started
@@ -1,18 +1,53 @@
-from transformers import GPT2Tokenizer, GPT2LMHeadModel, Trainer, TrainingArguments
+from transformers import GPT2Tokenizer, GPT2LMHeadModel, Trainer, TrainingArguments, default_data_collator
+from transformers.trainer_utils import PREFIX_CHECKPOINT_DIR
+import contextlib
+import copy
+import functools
+import hashlib
+import json
+import shutil
+import time
+import numpy as np
 import torch
+from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data import Dataset
 import os
-from src.utils import load_text_file, extract_code_blocks, log_message
+from src.utils import find_code_blocks, load_chunks, load_config, load_text_file, log_message
 
 # Paths
 BOOK_TEXT_PATH = "data/processed/book_text.txt"
+CHUNKS_PATH = "data/processed/book_chunks.jsonl"
+TRAIN_CACHE_DIR = "data/processed/train_cache"
+
+# Bump when the layout of cached token arrays changes
+TOKEN_CACHE_VERSION = 3
 FINETUNED_MODEL_PATH = "models/finetuned/litcode_model_gpt2"
+# Content hashes of the examples the fine-tuned model was trained on. Kept next to the model
+# directory, not in it: the bot reloads the model whenever a file in that directory changes.
+MANIFEST_PATH = f"{FINETUNED_MODEL_PATH}.manifest.json"
+BASE_MODEL = "distilgpt2"  # Smaller model
+TRAINING_MODES = ("full", "incremental")
+
+def code_block_offsets(text, chunks_path=CHUNKS_PATH):
+    """(offset, code) of every code block, taken from the preprocessing chunk store when it matches the text."""
+    if os.path.exists(chunks_path):
+        records = list(load_chunks(chunks_path, "code"))
+        if all(text[record["start"]:record["end"]] == record["text"] for record in records):
+            return [(record["start"], record["text"]) for record in records]
+        log_message(f"Chunk store {chunks_path} does not match {BOOK_TEXT_PATH}; scanning for code blocks.", "warning")
+    return find_code_blocks(text)
 
 class BookCodeDataset(Dataset):
-    def __init__(self, text_file, tokenizer, max_length=256):
+    """Code examples from the book, tokenized once and cached on disk as token arrays.
+    
+    Every example ends with EOS. Items are unpadded; pair with pad_collate.
+    """
+    def __init__(self, text_file, tokenizer, max_length=256, cache_dir=TRAIN_CACHE_DIR, write_cache=True):
         self.tokenizer = tokenizer
         self.max_length = max_length
+        self.prompt_chars = []
         self.examples = self._prepare_examples(text_file)
+        self.input_ids, self.prompt_lengths = self._tokenize(cache_dir, write_cache)
     
     def _prepare_examples(self, text_file):
         text = load_text_file(text_file)
@@ -20,71 +55,411 @@ class BookCodeDataset(Dataset):
             log_message("No text loaded for training.", "error")
             return []
         
-        code_blocks = extract_code_blocks(text)
+        code_blocks = code_block_offsets(text)
         examples = []
-        for code in code_blocks:
-            start_idx = text.find(code)
+        for start_idx, code in code_blocks:
             context_start = max(0, start_idx - 200)
             context = text[context_start:start_idx].strip()
             prompt = f"Question: Generate Python code for a data science task.\nContext: {context}\nCode:\n{code}"
             examples.append(prompt)
+            self.prompt_chars.append(len(prompt) - len(code))  # Everything before the code itself
         
         log_message(f"Prepared {len(examples)} training examples from {len(code_blocks)} code blocks.")
         return examples
     
+    def _cache_key(self):
+        digest = hashlib.sha1()
+        tokenizer_id = [
+            TOKEN_CACHE_VERSION, type(self.tokenizer).__name__, self.tokenizer.name_or_path, len(self.tokenizer), self.max_length
+        ]
+        digest.update(json.dumps(tokenizer_id).encode("utf-8"))
+        for example in self.examples:
+            digest.update(example.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+    
+    def _tokenize(self, cache_dir, write_cache=True):
+        """Token id arrays and prompt token counts for every example, via the on-disk cache.
+        
+        With `write_cache` False (every process but the main one in distributed training)
+        a missing cache is tokenized in memory and not written.
+        """
+        if not self.examples:
+            return [], []
+        cache_path = os.path.join(cache_dir, f"{self._cache_key()}.npz")
+        if os.path.exists(cache_path):
+            cached = np.load(cache_path)
+            tokens, offsets, prompt_lengths = cached["tokens"], cached["offsets"], cached["prompt_lengths"]
+            log_message(f"Loaded {len(self.examples)} tokenized examples from {cache_path}")
+        else:
+            # One token short of max_length, leaving room for the EOS that ends every example
+            encodings = [
+                ids + [self.tokenizer.eos_token_id]
+                for ids in self.tokenizer(self.examples, max_length=self.max_length - 1, truncation=True)["input_ids"]
+            ]
+            prompts = [example[:chars] for example, chars in zip(self.examples, self.prompt_chars)]
+            prompt_encodings = self.tokenizer(prompts, max_length=self.max_length - 1, truncation=True)["input_ids"]
+            offsets = np.cumsum([0] + [len(ids) for ids in encodings])
+            tokens = np.fromiter((token for ids in encodings for token in ids), dtype=np.int32, count=int(offsets[-1]))
+            prompt_lengths = np.array([len(ids) for ids in prompt_encodings], dtype=np.int32)
+            if write_cache:
+                os.makedirs(cache_dir, exist_ok=True)
+                # Written to a temporary file first so a reader never loads a half-written cache
+                with open(f"{cache_path}.tmp", "wb") as f:
+                    np.savez(f, tokens=tokens, offsets=offsets, prompt_lengths=prompt_lengths)
+                os.replace(f"{cache_path}.tmp", cache_path)
+            log_message(f"Tokenized {len(self.examples)} examples ({offsets[-1]} tokens) into {cache_path if write_cache else 'memory'}")
+        return [tokens[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)], prompt_lengths
+    
+    def select(self, indices):
+        """A view of this dataset with only the examples at `indices`, sharing their token arrays."""
+        subset = copy.copy(self)
+        subset.examples = [self.examples[i] for i in indices]
+        subset.prompt_chars = [self.prompt_chars[i] for i in indices]
+        subset.input_ids = [self.input_ids[i] for i in indices]
+        subset.prompt_lengths = np.asarray(self.prompt_lengths)[list(indices)]
+        return subset
+    
+    @property
+    def num_tokens(self):
+        return sum(len(ids) for ids in self.input_ids)
+    
     def __len__(self):
         return len(self.examples)
     
     def __getitem__(self, idx):
-        example = self.examples[idx]
-        encoding = self.tokenizer(
-            example,
-            max_length=self.max_length,
-            truncation=True,
-            padding="max_length",
-            return_tensors="pt"
-        )
-        encoding["labels"] = encoding["input_ids"].clone()
-        return {key: val.squeeze(0) for key, val in encoding.items()}
+        input_ids = torch.from_numpy(self.input_ids[idx].astype(np.int64))
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+def pad_collate(features, pad_token_id):
+    """Pad a batch to its longest example, with padding masked out of the attention and labels.
+    
+    Padding is found by position, not by token id: GPT-2 pads with EOS, and the EOS that
+    ends every example must still be trained on.
+    """
+    input_ids = pad_sequence([f["input_ids"] for f in features], batch_first=True, padding_value=pad_token_id)
+    attention_mask = pad_sequence([f["attention_mask"] for f in features], batch_first=True, padding_value=0)
+    return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": input_ids.masked_fill(attention_mask == 0, -100)}
+
+class PackedBookCodeDataset(Dataset):
+    """Examples from a BookCodeDataset packed into fixed-size blocks separated by EOS.
+    
+    Examples are placed first-fit by decreasing length and never split across blocks; one
+    longer than a block is cut to fit and still ends with EOS.
+    Prompt tokens and padding get label -100, so only code and EOS tokens are trained on.
+    GPT-2 takes no per-example attention mask, so an example can attend to the examples
+    placed before it in its block; the EOS separator marks the boundary, and positions
+    run on through the block as they would for one long text.
+    """
+    def __init__(self, dataset, block_size=256):
+        self.block_size = block_size
+        self.eos_token_id = dataset.tokenizer.eos_token_id
+        self.num_examples = len(dataset)
+        self.padded_tokens = 0
+        self.blocks = self._pack(dataset)
+    
+    def _pack(self, dataset):
+        order = sorted(range(len(dataset)), key=lambda i: -len(dataset.input_ids[i]))
+        blocks, free = [], []
+        for i in order:
+            size = min(len(dataset.input_ids[i]), self.block_size)
+            for b, space in enumerate(free):
+                if space >= size:
+                    blocks[b].append(i)
+                    free[b] -= size
+                    break
+            else:
+                blocks.append([i])
+                free.append(self.block_size - size)
+        return [self._build_block(dataset, members) for members in blocks]
+    
+    def _build_block(self, dataset, members):
+        input_ids, labels = [], []
+        for i in members:
+            # The dataset's examples already end with the EOS separator
+            ids = dataset.input_ids[i].tolist()
+            if len(ids) > self.block_size:
+                ids = ids[:self.block_size - 1] + [self.eos_token_id]
+            prompt_length = min(int(dataset.prompt_lengths[i]), len(ids) - 1)
+            input_ids += ids
+            labels += [-100] * prompt_length + ids[prompt_length:]
+        used = len(input_ids)
+        pad = self.block_size - used
+        self.padded_tokens += pad
+        return {
+            "input_ids": torch.tensor(input_ids + [self.eos_token_id] * pad),
+            "attention_mask": torch.tensor([1] * used + [0] * pad),
+            "labels": torch.tensor(labels + [-100] * pad),
+        }
+    
+    @property
+    def num_tokens(self):
+        return len(self.blocks) * self.block_size - self.padded_tokens
+    
+    def __len__(self):
+        return len(self.blocks)
+    
+    def __getitem__(self, idx):
+        return self.blocks[idx]
+
+def packing_report(dataset, packed, batch_size):
+    """Packing efficiency and the reduction in tokens processed per epoch versus padding.
+    
+    Packing is compared against padding every example to max_length and against padding
+    each length-grouped batch to its longest example. These are token counts; for measured
+    epoch times see benchmarks/packing.py.
+    """
+    lengths = sorted((len(ids) for ids in dataset.input_ids), reverse=True)
+    padded_tokens = sum(
+        lengths[start] * len(lengths[start:start + batch_size]) for start in range(0, len(lengths), batch_size)
+    )
+    fixed_tokens = len(dataset) * dataset.max_length
+    packed_tokens = len(packed) * packed.block_size
+    return {
+        "examples": len(dataset),
+        "blocks": len(packed),
+        "packing_efficiency": packed.num_tokens / packed_tokens if packed_tokens else 0.0,
+        "fixed_padding_efficiency": dataset.num_tokens / fixed_tokens if fixed_tokens else 0.0,
+        "batch_padding_efficiency": dataset.num_tokens / padded_tokens if padded_tokens else 0.0,
+        "packed_tokens_per_epoch": packed_tokens,
+        "token_reduction_vs_fixed_padding": 1 - packed_tokens / fixed_tokens if fixed_tokens else 0.0,
+        "token_reduction_vs_batch_padding": 1 - packed_tokens / padded_tokens if padded_tokens else 0.0,
+    }
+
+def cpu_supports_bf16():
+    """True if the CPU has native bf16 instructions (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+def configure_cpu_threads(training_config):
+    """Apply intra-/inter-op thread settings, splitting cores between local DDP processes."""
+    local_processes = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+    threads = training_config.get("num_threads") or max(1, (os.cpu_count() or 1) // local_processes)
+    torch.set_num_threads(threads)
+    interop_threads = training_config.get("interop_threads")
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            # Only allowed before the first parallel op in the process
+            log_message(f"Could not set inter-op threads: {e}", "warning")
+    return threads
 
-def train_model():
-    tokenizer = GPT2Tokenizer.from_pretrained("distilgpt2")  # Smaller model
+def training_arguments(training_config, output_dir=FINETUNED_MODEL_PATH):
+    """TrainingArguments for the CPU performance profile in the `training` config section."""
+    bf16 = training_config.get("bf16", "auto")
+    if bf16 == "auto":
+        bf16 = cpu_supports_bf16()
+    distributed = int(os.environ.get("WORLD_SIZE", 1)) > 1
+    return TrainingArguments(
+        output_dir=output_dir,
+        num_train_epochs=training_config.get("epochs", 3),
+        per_device_train_batch_size=training_config.get("batch_size", 8),
+        gradient_accumulation_steps=training_config.get("gradient_accumulation_steps", 1),
+        save_steps=training_config.get("save_steps", 500),
+        save_total_limit=training_config.get("save_total_limit", 2),
+        logging_dir="./logs",
+        logging_steps=10,
+        learning_rate=float(training_config.get("learning_rate", 5e-5)),
+        # Batch similar lengths together so dynamic padding stays small; packed blocks are all full size
+        group_by_length=not training_config.get("packing", False),
+        use_cpu=True,
+        bf16=bool(bf16),  # CPU autocast to bfloat16
+        dataloader_num_workers=training_config.get("dataloader_workers", 0),
+        dataloader_persistent_workers=training_config.get("dataloader_workers", 0) > 0,
+        # Set when launched with torchrun; gloo is the CPU collective backend
+        ddp_backend="gloo" if distributed else None,
+    )
+
+def example_hash(example):
+    """Content hash identifying a training example in the manifest."""
+    return hashlib.sha1(example.encode("utf-8")).hexdigest()
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """The training manifest of the current fine-tuned model, or None if there is none."""
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    # Written to a temporary file first so an interrupted write never leaves a truncated manifest
+    with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+def new_examples(hashes, manifest):
+    """Indices of examples whose content the manifest's model was not trained on."""
+    known = set(manifest.get("examples", [])) if manifest else set()
+    return [i for i, digest in enumerate(hashes) if digest not in known]
+
+def _checkpoints(output_dir):
+    if not os.path.isdir(output_dir):
+        return []
+    return [
+        os.path.join(output_dir, name) for name in os.listdir(output_dir)
+        if name.startswith(f"{PREFIX_CHECKPOINT_DIR}-") and name.split("-")[-1].isdigit()
+    ]
+
+def resumable_checkpoint(run, manifest, output_dir=FINETUNED_MODEL_PATH):
+    """Latest checkpoint of an interrupted run that trained on the same examples, or None."""
+    pending = (manifest or {}).get("in_progress")
+    if not pending or pending != run:
+        return None
+    return max(_checkpoints(output_dir), key=lambda path: int(path.split("-")[-1]), default=None)
+
+def remove_checkpoints(output_dir=FINETUNED_MODEL_PATH):
+    """Delete checkpoints of earlier runs.
+    
+    Trainer keeps the highest-numbered checkpoints, so a finished run's would outrank (and
+    have it delete) the checkpoints of a new run, and a resume would pick up the wrong run.
+    """
+    for path in _checkpoints(output_dir):
+        shutil.rmtree(path)
+
+def checkpoint_epoch(checkpoint):
+    """Epochs already completed by a checkpoint's run."""
+    if not checkpoint:
+        return 0.0
+    with open(os.path.join(checkpoint, "trainer_state.json"), "r", encoding="utf-8") as f:
+        return json.load(f).get("epoch") or 0.0
+
+def checkpoint_loading():
+    """Context for resuming from our own checkpoints under torch's weights-only loading.
+    
+    torch >= 2.6 refuses to unpickle the numpy RNG state that Trainer saves in every checkpoint.
+    """
+    if not hasattr(torch.serialization, "safe_globals"):
+        return contextlib.nullcontext()
+    reconstruct = np.ndarray(0).__reduce__()[0]
+    return torch.serialization.safe_globals([reconstruct, np.ndarray, np.dtype, type(np.dtype(np.uint32))])
+
+def time_saved_report(mode, train_seconds, seconds_per_token, full_tokens):
+    """Wall-clock time of this run against an estimated full retrain at the same tokens/sec."""
+    full_seconds = full_tokens * seconds_per_token
+    return {
+        "mode": mode,
+        "train_seconds": round(train_seconds, 1),
+        "full_retrain_seconds": round(full_seconds, 1),
+        "seconds_saved": round(max(0.0, full_seconds - train_seconds), 1),
+    }
+
+def train_model(mode=None, resume=None):
+    """Fine-tune on the book's code examples and record them in the training manifest.
+    
+    `mode` "full" trains BASE_MODEL on every example; "incremental" continues the current
+    fine-tuned model on the examples that are new or changed since it was trained. With
+    `resume`, a run interrupted earlier continues from its latest checkpoint.
+    """
+    training_config = load_config().get("training", {})
+    mode = mode or training_config.get("mode", "full")
+    if mode not in TRAINING_MODES:
+        raise ValueError(f"Unknown training mode '{mode}'. Choose one of: {', '.join(TRAINING_MODES)}")
+    resume = training_config.get("resume", True) if resume is None else resume
+    manifest = load_manifest(MANIFEST_PATH)
+    if mode == "incremental" and not (manifest and "examples" in manifest and os.path.exists(os.path.join(FINETUNED_MODEL_PATH, "config.json"))):
+        log_message("No fine-tuned model with a training manifest to continue; running a full training.", "warning")
+        mode = "full"
+    base_model = FINETUNED_MODEL_PATH if mode == "incremental" else BASE_MODEL
+    
+    tokenizer = GPT2Tokenizer.from_pretrained(base_model)
     tokenizer.pad_token = tokenizer.eos_token
     try:
-        model = GPT2LMHeadModel.from_pretrained("distilgpt2", pad_token_id=tokenizer.eos_token_id)
+        model = GPT2LMHeadModel.from_pretrained(base_model, pad_token_id=tokenizer.eos_token_id)
     except Exception as e:
-        log_message(f"Failed to load DistilGPT-2 model: {e}", "error")
+        log_message(f"Failed to load {base_model} model: {e}", "error")
         return
     
-    dataset = BookCodeDataset(BOOK_TEXT_PATH, tokenizer)
+    threads = configure_cpu_threads(training_config)
+    training_args = training_arguments(training_config, FINETUNED_MODEL_PATH)
+    # The main process tokenizes and writes the cache; the others wait, then load it
+    with training_args.main_process_first(local=False, desc="tokenizing the training examples"):
+        dataset = BookCodeDataset(
+            BOOK_TEXT_PATH, tokenizer, cache_dir=TRAIN_CACHE_DIR, write_cache=training_args.process_index == 0
+        )
     if len(dataset) == 0:
         log_message("No training examples found. Check preprocessing.", "error")
         return
+    hashes = [example_hash(example) for example in dataset.examples]
+    full_tokens = dataset.num_tokens * training_config.get("epochs", 3)
     
-    training_args = TrainingArguments(
-        output_dir=FINETUNED_MODEL_PATH,
-        num_train_epochs=3,
-        per_device_train_batch_size=1,
-        gradient_accumulation_steps=4,  # Accumulate gradients over 4 steps
-        save_steps=50,
-        save_total_limit=2,
-        logging_dir="./logs",
-        logging_steps=10,
-        learning_rate=5e-5,
+    selected = list(range(len(dataset)))
+    if mode == "incremental":
+        selected = new_examples(hashes, manifest)
+        removed = len(set(manifest["examples"]) - set(hashes))
+        log_message(f"Incremental training: {len(selected)} new or changed examples of {len(dataset)} ({removed} removed since the last run)")
+        if not selected:
+            log_message("Fine-tuned model is up to date with the book; nothing to train.")
+            log_message(f"Training time report: {time_saved_report(mode, 0.0, manifest.get('seconds_per_token', 0.0), full_tokens)}")
+            return
+    train_source = dataset.select(selected) if mode == "incremental" else dataset
+    
+    log_message(
+        f"Training on {training_args.world_size} process(es) x {threads} threads, batch size "
+        f"{training_args.per_device_train_batch_size}, bf16={training_args.bf16}"
     )
     
+    if training_config.get("packing", False):
+        packed = PackedBookCodeDataset(train_source, training_config.get("block_size", dataset.max_length))
+        log_message(f"Packing report: {packing_report(train_source, packed, training_args.per_device_train_batch_size)}")
+        train_dataset, data_collator = packed, default_data_collator
+    else:
+        train_dataset, data_collator = train_source, functools.partial(pad_collate, pad_token_id=tokenizer.eos_token_id)
+    
+    run = {"mode": mode, "examples": sorted(hashes[i] for i in selected)}
+    checkpoint = resumable_checkpoint(run, manifest, FINETUNED_MODEL_PATH) if resume else None
+    if checkpoint:
+        log_message(f"Resuming interrupted {mode} training from {checkpoint}")
+    else:
+        # The other processes wait here until the main process has cleared the old checkpoints
+        with training_args.main_process_first(local=False, desc="removing old checkpoints"):
+            if training_args.process_index == 0:
+                remove_checkpoints(FINETUNED_MODEL_PATH)
+                # Marks the run as unfinished until its model is saved, so that it can be resumed
+                save_manifest(dict(manifest or {}, in_progress=run), MANIFEST_PATH)
+    
     trainer = Trainer(
         model=model,
         args=training_args,
-        train_dataset=dataset,
+        train_dataset=train_dataset,
+        data_collator=data_collator,
     )
     
+    # Read before training: the checkpoint may be rotated away during the run
+    resumed_epoch = checkpoint_epoch(checkpoint)
     log_message("Starting training...")
-    trainer.train()
+    with checkpoint_loading() if checkpoint else contextlib.nullcontext():
+        metrics = trainer.train(resume_from_checkpoint=checkpoint).metrics
+    # Non-padding tokens seen in this session across all processes (not before a resume)
+    epochs = metrics.get("epoch", training_args.num_train_epochs) - resumed_epoch
+    tokens = train_dataset.num_tokens * epochs
+    log_message(
+        f"Training throughput: {tokens / metrics['train_runtime']:.1f} tokens/sec "
+        f"({tokens:.0f} tokens in {metrics['train_runtime']:.1f}s)"
+    )
+    trained_tokens = train_source.num_tokens * epochs
+    seconds_per_token = metrics["train_runtime"] / trained_tokens if trained_tokens else manifest.get("seconds_per_token", 0.0)
+    # Every process holds the same weights after training; only the main process writes them
+    if not trainer.is_world_process_zero():
+        return
     
     model.save_pretrained(FINETUNED_MODEL_PATH)
     tokenizer.save_pretrained(FINETUNED_MODEL_PATH)
+    save_manifest({
+        "base_model": BASE_MODEL if mode == "full" else manifest.get("base_model", BASE_MODEL),
+        "mode": mode,
+        "examples": sorted(hashes),
+        "trained_examples": len(selected),
+        "seconds_per_token": seconds_per_token,
+        "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }, MANIFEST_PATH)
     log_message(f"Model fine-tuned and saved to {FINETUNED_MODEL_PATH}")
+    log_message(f"Training time report: {time_saved_report(mode, metrics['train_runtime'], seconds_per_token, full_tokens)}")
 
 if __name__ == "__main__":
     os.makedirs(FINETUNED_MODEL_PATH, exist_ok=True)
@@ -1,22 +1,176 @@
 import re
+import atexit
+import json
 import logging
+import multiprocessing
 import os
+import queue
+import random
+import yaml
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
-# Set up logging
-logging.basicConfig(
-    filename="litcodechat.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
-def log_message(message, level="info"):
-    """Log a message to the log file."""
-    if level == "info":
-        logging.info(message)
-    elif level == "error":
-        logging.error(message)
-    elif level == "warning":
-        logging.warning(message)
+# Paths
+CONFIG_PATH = "config/config.yaml"
+LOG_PATH = "litcodechat.log"
+
+class RotatingLogFileHandler(TimedRotatingFileHandler):
+    """Rotates the log file every `interval_hours` or when it would exceed `max_bytes`, whichever is first."""
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, interval_hours=24, backup_count=7):
+        # Second-resolution suffixes keep size-triggered rotations within one interval from colliding
+        super().__init__(filename, when="S", interval=int(interval_hours * 3600), backupCount=backup_count, encoding="utf-8", delay=True)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record):
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes:
+                return True
+        return super().shouldRollover(record)
+
+    def rotation_filename(self, default_name):
+        # Backups are named for the start of the interval, so size rotations within one
+        # interval get a numbered suffix instead of overwriting the previous backup
+        name, count = default_name, 0
+        while os.path.exists(name):
+            count += 1
+            name = f"{default_name}.{count:03d}"
+        return name
+
+def _extra_fields(record):
+    # log_message nests its fields under one attribute, so they can never clash with a LogRecord's own
+    return getattr(record, "fields", None) or {}
+
+class TextFormatter(logging.Formatter):
+    """The classic "time - LEVEL - message" line, with any log_message fields appended as JSON."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        return f"{line} {json.dumps(fields, default=str)}" if fields else line
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, thread, message and any log_message fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        for key, value in _extra_fields(record).items():
+            # A field named like one of the keys above is kept under a prefixed name
+            entry["fields." + key if key in entry else key] = value
+        return json.dumps(entry, default=str)
+
+class DebugSampler(logging.Filter):
+    """Keep only a random `rate` fraction of DEBUG records; other levels always pass."""
+
+    def __init__(self, rate=0.01):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+_log_listener = None
+
+def setup_logging(logging_config=None, log_path=LOG_PATH, log_queue=None):
+    """Route log records through an in-memory queue to a background thread that writes the file.
+    
+    Callers only pay for enqueuing a record; formatting, disk writes and rotation happen on
+    the listener thread. DEBUG records are sampled before they are queued. Pass a
+    multiprocessing queue as `log_queue` before forking workers so that their records are
+    written by this process's listener too.
+    """
+    global _log_listener
+    logging_config = logging_config or {}
+    if _log_listener is not None:
+        _log_listener.stop()
+    file_handler = RotatingLogFileHandler(
+        logging_config.get("path", log_path),
+        max_bytes=logging_config.get("max_bytes", 10 * 1024 * 1024),
+        interval_hours=logging_config.get("rotate_hours", 24),
+        backup_count=logging_config.get("backup_count", 7),
+    )
+    if logging_config.get("format", "json") == "json":
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(TextFormatter())
+    log_queue = log_queue if log_queue is not None else queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(logging_config.get("debug_sample_rate", 0.01)))
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(logging.DEBUG if logging_config.get("debug", False) else logging.INFO)
+    _log_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _log_listener.start()
+    return _log_listener
+
+def share_logging_with_children():
+    """Move the log queue to a multiprocessing queue, so that processes forked from here on
+    write their records through this process's listener; returns that queue.
+    
+    A process already logging through one (e.g. a webhook worker) keeps it.
+    """
+    global _log_listener
+    old_listener = _log_listener
+    if not isinstance(old_listener.queue, queue.SimpleQueue):
+        return old_listener.queue
+    log_queue = multiprocessing.get_context("fork").Queue()
+    # Listen on the new queue before switching to it; stopping the old listener drains what is left
+    _log_listener = QueueListener(log_queue, *old_listener.handlers, respect_handler_level=True)
+    _log_listener.start()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue = log_queue
+    old_listener.stop()
+    return log_queue
+
+def flush_logs():
+    """Write every queued record to disk (the listener keeps running)."""
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener.start()
+
+def _stop_logging():
+    if _log_listener is not None:
+        _log_listener.stop()
+
+atexit.register(_stop_logging)
+
+LOG_LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+def log_message(message, level="info", **fields):
+    """Log a message; extra keyword fields become keys of the JSON record."""
+    logging.log(LOG_LEVELS.get(level, logging.INFO), message, extra={"fields": fields} if fields else None)
+
+_config_cache = {}
+
+def load_config(config_path=CONFIG_PATH):
+    """Load the YAML config once per process, returning an empty dict if it is unavailable."""
+    if config_path not in _config_cache:
+        try:
+            with open(config_path, "r") as f:
+                _config_cache[config_path] = yaml.safe_load(f) or {}
+        except FileNotFoundError:
+            log_message(f"Config file not found at {config_path}. Using defaults.", "warning")
+            _config_cache[config_path] = {}
+        except yaml.YAMLError as e:
+            log_message(f"Invalid config file {config_path}: {e}. Using defaults.", "error")
+            _config_cache[config_path] = {}
+    return _config_cache[config_path]
+
+setup_logging(load_config().get("logging", {}))
 
 def load_text_file(file_path):
     """Load text from a file with error handling."""
@@ -26,7 +180,7 @@ def load_text_file(file_path):
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             text = f.read()
-        log_message(f"Loaded text from {file_path} (length: {len(text)} characters)")
+        log_message(f"Loaded text from {file_path} (length: {len(text)} characters)", "debug")
         return text
     except Exception as e:
         log_message(f"Error loading file {file_path}: {e}", "error")
@@ -44,12 +198,27 @@ def save_text_file(file_path, text):
         log_message(f"Error saving file {file_path}: {e}", "error")
         return False
 
+def load_chunks(file_path, chunk_type=None):
+    """Yield records from a JSONL chunk store, optionally only those of one type ("prose" or "code")."""
+    if not os.path.exists(file_path):
+        log_message(f"File not found: {file_path}", "error")
+        return
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if chunk_type is None or record["type"] == chunk_type:
+                yield record
+
 def extract_code_blocks(text):
     """Extract all Python code blocks from text."""
     code_pattern = r'```python\n(.*?)\n```'
     code_blocks = re.findall(code_pattern, text, re.DOTALL)
     return code_blocks
 
+def find_code_blocks(text):
+    """Return (offset, code) for every Python code block, in order of appearance."""
+    return [(match.start(1), match.group(1)) for match in re.finditer(r'```python\n(.*?)\n```', text, re.DOTALL)]
+
 def truncate_text(text, max_length=512):
     """Truncate text to a maximum length, preserving whole words."""
     if len(text) <= max_length:
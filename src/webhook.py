@@ -0,0 +1,179 @@
+import asyncio
+import gc
+import hmac
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import torch
+from telegram import Bot, Update
+from src.bot import TELEGRAM_TOKEN, build_application, get_executor, prewarm_enabled, prewarm_random_questions, validate_config
+from src.generation import warm_up
+from src.metrics import counter, start_metrics_server
+from src.utils import load_config, log_message, setup_logging
+
+WEBHOOK_UPDATES = counter("litcode_webhook_updates_total", "Webhook requests received, by result", ("result",))
+
+class UpdateServer(ThreadingHTTPServer):
+    """Accepts Telegram webhook POSTs on an already-listening socket and hands each update to `dispatch`.
+
+    Several worker processes can serve the same inherited socket; the kernel gives each
+    connection to one of them.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, sock, dispatch, path="/telegram", secret_token=None):
+        super().__init__(sock.getsockname()[:2], _UpdateHandler, bind_and_activate=False)
+        self.socket.close()
+        # Every worker is woken for each connection but only one accepts it; non-blocking
+        # accepts let the others go back to waiting instead of hanging in accept()
+        sock.setblocking(False)
+        self.socket = sock
+        self.dispatch = dispatch
+        self.webhook_path = path
+        self.secret_token = secret_token
+
+class _UpdateHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != self.server.webhook_path:
+            WEBHOOK_UPDATES.inc("not_found")
+            self.send_error(404)
+            return
+        # Telegram echoes the secret given to setWebhook so forged updates can be rejected
+        secret = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if self.server.secret_token and not hmac.compare_digest(secret, self.server.secret_token):
+            WEBHOOK_UPDATES.inc("forbidden")
+            self.send_error(403)
+            return
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except (ValueError, UnicodeDecodeError):
+            WEBHOOK_UPDATES.inc("bad_request")
+            self.send_error(400)
+            return
+        # Acknowledge at once: Telegram retries updates that are not answered promptly,
+        # and the reply is sent through the Bot API, not in this response
+        self.server.dispatch(data)
+        WEBHOOK_UPDATES.inc("accepted")
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass  # Every update is already traced by the bot
+
+async def _process_update(application, data):
+    try:
+        await application.process_update(Update.de_json(data, application.bot))
+    except Exception as e:
+        log_message(f"Failed to process webhook update {data.get('update_id')}: {e}", "error")
+
+async def serve_updates(sock, token, webhook_config, secret_token=None, prewarm=False):
+    """Answer the updates posted to `sock` until SIGTERM or SIGINT, in this process."""
+    application = build_application(token, webhook_config.get("api_base_url"))
+    await application.initialize()
+    if prewarm:
+        application.create_task(prewarm_random_questions())
+    loop = asyncio.get_running_loop()
+
+    def dispatch(data):
+        asyncio.run_coroutine_threadsafe(_process_update(application, data), loop)
+
+    server = UpdateServer(sock, dispatch, webhook_config.get("path", "/telegram"), secret_token)
+    threading.Thread(target=server.serve_forever, name="webhook-http", daemon=True).start()
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        server.shutdown()
+        await application.shutdown()
+        get_executor().shutdown(wait=False)
+
+def _worker_main(sock, worker_id, workers, token, webhook_config, secret_token):
+    # Split the cores between workers instead of every process using all of them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+    metrics_config = load_config().get("metrics", {})
+    if metrics_config.get("enabled", False):
+        # One endpoint per worker: base port + worker id
+        try:
+            start_metrics_server(metrics_config.get("port", 9108) + worker_id, metrics_config.get("host", "127.0.0.1"))
+        except OSError as e:
+            log_message(f"Webhook worker {worker_id} could not serve metrics: {e}", "warning")
+    log_message(f"Webhook worker {worker_id} serving in process {os.getpid()}")
+    # One worker pre-warms: the response cache's SQLite store is shared through the disk
+    asyncio.run(serve_updates(sock, token, webhook_config, secret_token, prewarm=worker_id == 0 and prewarm_enabled()))
+
+async def _register_webhook(token, url, secret_token, base_url=None):
+    kwargs = {"base_url": base_url} if base_url else {}
+    async with Bot(token, **kwargs) as bot:
+        await bot.set_webhook(url, secret_token=secret_token, allowed_updates=Update.ALL_TYPES)
+
+def run_webhook(token=TELEGRAM_TOKEN, workers=None, port=None, api_base_url=None):
+    """Serve the bot from Telegram webhooks with several pre-forked worker processes.
+
+    The model is loaded once here, before forking, so every worker shares the same
+    weight pages copy-on-write: inference only reads them, so memory does not grow with
+    the number of workers. Workers accept connections on one shared listening socket.
+    `api_base_url` points the bot at another Bot API server, e.g. benchmarks.fake_telegram.
+    """
+    if not token:
+        log_message("Telegram token not found in .env", "error")
+        return
+    validate_config(load_config())
+    webhook_config = dict(load_config().get("webhook", {}))
+    if api_base_url:
+        webhook_config["api_base_url"] = api_base_url
+    workers = workers or webhook_config.get("workers", 2)
+    port = webhook_config.get("port", 8443) if port is None else port
+    secret_token = os.getenv(webhook_config.get("secret_token_env_var", "TELEGRAM_WEBHOOK_SECRET")) or None
+
+    context = multiprocessing.get_context("fork")
+    # Workers inherit a queue to this process's log writer instead of each writing the file
+    setup_logging(load_config().get("logging", {}), log_queue=context.Queue())
+    stats = warm_up()
+    log_message(f"Model loaded once for {workers} webhook workers: {stats}")
+    # Move every object loaded so far out of the garbage collector's reach, so that
+    # collections in the workers do not write to (and so copy) the shared pages
+    gc.freeze()
+
+    sock = socket.create_server((webhook_config.get("host", "0.0.0.0"), port), backlog=128)
+    port = sock.getsockname()[1]
+    if webhook_config.get("url"):
+        url = webhook_config["url"].rstrip("/") + webhook_config.get("path", "/telegram")
+        asyncio.run(_register_webhook(token, url, secret_token, webhook_config.get("api_base_url")))
+        log_message(f"Registered webhook {url}")
+
+    processes = [
+        context.Process(
+            target=_worker_main,
+            args=(sock, worker_id, workers, token, webhook_config, secret_token),
+            name=f"webhook-worker-{worker_id}",
+        )
+        for worker_id in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    sock.close()
+    log_message(f"Webhook server listening on port {port} with {workers} workers")
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
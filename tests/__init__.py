@@ -0,0 +1,14 @@
+"""Test suite. Logs go to a temporary file instead of the bot's litcodechat.log."""
+import atexit
+import os
+import shutil
+import tempfile
+
+LOG_DIR = tempfile.mkdtemp(prefix="litcodechat-tests-")
+LOG_PATH = os.path.join(LOG_DIR, "litcodechat.log")
+# Registered before src.utils registers its own exit hook, so it runs after the last record is written
+atexit.register(shutil.rmtree, LOG_DIR, ignore_errors=True)
+
+from src import utils  # noqa: E402
+
+utils.setup_logging(dict(utils.load_config().get("logging", {}), path=LOG_PATH))
@@ -0,0 +1,52 @@
+import unittest
+import importlib.util
+import os
+import tempfile
+import torch
+from benchmarks.tiny_model import build_tiny_model
+from src.backends import check_parity, export_onnx, load_model
+
+TEXT = "import pandas as pd\ndf = pd.DataFrame({'A': [1, 2, 3]})\nprint(df.head())\n" * 20
+PROMPTS = ["import pandas as pd\n", "df = pd.", "print(df"]
+
+class TestBackends(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        text_path = os.path.join(cls.tmp.name, "book_text.txt")
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(TEXT)
+        torch.manual_seed(0)
+        cls.model_path = build_tiny_model(os.path.join(cls.tmp.name, "model"), text_path, vocab_size=300)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_int8_parity(self):
+        """Test that the int8 backend is quantized and decodes greedily like the eager model."""
+        model = load_model(self.model_path, "int8")
+        quantized = [module for module in model.transformer.modules() if isinstance(module, torch.ao.nn.quantized.dynamic.Linear)]
+        self.assertTrue(quantized)
+        report = check_parity(self.model_path, "int8", PROMPTS, max_new_tokens=16)
+        self.assertEqual(report["prompts"], len(PROMPTS))
+        self.assertGreaterEqual(report["token_agreement"], 0.9)
+
+    @unittest.skipUnless(importlib.util.find_spec("optimum"), "optimum is not installed")
+    def test_onnx_export_follows_the_checkpoint(self):
+        """Test that an ONNX export is keyed on the checkpoint, so a changed checkpoint is exported again."""
+        onnx_path = os.path.join(self.tmp.name, "onnx")
+        first = export_onnx(self.model_path, onnx_path)
+        self.assertEqual(os.path.dirname(first), onnx_path)
+        load_model(self.model_path, "onnx", onnx_path)
+        self.assertEqual(os.listdir(onnx_path), [os.path.basename(first)])
+        # Retraining rewrites the checkpoint; the next load exports it again and drops the old export
+        model_file = os.path.join(self.model_path, "config.json")
+        os.utime(model_file, ns=(0, os.stat(model_file).st_mtime_ns + 1))
+        load_model(self.model_path, "onnx", onnx_path)
+        exports = os.listdir(onnx_path)
+        self.assertEqual(len(exports), 1)
+        self.assertNotEqual(exports[0], os.path.basename(first))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from src.batching import BatchScheduler
+
+class TestBatchScheduler(unittest.TestCase):
+    def test_concurrent_prompts_share_a_batch(self):
+        """Test that prompts arriving together are generated in one call and routed back."""
+        calls = []
+
+        def generate_batch(prompts, max_length):
+            calls.append(list(prompts))
+            return [prompt.upper() for prompt in prompts]
+
+        scheduler = BatchScheduler(generate_batch, max_batch_size=4, max_wait_ms=200)
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(scheduler.generate, ["a", "b", "c", "d"]))
+        self.assertEqual(results, ["A", "B", "C", "D"])
+        self.assertLess(len(calls), 4)
+        self.assertEqual(scheduler.stats()["requests"], 4)
+
+    def test_errors_propagate_to_callers(self):
+        """Test that a failed batch raises in every waiting caller."""
+        def generate_batch(prompts, max_length):
+            raise RuntimeError("out of memory")
+
+        scheduler = BatchScheduler(generate_batch, max_wait_ms=1)
+        with self.assertRaises(RuntimeError):
+            scheduler.generate("a")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,11 @@
 import unittest
+import asyncio
+import time
+from types import SimpleNamespace
 from telegram import Update, Message, Chat, User
+from telegram.error import RetryAfter, TimedOut
 from telegram.ext import CallbackContext
-from src.bot import start, handle_message
+from src.bot import get_executor, start, handle_message, stream_answer, validate_config
 from unittest.mock import Mock, patch
 
 class TestBot(unittest.TestCase):
@@ -69,5 +73,87 @@ class TestBot(unittest.TestCase):
         self.assertIn("From the book", first_chunk)
         self.assertTrue(len(first_chunk) <= 4096)
 
+SNAPSHOTS = ["```python", "```python\nimport pandas", "```python\nimport pandas as pd", "```python\nimport pandas as pd\n```"]
+
+class FakeMessage:
+    """A sent Telegram message recording its edits; `errors` are raised by successive edits (None succeeds)."""
+
+    def __init__(self, errors=()):
+        self.edits = []
+        self.errors = list(errors)
+
+    async def edit_text(self, text):
+        self.edits.append(text)
+        error = self.errors.pop(0) if self.errors else None
+        if error:
+            raise error
+
+class ThreadExecutor:
+    """Runs inference in a thread, as InferenceExecutor does, without a queue or timeout."""
+
+    async def run(self, fn, *args):
+        return await asyncio.to_thread(fn, *args)
+
+class TestStreamAnswer(unittest.IsolatedAsyncioTestCase):
+    async def stream(self, message, edit_interval=0.05, delay=0.03):
+        def snapshots(query):
+            for snapshot in SNAPSHOTS:
+                time.sleep(delay)
+                yield snapshot
+
+        replies = []
+
+        async def reply_text(text):
+            replies.append(text)
+            return message
+
+        update = SimpleNamespace(message=SimpleNamespace(reply_text=reply_text))
+        with patch("src.bot.stream_code_solution", snapshots), patch("src.bot.get_executor", return_value=ThreadExecutor()):
+            outcome = await stream_answer(update, "How do I import pandas?", edit_interval)
+        return outcome, replies
+
+    async def test_edits_are_throttled_and_end_on_the_final_text(self):
+        """Test that the reply is edited at most once per interval and always ends on the full answer."""
+        message = FakeMessage()
+        outcome, replies = await self.stream(message, edit_interval=0.07)
+        self.assertEqual(outcome, "ok")
+        self.assertEqual(replies, ["Working on it..."])
+        self.assertLess(len(message.edits), len(SNAPSHOTS))
+        self.assertEqual(message.edits[-1], SNAPSHOTS[-1])
+
+    async def test_flood_control_pauses_edits_and_final_text_waits_it_out(self):
+        """Test that RetryAfter skips intermediate edits and the final edit is retried after the wait."""
+        message = FakeMessage([RetryAfter(10), RetryAfter(0.01)])
+        outcome, replies = await self.stream(message, edit_interval=0.0)
+        self.assertEqual(outcome, "ok")
+        # One intermediate edit hits flood control, then only the final edit and its retry
+        self.assertEqual(message.edits, [SNAPSHOTS[0], SNAPSHOTS[-1], SNAPSHOTS[-1]])
+        self.assertEqual(replies, ["Working on it..."])
+
+    async def test_timed_out_final_edit_is_sent_as_a_new_message(self):
+        """Test that when every edit times out, the final text still reaches the chat as a new message."""
+        message = FakeMessage([TimedOut()] * 10)
+        outcome, replies = await self.stream(message, edit_interval=0.0)
+        self.assertEqual(outcome, "ok")
+        self.assertEqual(replies, ["Working on it...", SNAPSHOTS[-1]])
+
+class TestValidateConfig(unittest.TestCase):
+    def test_streaming_needs_a_thread_pool(self):
+        """Test that streaming with a process pool is refused, before any executor is created."""
+        config = {"inference": {"pool": "process"}, "streaming": {"enabled": True}}
+        with self.assertRaises(ValueError):
+            validate_config(config)
+        with patch("src.bot._executor", None), patch("src.bot.load_config", return_value=config), \
+             patch("src.bot.InferenceExecutor") as executor:
+            with self.assertRaises(ValueError):
+                get_executor()
+            executor.from_config.assert_not_called()
+
+    def test_supported_combinations(self):
+        """Test that streaming on a thread pool, and a process pool without streaming, are accepted."""
+        validate_config({"streaming": {"enabled": True}})
+        validate_config({"inference": {"pool": "thread"}, "streaming": {"enabled": True}})
+        validate_config({"inference": {"pool": "process"}, "streaming": {"enabled": False}})
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
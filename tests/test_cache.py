@@ -0,0 +1,51 @@
+import unittest
+import os
+import tempfile
+import time
+from src.cache import ResponseCache, make_key, normalize_query
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "responses.sqlite3")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_normalized_queries_share_key(self):
+        """Test that case, spacing and trailing punctuation do not change the key."""
+        self.assertEqual(normalize_query("  How do I  plot NumPy data? "), "how do i plot numpy data")
+        self.assertEqual(make_key("How do I plot?", "ctx"), make_key("how do i   plot", "ctx"))
+        self.assertNotEqual(make_key("how do i plot", "ctx"), make_key("how do i plot", "other ctx"))
+        self.assertNotEqual(make_key("how do i plot", "ctx", "model-a"), make_key("how do i plot", "ctx", "model-b"))
+
+    def test_lru_eviction_and_counters(self):
+        """Test that the least recently used entry is evicted and lookups are counted."""
+        cache = ResponseCache(max_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        self.assertEqual(cache.get("a"), "1")
+        cache.set("c", "3")
+        self.assertIsNone(cache.get("b"))
+        stats = cache.stats()
+        self.assertEqual(stats["memory_hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_ttl_expiry(self):
+        """Test that expired entries are not served."""
+        cache = ResponseCache(ttl_seconds=0.01)
+        cache.set("a", "1")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+
+    def test_disk_store_survives_restart(self):
+        """Test that a new cache instance reads entries persisted by a previous one."""
+        ResponseCache(db_path=self.db_path).set("a", "1")
+        cache = ResponseCache(db_path=self.db_path)
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.stats()["memory_hits"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
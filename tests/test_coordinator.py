@@ -0,0 +1,146 @@
+import unittest
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+from src import bot
+from src.coordinator import SUPERSEDED, RequestCoordinator, TokenBucket
+from src.executor import InferenceExecutor
+
+def fake_update(chat_id, replies):
+    async def reply_text(text):
+        replies.append((chat_id, text))
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), message=SimpleNamespace(reply_text=reply_text))
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_refill(self):
+        """Test that a bucket allows a burst, then one request per refill interval."""
+        bucket = TokenBucket(capacity=2, rate=1.0, now=0.0)
+        self.assertTrue(bucket.take(now=0.0))
+        self.assertTrue(bucket.take(now=0.0))
+        self.assertFalse(bucket.take(now=0.5))
+        self.assertTrue(bucket.take(now=1.0))
+
+class TestRequestCoordinator(unittest.IsolatedAsyncioTestCase):
+    async def test_identical_queries_share_one_run(self):
+        """Test that concurrent identical keys start one run and every caller gets its result."""
+        coordinator = RequestCoordinator()
+        starts = []
+        release = asyncio.Event()
+
+        async def start():
+            starts.append(1)
+            await release.wait()
+            return "answer"
+
+        waiters = [asyncio.ensure_future(coordinator.coalesce("q", start)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await asyncio.gather(*waiters), ["answer"] * 3)
+        self.assertEqual(len(starts), 1)
+        self.assertEqual(coordinator.stats()["coalesced"], 2)
+        self.assertEqual(coordinator.stats()["in_flight"], 0)
+
+    async def test_run_survives_until_last_waiter_cancels(self):
+        """Test that cancelling one waiter keeps the shared run going for the others."""
+        coordinator = RequestCoordinator()
+        started = asyncio.Event()
+
+        async def start():
+            started.set()
+            await asyncio.sleep(10)
+
+        first = asyncio.ensure_future(coordinator.coalesce("q", start))
+        second = asyncio.ensure_future(coordinator.coalesce("q", start))
+        await started.wait()
+        run = coordinator._inflight["q"][0]
+        first.cancel()
+        await asyncio.sleep(0)
+        self.assertFalse(run.cancelled())
+        second.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await run
+        self.assertNotIn("q", coordinator._inflight)
+
+    async def test_newer_query_supersedes_pending_one(self):
+        """Test that a chat's newer request cancels its older pending run without cancelling the caller."""
+        coordinator = RequestCoordinator()
+        entered = asyncio.Event()
+
+        async def run(wait):
+            entered.set()
+            await asyncio.sleep(wait)
+            return "done"
+
+        older = asyncio.ensure_future(coordinator.latest(7, lambda: run(10)))
+        await entered.wait()
+        self.assertEqual(await coordinator.latest(7, lambda: run(0)), "done")
+        self.assertIs(await older, SUPERSEDED)
+        self.assertEqual(coordinator.stats()["superseded"], 1)
+        self.assertEqual(coordinator._pending, {})
+
+    async def test_cancelled_caller_is_not_superseded(self):
+        """Test that cancelling the caller itself still raises CancelledError."""
+        coordinator = RequestCoordinator()
+        started = asyncio.Event()
+
+        async def run():
+            started.set()
+            await asyncio.sleep(10)
+
+        caller = asyncio.ensure_future(coordinator.latest(7, run))
+        await started.wait()
+        caller.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await caller
+
+    def test_rate_limit_warns_once(self):
+        """Test that a flooding chat is rate limited and warned only once."""
+        coordinator = RequestCoordinator(burst=1, per_minute=0.001)
+        self.assertTrue(coordinator.admit(1))
+        self.assertFalse(coordinator.admit(1))
+        self.assertTrue(coordinator.should_warn(1))
+        self.assertFalse(coordinator.admit(1))
+        self.assertFalse(coordinator.should_warn(1))
+        self.assertTrue(coordinator.admit(2))
+        self.assertEqual(coordinator.stats()["rate_limited"], 2)
+
+    def test_evicted_chats_are_forgotten(self):
+        """Test that evicting a chat's bucket also drops its rate-limit warning state."""
+        coordinator = RequestCoordinator(burst=1, per_minute=0.001, max_chats=2)
+        coordinator.admit(1)
+        coordinator.admit(1)
+        coordinator.should_warn(1)
+        coordinator.admit(2)
+        coordinator.admit(3)
+        self.assertNotIn(1, coordinator._buckets)
+        self.assertNotIn(1, coordinator._warned)
+
+class TestAnswerQueryCoordination(unittest.IsolatedAsyncioTestCase):
+    async def test_popular_question_is_generated_once(self):
+        """Test that the same question from several chats at once runs one generation."""
+        calls = []
+        lock = threading.Lock()
+
+        def generate(query):
+            with lock:
+                calls.append(query)
+            time.sleep(0.2)
+            return f"answer to {query}"
+
+        replies = []
+        executor = InferenceExecutor(workers=2)
+        with mock.patch.object(bot, "generate_code_solution", generate), \
+                mock.patch.object(bot, "get_executor", return_value=executor), \
+                mock.patch.object(bot, "_coordinator", RequestCoordinator()):
+            await asyncio.gather(*(
+                bot.answer_query(fake_update(chat_id, replies), question)
+                for chat_id, question in enumerate(["How do I plot NumPy data?", "how do i plot numpy data", "How do I plot NumPy data?"])
+            ))
+        executor.shutdown()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(chat_id for chat_id, _ in replies), [0, 1, 2])
+
+if __name__ == "__main__":
+    unittest.main()
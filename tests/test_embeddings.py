@@ -0,0 +1,144 @@
+import unittest
+import json
+import os
+import tempfile
+import numpy as np
+from types import SimpleNamespace
+from unittest import mock
+from src import embeddings
+from src.embeddings import RRF_K, DenseIndex, embedding_params, reciprocal_rank_fusion
+
+class FakeEmbedder:
+    """Embeds each known text as a fixed unit vector."""
+
+    model_name = "fake-encoder"
+    max_length = 128
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.model = SimpleNamespace(config=SimpleNamespace(hidden_size=2))
+
+    def embed(self, texts, batch_size=32):
+        return np.array([self.vectors[text] for text in texts], dtype=np.float32)
+
+EMBEDDER = FakeEmbedder({
+    "pandas": [1.0, 0.0],
+    "plots": [0.0, 1.0],
+    "pandas plots": [0.6, 0.8],
+})
+
+class TestDenseIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.embeddings_path = os.path.join(self.tmp.name, "book_embeddings.npy")
+        self.meta_path = os.path.join(self.tmp.name, "book_embeddings.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_index(self, vectors, chunk_ids, source_sha1="abc", params=None):
+        vectors = np.array(vectors, dtype=np.float16)
+        np.save(self.embeddings_path, vectors)
+        meta = {
+            "dim": vectors.shape[1],
+            "count": vectors.shape[0],
+            "source_sha1": source_sha1,
+            "params": params or embedding_params(EMBEDDER.model_name, EMBEDDER.max_length),
+            "chunks": [{"row": row, "chunk_id": chunk_id} for row, chunk_id in enumerate(chunk_ids)],
+        }
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def load(self, source_sha1="abc"):
+        return DenseIndex.load(self.embeddings_path, self.meta_path, EMBEDDER, source_sha1)
+
+    def test_search_ranks_by_cosine_score(self):
+        """Test that search returns the best-scoring chunk ids first, with their scores."""
+        self.write_index([[1.0, 0.0], [0.0, 1.0], [0.6, 0.8]], [10, 11, 12])
+        results = self.load().search("pandas plots", top_k=2)
+        self.assertEqual([chunk_id for _, chunk_id in results], [12, 11])
+        self.assertAlmostEqual(results[0][0], 1.0, places=2)
+        self.assertAlmostEqual(results[1][0], 0.8, places=2)
+        self.assertEqual(len(self.load().search("pandas", top_k=10)), 3)
+
+    def test_search_scores_in_blocks(self):
+        """Test that scoring the vectors a few rows at a time ranks and scores them as one product does."""
+        vectors = np.random.default_rng(0).standard_normal((11, 2))
+        self.write_index(vectors / np.linalg.norm(vectors, axis=1, keepdims=True), list(range(100, 111)))
+        expected = self.load().search("pandas plots", top_k=11)
+        with mock.patch.object(embeddings, "SEARCH_BLOCK_ROWS", 4):
+            self.assertEqual(self.load().search("pandas plots", top_k=11), expected)
+
+    def build(self, chunks, embedder=EMBEDDER):
+        index = SimpleNamespace(chunks=chunks, source={"sha1": "abc"})
+        with mock.patch.object(embeddings, "get_index", return_value=index):
+            return embeddings.build_embeddings(self.embeddings_path, self.meta_path, embedder=embedder)
+
+    def test_build_replaces_the_index_atomically(self):
+        """Test that a build leaves only the finished files, and a failed build keeps the previous index."""
+        self.build(["pandas", "plots"])
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["book_embeddings.json", "book_embeddings.npy"])
+        self.assertEqual([chunk_id for _, chunk_id in self.load().search("plots", top_k=1)], [1])
+        with self.assertRaises(KeyError):
+            self.build(["pandas", "plots", "unknown"])
+        self.assertEqual(len(self.load().search("plots", top_k=10)), 2)
+
+    def test_vectors_must_match_their_meta(self):
+        """Test that vectors of another build than their meta describes are refused."""
+        self.write_index([[1.0, 0.0], [0.0, 1.0]], [0, 1])
+        np.save(self.embeddings_path, np.zeros((3, 2), dtype=np.float16))
+        self.assertIsNone(self.load())
+
+    def test_empty_index(self):
+        """Test that an index without chunks finds nothing."""
+        self.write_index(np.zeros((0, 2)), [])
+        self.assertEqual(self.load().search("pandas"), [])
+
+    def test_stale_index_is_refused(self):
+        """Test that vectors of other book text, chunking or encoder settings are not used."""
+        self.write_index([[1.0, 0.0]], [0])
+        self.assertIsNone(self.load(source_sha1="def"))
+        for change in [{"chunk_lines": 20}, {"model": "other-encoder"}, {"max_length": 512}]:
+            params = dict(embedding_params(EMBEDDER.model_name, EMBEDDER.max_length), **change)
+            self.write_index([[1.0, 0.0]], [0], params=params)
+            self.assertIsNone(self.load(), change)
+
+    def test_missing_index_is_not_retried_on_every_query(self):
+        """Test that a missing index is loaded and warned about once until its files appear."""
+        with mock.patch.object(embeddings, "EMBEDDINGS_PATH", self.embeddings_path), \
+             mock.patch.object(embeddings, "EMBEDDINGS_META_PATH", self.meta_path), \
+             mock.patch.object(embeddings, "_dense_index", None), \
+             mock.patch.object(embeddings, "embedder_settings", return_value=(EMBEDDER.model_name, EMBEDDER.max_length)), \
+             mock.patch.object(embeddings, "load_embedder", return_value=EMBEDDER), \
+             mock.patch.object(embeddings, "log_message") as log:
+            self.assertIsNone(embeddings.get_dense_index("abc"))
+            self.assertIsNone(embeddings.get_dense_index("abc"))
+            self.assertEqual(log.call_count, 1)
+            self.write_index([[1.0, 0.0]], [0])
+            index = embeddings.get_dense_index("abc")
+            self.assertIsNotNone(index)
+            self.assertIs(embeddings.get_dense_index("abc"), index)
+            # A rebuilt book makes the vectors stale; that too is reported once
+            self.assertIsNone(embeddings.get_dense_index("def"))
+            self.assertIsNone(embeddings.get_dense_index("def"))
+            self.assertEqual(log.call_count, 2)
+
+class TestReciprocalRankFusion(unittest.TestCase):
+    def test_fusion_rewards_agreement(self):
+        """Test that chunks ranked by both retrievers outrank chunks ranked highly by one."""
+        lexical = [(9.0, 1), (5.0, 2), (1.0, 3)]
+        dense = [(0.9, 2), (0.8, 4), (0.7, 1)]
+        fused = reciprocal_rank_fusion(lexical, dense, top_k=4)
+        self.assertEqual([chunk_id for _, chunk_id in fused], [2, 1, 4, 3])
+        self.assertAlmostEqual(fused[0][0], 1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+        self.assertEqual(len(reciprocal_rank_fusion(lexical, dense)), 3)
+
+    def test_fusion_ignores_scores(self):
+        """Test that only ranks matter, so retrievers with different score scales fuse fairly."""
+        self.assertEqual(
+            reciprocal_rank_fusion([(100.0, 1), (99.0, 2)]),
+            reciprocal_rank_fusion([(0.2, 1), (0.1, 2)]),
+        )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import asyncio
+import os
+import threading
+from src import utils
+from src.executor import ExecutorBusy, InferenceExecutor
+from tests import LOG_PATH
+
+def log_from_worker(message):
+    utils.log_message(message)
+    return os.getpid()
+
+class TestInferenceExecutor(unittest.TestCase):
+    def test_runs_off_event_loop(self):
+        """Test that work runs on a pool thread and its result is returned."""
+        executor = InferenceExecutor(workers=1, max_queue=2, timeout=5)
+        loop_thread = threading.get_ident()
+        result = asyncio.run(executor.run(threading.get_ident))
+        self.assertNotEqual(result, loop_thread)
+        self.assertEqual(executor.stats()["completed"], 1)
+        executor.shutdown()
+
+    def test_rejects_when_queue_full(self):
+        """Test that requests beyond max_queue are shed with ExecutorBusy."""
+        executor = InferenceExecutor(workers=1, max_queue=1, timeout=5)
+        release = threading.Event()
+
+        async def scenario():
+            first = asyncio.ensure_future(executor.run(release.wait))
+            await asyncio.sleep(0.05)
+            with self.assertRaises(ExecutorBusy):
+                await executor.run(release.wait)
+            release.set()
+            return await first
+
+        self.assertTrue(asyncio.run(scenario()))
+        self.assertEqual(executor.stats()["rejected"], 1)
+        executor.shutdown()
+
+    def test_timeout(self):
+        """Test that slow requests time out without blocking the caller."""
+        executor = InferenceExecutor(workers=1, max_queue=2, timeout=0.05)
+        release = threading.Event()
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(executor.run(release.wait))
+        release.set()
+        executor.shutdown()
+        self.assertEqual(executor.stats()["timeouts"], 1)
+
+    def test_process_workers_log_to_the_parent(self):
+        """Test that records logged in process pool workers are written to the parent's log file."""
+        self.addCleanup(utils.setup_logging, dict(utils.load_config().get("logging", {}), path=LOG_PATH))
+        executor = InferenceExecutor(pool="process", workers=1, max_queue=2, timeout=30)
+        message = f"logged from a worker of {os.getpid()}"
+        self.assertNotEqual(asyncio.run(executor.run(log_from_worker, message)), os.getpid())
+        executor.shutdown()
+        utils.flush_logs()
+        with open(LOG_PATH, "r", encoding="utf-8") as f:
+            self.assertIn(message, f.read())
+
+if __name__ == "__main__":
+    unittest.main()
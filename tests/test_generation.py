@@ -0,0 +1,140 @@
+import unittest
+import os
+import tempfile
+import torch
+from unittest import mock
+from benchmarks.tiny_model import build_draft_model, build_tiny_model
+from src import generation
+from src.cache import ResponseCache
+from src.generation import PROMPT_PREFIX, CodeGenerator, generate_code_solution, get_scheduler
+
+TEXT = "import pandas as pd\ndf = pd.DataFrame({'A': [1, 2, 3]})\nprint(df.head())\n" * 20
+
+class TestAssistedDecoding(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        text_path = os.path.join(cls.tmp.name, "book_text.txt")
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(TEXT)
+        cls.model_path = build_tiny_model(os.path.join(cls.tmp.name, "main"), text_path, vocab_size=300, n_layer=6)
+        cls.draft_path = build_draft_model(cls.model_path, os.path.join(cls.tmp.name, "draft"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.generator = CodeGenerator(self.model_path, fallback=False)
+
+    def test_assistant_kwargs(self):
+        """Test that the draft model is passed to generate() only for a batch of one."""
+        self.assertEqual(self.generator._assistant_kwargs(1), {})
+        self.assertTrue(self.generator.set_assistant(self.draft_path, 3))
+        self.assertEqual(self.generator._assistant_kwargs(1), {"assistant_model": self.generator._assistant})
+        self.assertEqual(self.generator._assistant_kwargs(2), {})
+        self.assertEqual(self.generator._assistant.generation_config.num_assistant_tokens, 3)
+        self.assertTrue(self.generator.model_source.endswith(f"+ draft {self.draft_path}"))
+
+    def test_draft_must_be_smaller(self):
+        """Test that a draft model as large as the main model is refused."""
+        self.assertFalse(self.generator.set_assistant(self.model_path))
+        self.assertEqual(self.generator._assistant_kwargs(1), {})
+
+    def test_encode_skips_prefix_cache_for_assisted_prompts(self):
+        """Test that assisted single prompts are encoded in full while batches still reuse the prefix cache."""
+        self.generator.set_prompt_prefix(PROMPT_PREFIX)
+        self.generator.set_assistant(self.draft_path)
+        prompt = PROMPT_PREFIX + "Question: How do I filter a DataFrame?\nAnswer:\n"
+        inputs, extra = self.generator._encode([prompt])
+        self.assertEqual(extra, {})
+        self.assertEqual(inputs["input_ids"][0].tolist(), self.generator.tokenizer(prompt)["input_ids"])
+        _, extra = self.generator._encode([prompt, prompt])
+        self.assertIn("past_key_values", extra)
+
+class TestPrefixCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        text_path = os.path.join(cls.tmp.name, "book_text.txt")
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write(TEXT + PROMPT_PREFIX)
+        torch.manual_seed(0)
+        cls.model_path = build_tiny_model(os.path.join(cls.tmp.name, "model"), text_path, vocab_size=300)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def greedy(self, generator, prompts):
+        inputs, extra = generator._encode(prompts)
+        with torch.no_grad():
+            outputs = generator.model.generate(
+                inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                max_new_tokens=12,
+                do_sample=False,
+                pad_token_id=generator.tokenizer.eos_token_id,
+                output_scores=True,
+                return_dict_in_generate=True,
+                **extra
+            )
+        return extra, outputs.sequences[:, inputs["input_ids"].shape[1]:].tolist(), torch.stack(outputs.scores)
+
+    def test_prefix_cached_generation_matches_full_encode(self):
+        """Test that greedy decoding from the cached prefix gives the same tokens as encoding whole prompts."""
+        prompts = [
+            PROMPT_PREFIX + "Question: How do I filter a DataFrame?\nAnswer:\n",
+            PROMPT_PREFIX + "Question: How do I plot?\nAnswer:\n",
+        ]
+        full = CodeGenerator(self.model_path, fallback=False)
+        cached = CodeGenerator(self.model_path, fallback=False)
+        cached.set_prompt_prefix(PROMPT_PREFIX)
+        for batch in ([prompts[0]], prompts):
+            full_extra, expected, expected_scores = self.greedy(full, batch)
+            cached_extra, actual, actual_scores = self.greedy(cached, batch)
+            self.assertNotIn("past_key_values", full_extra)
+            self.assertIn("past_key_values", cached_extra)
+            self.assertEqual(actual, expected)
+            # A random tiny model repeats itself, so compare every step's scores too
+            torch.testing.assert_close(actual_scores, expected_scores, atol=1e-4, rtol=1e-4)
+
+VALID_ANSWER = "```python\nimport pandas as pd\n```\n# Explanation: loads pandas.\n"
+
+class TestResponseCaching(unittest.TestCase):
+    def generate(self, cache, generated):
+        generator = mock.Mock()
+        generator.generate_response.return_value = generated
+        router = mock.Mock()
+        router.fallback_answer.return_value = "canned fallback"
+        with mock.patch.object(generation, "get_cache", return_value=cache), \
+             mock.patch.object(generation, "get_scheduler", return_value=None), \
+             mock.patch.object(generation, "get_generator", return_value=generator), \
+             mock.patch.object(generation, "get_router", return_value=router), \
+             mock.patch.object(generation, "retrieve_section", return_value="context"), \
+             mock.patch.object(generation, "model_identity", return_value="model"):
+            answer = generate_code_solution("How do I load pandas?", use_router=False)
+        return answer, generator.generate_response.call_count
+
+    def test_fallback_answers_are_not_cached(self):
+        """Test that a generation replaced by the fallback is not cached, so the next request tries the model again."""
+        cache = ResponseCache()
+        self.assertEqual(self.generate(cache, "[Insert code here]"), ("canned fallback", 1))
+        self.assertEqual(self.generate(cache, VALID_ANSWER), (VALID_ANSWER, 1))
+        # The valid answer is served from the cache without generating
+        self.assertEqual(self.generate(cache, "[Insert code here]"), (VALID_ANSWER, 0))
+
+class TestScheduler(unittest.TestCase):
+    def scheduler(self, pool):
+        config = {"batching": {"enabled": True, "max_wait_ms": 25}, "inference": {"pool": pool}}
+        with mock.patch.object(generation, "load_config", return_value=config), \
+             mock.patch.object(generation, "_scheduler", None):
+            return get_scheduler()
+
+    def test_batching_needs_a_thread_pool(self):
+        """Test that the batch scheduler is used with a thread pool and skipped with a process pool."""
+        self.assertIsNotNone(self.scheduler("thread"))
+        self.assertIsNone(self.scheduler("process"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import glob
+import json
+import logging
+import os
+import tempfile
+from src import utils
+from tests import LOG_PATH
+
+class TestLogging(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp_dir.name, "test.log")
+
+    def tearDown(self):
+        utils.setup_logging(dict(utils.load_config().get("logging", {}), path=LOG_PATH))
+        self.tmp_dir.cleanup()
+
+    def read_records(self):
+        utils.flush_logs()
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_json_records_with_fields(self):
+        """Test that queued records reach the file as JSON with their extra fields."""
+        utils.setup_logging({"path": self.log_path})
+        utils.log_message("hello", request_id="abc", total_ms=1.5)
+        utils.log_message("careful", "warning")
+        records = self.read_records()
+        self.assertEqual(records[0]["message"], "hello")
+        self.assertEqual(records[0]["request_id"], "abc")
+        self.assertEqual(records[0]["total_ms"], 1.5)
+        self.assertEqual(records[1]["level"], "WARNING")
+
+    def test_fields_named_like_record_attributes(self):
+        """Test that fields sharing a name with a LogRecord attribute or a JSON key are logged, not rejected."""
+        utils.setup_logging({"path": self.log_path})
+        utils.log_message("hello", name="trace", args=[1], levelname="x", thread="worker-1")
+        record = self.read_records()[0]
+        self.assertEqual(record["message"], "hello")
+        self.assertEqual((record["name"], record["args"], record["levelname"]), ("trace", [1], "x"))
+        self.assertEqual(record["fields.thread"], "worker-1")
+        self.assertEqual(record["level"], "INFO")
+
+    def test_text_format_appends_fields(self):
+        """Test that the text format keeps the classic line and appends the fields as JSON."""
+        utils.setup_logging({"path": self.log_path, "format": "text"})
+        utils.log_message("hello", module="cache")
+        utils.log_message("plain")
+        utils.flush_logs()
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines[0].endswith(' - INFO - hello {"module": "cache"}'))
+        self.assertTrue(lines[1].endswith(" - INFO - plain"))
+
+    def test_debug_sampling(self):
+        """Test that debug records are dropped unless debug is on, then kept at the sample rate."""
+        utils.setup_logging({"path": self.log_path})
+        utils.log_message("dropped", "debug")
+        utils.setup_logging({"path": self.log_path, "debug": True, "debug_sample_rate": 0.0})
+        utils.log_message("sampled out", "debug")
+        utils.setup_logging({"path": self.log_path, "debug": True, "debug_sample_rate": 1.0})
+        utils.log_message("kept", "debug")
+        self.assertEqual([record["message"] for record in self.read_records()], ["kept"])
+        self.assertEqual(logging.getLogger().level, logging.DEBUG)
+
+    def test_size_rotation(self):
+        """Test that the log file is rotated before it grows past max_bytes."""
+        utils.setup_logging({"path": self.log_path, "max_bytes": 2000, "backup_count": 50})
+        for i in range(100):
+            utils.log_message(f"message {i}")
+        utils.flush_logs()
+        self.assertGreater(len(glob.glob(self.log_path + ".*")), 1)
+        for path in glob.glob(self.log_path + "*"):
+            self.assertLessEqual(os.path.getsize(path), 2000)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import contextvars
+import threading
+import urllib.request
+from src import metrics
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that histogram samples count observations at or below each bound."""
+        histogram = metrics.Histogram("test_seconds", "Test histogram", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, "a")
+        samples = dict(histogram.samples())
+        self.assertEqual(samples['test_seconds_bucket{stage="a",le="0.1"}'], 1)
+        self.assertEqual(samples['test_seconds_bucket{stage="a",le="1.0"}'], 2)
+        self.assertEqual(samples['test_seconds_bucket{stage="a",le="+Inf"}'], 3)
+        self.assertEqual(samples['test_seconds_count{stage="a"}'], 3)
+        self.assertAlmostEqual(samples['test_seconds_sum{stage="a"}'], 5.55)
+
+    def test_spans_join_trace_across_copied_context(self):
+        """Test that spans from a worker running in a copied context land in the request's trace."""
+        def work():
+            with metrics.span("generation"):
+                pass
+        
+        with metrics.trace("query", log=False) as request:
+            with metrics.span("retrieval"):
+                pass
+            worker = threading.Thread(target=contextvars.copy_context().run, args=(work,))
+            worker.start()
+            worker.join()
+        self.assertEqual([stage for stage, _, _ in request.spans], ["retrieval", "generation"])
+        self.assertIsNone(metrics.current_trace())
+        self.assertGreaterEqual(metrics.STAGE_SECONDS.count("generation"), 1)
+
+    def test_metrics_endpoint(self):
+        """Test that /metrics serves registered counters in the text format."""
+        requests = metrics.counter("test_requests_total", "Test counter", ("outcome",))
+        requests.inc("ok")
+        requests.inc("ok", amount=2)
+        server = metrics.start_metrics_server(port=0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as response:
+                body = response.read().decode("utf-8")
+        finally:
+            server.shutdown()
+        self.assertIn("# TYPE test_requests_total counter", body)
+        self.assertIn('test_requests_total{outcome="ok"} 3', body)
+
+if __name__ == "__main__":
+    unittest.main()
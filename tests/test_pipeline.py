@@ -0,0 +1,160 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+from pdfminer.high_level import extract_text
+from src import preprocess
+from src.preprocess import (
+    clean_lines, extract_page_texts, extract_pages, iter_lines, page_hashes, tag_code_snippets, tag_lines, write_outputs
+)
+from src.utils import load_chunks
+
+PAGES = [
+    "Chapter 1: Intro\nimport pandas as pd\nprint(1)\n\n12\nSome prose here.\n\x0c",
+    "continued\nfor i in range(3):\n    print(i)\nThe end.\n\x0c",
+]
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one line of text per page; pages are (text, font) pairs."""
+    fonts = sorted({font for _, font in pages})
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None]
+    font_ids = {}
+    for font in fonts:
+        objects.append(f"<< /Type /Font /Subtype /Type1 /BaseFont /{font} >>")
+        font_ids[font] = len(objects)
+    kids = []
+    for text, font in pages:
+        content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R "
+            f"/Resources << /Font << /F1 {font_ids[font]} 0 R >> >> >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    
+    data, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as f:
+        f.write(data)
+
+class TestPageExtraction(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.pdf_path = os.path.join(self.tmp_dir.name, "book.pdf")
+        self.cache_dir = os.path.join(self.tmp_dir.name, "page_cache")
+        self.pages = [(f"Page {i} text", "Helvetica") for i in range(5)]
+        write_pdf(self.pdf_path, self.pages)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_sharded_extraction_matches_pdfminer(self):
+        """Test that pages extracted in shards join up to pdfminer's own extract_text output."""
+        texts = extract_page_texts(self.pdf_path, workers=2, pages_per_shard=2, cache_dir=self.cache_dir)
+        self.assertEqual(len(texts), 5)
+        self.assertIn("Page 3 text", texts[3])
+        self.assertEqual("".join(texts), extract_text(self.pdf_path))
+
+    def test_shard_processes_only_its_pages(self):
+        """Test that a shard worker renders only the pages it was given."""
+        with mock.patch.object(preprocess.PDFPageInterpreter, "process_page", autospec=True,
+                               side_effect=preprocess.PDFPageInterpreter.process_page) as process_page:
+            texts = extract_pages(self.pdf_path, [3, 1])
+        self.assertEqual(sorted(texts), [1, 3])
+        self.assertIn("Page 1 text", texts[1])
+        self.assertIn("Page 3 text", texts[3])
+        self.assertEqual(process_page.call_count, 2)
+
+    def test_cached_pages_are_reused(self):
+        """Test that a re-run reads unchanged pages from the page cache instead of extracting them."""
+        hashes = page_hashes(self.pdf_path)
+        extract_page_texts(self.pdf_path, workers=1, cache_dir=self.cache_dir)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), sorted(f"{page_hash}.txt" for page_hash in hashes))
+        with open(os.path.join(self.cache_dir, f"{hashes[2]}.txt"), "w", encoding="utf-8") as f:
+            f.write("cached\n")
+        self.assertEqual(extract_page_texts(self.pdf_path, workers=1, cache_dir=self.cache_dir)[2], "cached\n")
+
+    def test_interrupted_write_leaves_no_cached_page(self):
+        """Test that a page whose cache write is interrupted is not cached, and is extracted again on the next run."""
+        with mock.patch.object(preprocess.os, "replace", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                extract_page_texts(self.pdf_path, workers=1, cache_dir=self.cache_dir)
+        self.assertFalse([name for name in os.listdir(self.cache_dir) if name.endswith(".txt")])
+        texts = extract_page_texts(self.pdf_path, workers=1, cache_dir=self.cache_dir)
+        self.assertIn("Page 0 text", texts[0])
+        self.assertEqual(len([name for name in os.listdir(self.cache_dir) if name.endswith(".txt")]), 5)
+
+    def test_page_hash_covers_resources(self):
+        """Test that changing only a page's font changes its hash and leaves the other pages' hashes alone."""
+        before = page_hashes(self.pdf_path)
+        self.pages[2] = ("Page 2 text", "Courier")
+        write_pdf(self.pdf_path, self.pages)
+        after = page_hashes(self.pdf_path)
+        self.assertNotEqual(before[2], after[2])
+        self.assertEqual(before[:2] + before[3:], after[:2] + after[3:])
+
+class TestStreamingPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.text_path = os.path.join(self.tmp_dir.name, "book_text.txt")
+        self.chunks_path = os.path.join(self.tmp_dir.name, "book_chunks.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_lines_join_across_page_breaks(self):
+        """Test that a line split by a page break is joined and assigned to its last page."""
+        lines = list(iter_lines(["first\nsec", "ond\nthird"]))
+        self.assertEqual(lines, [(0, "first"), (1, "second"), (1, "third")])
+
+    def test_tag_code_snippets_marks_code_blocks(self):
+        """Test tagging Python code snippets with a sample."""
+        input_text = "Intro text\nprint('Hello')\nMore text\nfor i in range(5):\n    print(i)"
+        expected = "Intro text\n```python\nprint('Hello')\n```\nMore text\n```python\nfor i in range(5):\n    print(i)\n```"
+        self.assertEqual(tag_code_snippets(input_text), expected)
+
+    def test_chunk_offsets_point_into_book_text(self):
+        """Test that every chunk's offsets slice its own text out of the flat book text."""
+        count = write_outputs(tag_lines(clean_lines(iter_lines(PAGES))), self.text_path, self.chunks_path)
+        with open(self.text_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        records = list(load_chunks(self.chunks_path))
+        self.assertEqual(len(records), count)
+        for record in records:
+            self.assertEqual(text[record["start"]:record["end"]], record["text"])
+        code = [record for record in records if record["type"] == "code"]
+        self.assertEqual([record["text"] for record in code], ["import pandas as pd\nprint(1)", "for i in range(3):\n    print(i)"])
+        self.assertEqual(code[1]["page_start"], 1)
+        self.assertEqual(code[0]["section"], "Chapter 1: Intro")
+
+    def test_failed_or_empty_run_keeps_previous_outputs(self):
+        """Test that the existing outputs survive an empty extraction and one that raises."""
+        write_outputs(tag_lines(clean_lines(iter_lines(PAGES))), self.text_path, self.chunks_path)
+        with open(self.text_path, "r", encoding="utf-8") as f:
+            previous = f.read()
+
+        def failing_pages():
+            yield PAGES[0]
+            raise RuntimeError("corrupt page")
+
+        self.assertEqual(write_outputs(tag_lines(clean_lines(iter_lines(["\n\n\x0c"]))), self.text_path, self.chunks_path), 0)
+        with self.assertRaises(RuntimeError):
+            write_outputs(tag_lines(clean_lines(iter_lines(failing_pages()))), self.text_path, self.chunks_path)
+        with open(self.text_path, "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), previous)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir.name)), ["book_chunks.jsonl", "book_text.txt"])
+
+    def test_load_chunks_filters_by_type(self):
+        """Test that downstream loaders can read only the code chunks."""
+        write_outputs(tag_lines(clean_lines(iter_lines(PAGES))), self.text_path, self.chunks_path)
+        self.assertEqual({record["type"] for record in load_chunks(self.chunks_path, "code")}, {"code"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import tempfile
+from src.registry import ModelRegistry
+
+class FakeModel:
+    model_source = "fake"
+
+    def memory_footprint(self):
+        return 1024
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.loads = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _loader(self):
+        self.loads += 1
+        return FakeModel()
+
+    def test_instance_is_shared(self):
+        """Test that repeated lookups reuse the loaded model."""
+        registry = ModelRegistry(self._loader, self.tmp_dir.name)
+        self.assertIs(registry.get(), registry.get())
+        self.assertEqual(self.loads, 1)
+        stats = registry.stats()
+        self.assertEqual(stats["source"], "fake")
+        self.assertEqual(stats["model_bytes"], 1024)
+        self.assertIn("load_seconds", stats)
+
+    def test_reload_when_checkpoint_changes(self):
+        """Test that writing a new checkpoint file triggers a reload."""
+        registry = ModelRegistry(self._loader, self.tmp_dir.name, check_interval=0)
+        first = registry.get()
+        self.assertIs(registry.get(), first)
+        with open(os.path.join(self.tmp_dir.name, "config.json"), "w") as f:
+            f.write("{}")
+        # The first check only notices the change; the next one, seeing the same files, reloads
+        self.assertIs(registry.get(), first)
+        self.assertIsNot(registry.get(), first)
+        self.assertEqual(self.loads, 2)
+
+    def test_no_reload_while_checkpoint_is_written(self):
+        """Test that a checkpoint changing between checks is not reloaded until it settles."""
+        registry = ModelRegistry(self._loader, self.tmp_dir.name, check_interval=0)
+        first = registry.get()
+        path = os.path.join(self.tmp_dir.name, "model.safetensors")
+        for size in range(1, 4):
+            with open(path, "w") as f:
+                f.write("x" * size)
+            self.assertIs(registry.get(), first)
+        self.assertIsNot(registry.get(), first)
+
+    def test_failed_reload_keeps_current_model(self):
+        """Test that a reload error keeps serving the loaded model instead of a fallback."""
+        def failing_reload():
+            raise OSError("half-written checkpoint")
+
+        registry = ModelRegistry(self._loader, self.tmp_dir.name, check_interval=0, reloader=failing_reload)
+        first = registry.get()
+        with open(os.path.join(self.tmp_dir.name, "config.json"), "w") as f:
+            f.write("{}")
+        registry.get()
+        self.assertIs(registry.get(), first)
+        self.assertEqual(self.loads, 1)
+
+    def test_identity_follows_the_checkpoint(self):
+        """Test that the model identity changes with the checkpoint and is stable across restarts."""
+        registry = ModelRegistry(self._loader, self.tmp_dir.name, check_interval=0)
+        first = registry.identity()
+        self.assertEqual(ModelRegistry(self._loader, self.tmp_dir.name).identity(), first)
+        with open(os.path.join(self.tmp_dir.name, "config.json"), "w") as f:
+            f.write("{}")
+        registry.get()
+        self.assertNotEqual(registry.identity(), first)
+
+if __name__ == "__main__":
+    unittest.main()
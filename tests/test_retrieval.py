@@ -0,0 +1,50 @@
+import unittest
+import os
+import tempfile
+from src.index import BookIndex, build_index, get_index, tokenize
+
+SAMPLE_TEXT = "\n".join(
+    ["Introduction to NumPy arrays and vectorized math."] * 12
+    + ["Filtering a pandas DataFrame uses boolean masks.", "df[df['Age'] > 28]"]
+    + ["Plotting with matplotlib line charts."] * 12
+)
+
+class TestRetrievalIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.text_path = os.path.join(self.tmp_dir.name, "book_text.txt")
+        self.index_path = os.path.join(self.tmp_dir.name, "book_index.json")
+        with open(self.text_path, "w", encoding="utf-8") as f:
+            f.write(SAMPLE_TEXT)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_tokenize_drops_stopwords(self):
+        """Test that query words like 'how' and 'do' are not indexed."""
+        self.assertEqual(tokenize("How do I filter a DataFrame?"), ["filter", "dataframe"])
+
+    def test_search_ranks_relevant_chunk_first(self):
+        """Test that BM25 ranks the chunk containing the query terms first."""
+        index = build_index(self.text_path, self.index_path)
+        results = index.search("How do I filter a pandas DataFrame?", top_k=2)
+        self.assertTrue(len(results) > 0)
+        self.assertIn("Filtering a pandas DataFrame", index.chunks[results[0][1]])
+
+    def test_saved_index_round_trip(self):
+        """Test that a saved index loads back with identical search results."""
+        index = build_index(self.text_path, self.index_path)
+        loaded = BookIndex.load(self.index_path)
+        self.assertEqual(index.search("matplotlib"), loaded.search("matplotlib"))
+
+    def test_index_rebuilt_when_text_changes(self):
+        """Test that editing the book text invalidates the cached index."""
+        index = get_index(self.text_path, self.index_path)
+        self.assertEqual(index.search("seaborn"), [])
+        with open(self.text_path, "a", encoding="utf-8") as f:
+            f.write("\nSeaborn builds on matplotlib.")
+        index = get_index(self.text_path, self.index_path)
+        self.assertTrue(len(index.search("seaborn")) > 0)
+
+if __name__ == "__main__":
+    unittest.main()
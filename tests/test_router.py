@@ -0,0 +1,106 @@
+import unittest
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from src import generation
+from src.router import DEFAULT_ANSWER, INTENTS_PATH, Intent, IntentRouter
+
+class TestIntentRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = IntentRouter(
+            [
+                Intent("filter", ["filter", "dataframe"], "FILTER"),
+                Intent("plot", [r"\bplot", "data"], "PLOT"),
+                Intent("array", ["create", "array"], "ARRAY", exclude=["dataframe"]),
+            ],
+            default_answer="DEFAULT",
+        )
+
+    def test_confident_match_is_served(self):
+        """Test that a query matching every pattern of one intent gets its curated answer."""
+        self.assertEqual(self.router.route("How do I FILTER a DataFrame?"), "FILTER")
+        self.assertEqual(self.router.stats()["fast_path"], 1)
+
+    def test_uncovered_and_ambiguous_queries_go_to_the_model(self):
+        """Test that partial, excluded and multi-intent matches are left to the model."""
+        self.assertIsNone(self.router.route("How do I filter a list?"))
+        self.assertIsNone(self.router.route("How do I create a dataframe from an array?"))
+        self.assertIsNone(self.router.route("How do I filter a dataframe and plot its data?"))
+        stats = self.router.stats()
+        self.assertEqual((stats["fast_path"], stats["model"]), (0, 3))
+        self.assertEqual(stats["fast_path_fraction"], 0.0)
+
+    def test_fallback_answer(self):
+        """Test that unusable generations fall back to the first matching intent, else the default."""
+        self.assertEqual(self.router.fallback_answer("filter a dataframe and plot its data"), "FILTER")
+        self.assertEqual(self.router.fallback_answer("What is a closure?"), "DEFAULT")
+
+    def test_library_on_disk(self):
+        """Test that the shipped library loads and keeps the curated answers fix_response served."""
+        router = IntentRouter.load(INTENTS_PATH)
+        self.assertIn("df[df['Age'] > 28]", router.route("How do I filter a pandas DataFrame?"))
+        self.assertIn("df.groupby('Department')", router.route("How does groupby() work on a pandas DataFrame?"))
+        self.assertIn("pd.DataFrame({'A': [1, 2, 3]", router.fallback_answer("Explain closures"))
+
+    def test_single_keyword_is_not_enough(self):
+        """Test that intents need two patterns and one matching keyword never routes a query."""
+        with self.assertRaises(ValueError):
+            Intent("plot", [r"\bplot"], "PLOT")
+        router = IntentRouter([Intent("plot", [r"\bplot", "data"], "PLOT")], min_confidence=0.5)
+        self.assertIsNone(router.route("How do I plot a sine wave?"))
+
+    def test_library_leaves_unrelated_questions_to_the_model(self):
+        """Test that questions sharing a keyword with an intent but not its topic are not routed."""
+        router = IntentRouter.load(INTENTS_PATH)
+        for query in [
+            "How do I join strings with a comma?",
+            "How do I merge two dictionaries?",
+            "How do I compute the mean squared error of a regression model?",
+            "How do I make a 3D surface plot?",
+            "What is the difference between groupby and pivot_table?",
+            "How do I filter a list of strings?",
+            "How do I create an array in JavaScript?",
+        ]:
+            self.assertIsNone(router.route(query), query)
+
+    def test_missing_library(self):
+        """Test that a missing library routes everything to the model and keeps a default answer."""
+        with tempfile.TemporaryDirectory() as tmp:
+            router = IntentRouter.load(os.path.join(tmp, "intents.yaml"))
+        self.assertIsNone(router.route("How do I filter a pandas DataFrame?"))
+        self.assertEqual(router.fallback_answer("anything"), DEFAULT_ANSWER)
+
+class TestRoutedGeneration(unittest.TestCase):
+    def test_fast_path_skips_retrieval_and_model(self):
+        """Test that a routed query is answered without retrieval or generation."""
+        router = IntentRouter([Intent("plot", ["plot", "data"], "PLOT")])
+        with mock.patch.object(generation, "_router", router), \
+             mock.patch.object(generation, "load_config", return_value={"router": {"enabled": True}}), \
+             mock.patch.object(generation, "retrieve_section") as retrieve, \
+             mock.patch.object(generation, "get_generator") as get_generator:
+            self.assertEqual(generation.generate_code_solution("How do I plot data?"), "PLOT")
+            self.assertEqual(list(generation.stream_code_solution("How do I plot data?")), ["PLOT"])
+        retrieve.assert_not_called()
+        get_generator.assert_not_called()
+
+    def test_one_router_under_concurrency(self):
+        """Test that concurrent first calls to get_router build a single shared router."""
+        def slow_load(*args):
+            time.sleep(0.05)
+            return IntentRouter([])
+
+        routers = []
+        with mock.patch.object(generation, "_router", None), \
+             mock.patch.object(generation.IntentRouter, "load", side_effect=slow_load) as load:
+            threads = [threading.Thread(target=lambda: routers.append(generation.get_router())) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(len({id(router) for router in routers}), 1)
+
+if __name__ == "__main__":
+    unittest.main()
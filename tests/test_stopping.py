@@ -0,0 +1,57 @@
+import unittest
+import torch
+from src.stopping import CodeAnswerCriteria, answer_end, is_valid_answer, trim_answer
+
+ANSWER = (
+    "```python\n"
+    "import pandas as pd\n"
+    "df = pd.DataFrame({'A': [1, 2]})\n"
+    "```\n"
+    "# Explanation:\n"
+    "# - Creates a DataFrame.\n"
+)
+
+class CharTokenizer:
+    """One token per character; token 0 is end of text."""
+    eos_token_id = 0
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return "".join(chr(int(token)) for token in tokens if int(token) != self.eos_token_id)
+
+def encode(text):
+    return [ord(char) for char in text]
+
+class TestStopping(unittest.TestCase):
+    def test_answer_end_waits_for_explanation(self):
+        """Test that an answer is complete only once a line follows the explanation comments."""
+        self.assertIsNone(answer_end(ANSWER[:-10]))
+        self.assertIsNone(answer_end(ANSWER))
+        self.assertEqual(answer_end(ANSWER + "Question: next"), len(ANSWER))
+        self.assertEqual(trim_answer(ANSWER + "\nmore text"), ANSWER)
+        self.assertTrue(is_valid_answer(ANSWER))
+        self.assertFalse(is_valid_answer(ANSWER.replace("pandas", "numpy").replace("pd.", "np.")))
+
+    def test_criteria_stops_complete_and_aborts_hopeless(self):
+        """Test per-sequence completion, abort and finish statuses."""
+        prompt = encode("Q?")
+        complete = prompt + encode(ANSWER + "Next")
+        hopeless = prompt + encode("x" * (len(complete) - len(prompt)))
+        placeholder = prompt + encode(("[Insert code]" * 20)[:len(complete) - len(prompt)])
+        criteria = CodeAnswerCriteria(CharTokenizer(), len(prompt), 3, open_fence_within=1000, check_every=1)
+        done = criteria(torch.tensor([complete, hopeless, placeholder]), None)
+        self.assertEqual(done.tolist(), [True, False, True])
+        self.assertEqual(criteria.status, ["complete", "running", "aborted"])
+        criteria.finish()
+        self.assertEqual(criteria.status[1], "finished")
+        self.assertGreaterEqual(criteria.decode_seconds(2), 0.0)
+
+    def test_criteria_aborts_without_code_block(self):
+        """Test that a generation with no code block is aborted after the token budget."""
+        prompt = encode("Q?")
+        criteria = CodeAnswerCriteria(CharTokenizer(), len(prompt), 1, open_fence_within=8, check_every=4)
+        self.assertFalse(criteria(torch.tensor([prompt + encode("abcd")]), None)[0])
+        self.assertTrue(criteria(torch.tensor([prompt + encode("abcdefgh")]), None)[0])
+        self.assertIn("no code block", criteria.reasons[0])
+
+if __name__ == "__main__":
+    unittest.main()
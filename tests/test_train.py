@@ -0,0 +1,380 @@
+import unittest
+import os
+import string
+import tempfile
+import numpy as np
+from types import SimpleNamespace
+from unittest import mock
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Split
+from transformers import PreTrainedTokenizerFast
+from src import train
+from src.train import (
+    BookCodeDataset, PackedBookCodeDataset, configure_cpu_threads, cpu_supports_bf16, example_hash, load_manifest,
+    new_examples, packing_report, pad_collate, remove_checkpoints, resumable_checkpoint, save_manifest, time_saved_report,
+    training_arguments
+)
+from src.utils import find_code_blocks
+
+EOS = 0
+
+BOOK = "".join(f"Example {i} shows a loop.\n```python\nfor i in range({i}):\n    print(i)\n```\n" for i in range(3))
+
+class FakeTokenizer:
+    """One token per character, enough for BookCodeDataset to tokenize and cache examples."""
+
+    name_or_path = "fake"
+    eos_token = "\x00"
+    eos_token_id = EOS
+    pad_token = None
+
+    def __init__(self, size=128):
+        self.size = size
+        self.calls = 0
+
+    def __len__(self):
+        return self.size
+
+    def __call__(self, texts, max_length, truncation=True):
+        self.calls += 1
+        return {"input_ids": [[ord(char) % self.size for char in text][:max_length] for text in texts]}
+
+    def save_pretrained(self, path):
+        pass
+
+def write_book(directory, text=BOOK):
+    path = os.path.join(directory, "book_text.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+class FakeBookDataset:
+    """The parts of BookCodeDataset that packing reads: token arrays and prompt lengths."""
+
+    def __init__(self, examples, prompt_lengths, max_length=16):
+        self.tokenizer = SimpleNamespace(eos_token_id=EOS)
+        self.input_ids = [np.array(ids, dtype=np.int32) for ids in examples]
+        self.prompt_lengths = np.array(prompt_lengths, dtype=np.int32)
+        self.max_length = max_length
+
+    @property
+    def num_tokens(self):
+        return sum(len(ids) for ids in self.input_ids)
+
+    def __len__(self):
+        return len(self.input_ids)
+
+class TestPacking(unittest.TestCase):
+    def setUp(self):
+        # Lengths 7, 4 and 3 with their EOS, and prompts of 2, 1 and 1 tokens
+        self.dataset = FakeBookDataset([[1, 2, 3, 4, 5, 6, EOS], [7, 8, 9, EOS], [10, 11, EOS]], [2, 1, 1])
+        self.packed = PackedBookCodeDataset(self.dataset, block_size=8)
+
+    def test_block_contents(self):
+        """Test that examples are packed first-fit by decreasing length and separated by EOS."""
+        self.assertEqual(len(self.packed), 2)
+        first, second = self.packed[0], self.packed[1]
+        self.assertEqual(first["input_ids"].tolist(), [1, 2, 3, 4, 5, 6, EOS, EOS])
+        self.assertEqual(first["attention_mask"].tolist(), [1, 1, 1, 1, 1, 1, 1, 0])
+        self.assertEqual(second["input_ids"].tolist(), [7, 8, 9, EOS, 10, 11, EOS, EOS])
+        self.assertEqual(second["attention_mask"].tolist(), [1, 1, 1, 1, 1, 1, 1, 0])
+        self.assertNotIn("position_ids", second)
+
+    def test_long_example_is_cut_to_the_block(self):
+        """Test that an example longer than a block is cut to fit and still ends with EOS."""
+        packed = PackedBookCodeDataset(self.dataset, block_size=5)
+        self.assertEqual(packed[0]["input_ids"].tolist(), [1, 2, 3, 4, EOS])
+        self.assertEqual(packed[0]["labels"].tolist(), [-100, -100, 3, 4, EOS])
+
+    def test_labels_mask_prompts_and_padding(self):
+        """Test that prompt and padding tokens get label -100 and code and EOS tokens are kept."""
+        self.assertEqual(self.packed[0]["labels"].tolist(), [-100, -100, 3, 4, 5, 6, EOS, -100])
+        self.assertEqual(self.packed[1]["labels"].tolist(), [-100, 8, 9, EOS, -100, 11, EOS, -100])
+        self.assertEqual(self.packed.num_tokens, 14)
+
+    def test_packing_report(self):
+        """Test the token counts behind the packing report."""
+        report = packing_report(self.dataset, self.packed, batch_size=2)
+        self.assertEqual((report["examples"], report["blocks"]), (3, 2))
+        self.assertAlmostEqual(report["packing_efficiency"], 14 / 16)
+        # Batches [7, 4] and [3] pad to 14 + 3 tokens; fixed padding is 3 x 16 tokens
+        self.assertAlmostEqual(report["batch_padding_efficiency"], 14 / 17)
+        self.assertAlmostEqual(report["token_reduction_vs_fixed_padding"], 1 - 16 / 48)
+        self.assertAlmostEqual(report["token_reduction_vs_batch_padding"], 1 - 16 / 17)
+
+class TestBookCodeDataset(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with mock.patch.object(train, "code_block_offsets", find_code_blocks):
+            self.dataset = BookCodeDataset(write_book(self.tmp.name), FakeTokenizer(), cache_dir=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_select(self):
+        """Test that select keeps the chosen examples, in order, with their tokens and prompt lengths."""
+        subset = self.dataset.select([2, 0])
+        self.assertEqual(len(subset), 2)
+        self.assertEqual(subset.examples, [self.dataset.examples[2], self.dataset.examples[0]])
+        self.assertEqual(subset[0]["input_ids"].tolist(), self.dataset[2]["input_ids"].tolist())
+        self.assertEqual(subset.prompt_lengths.tolist(), [self.dataset.prompt_lengths[2], self.dataset.prompt_lengths[0]])
+        self.assertEqual(subset.num_tokens, len(self.dataset.input_ids[2]) + len(self.dataset.input_ids[0]))
+        # The original dataset is left untouched
+        self.assertEqual(len(self.dataset), 3)
+
+    def load(self, text=BOOK, tokenizer=None, max_length=256, write_cache=True):
+        with mock.patch.object(train, "code_block_offsets", find_code_blocks):
+            return BookCodeDataset(
+                write_book(self.tmp.name, text), tokenizer or FakeTokenizer(), max_length,
+                cache_dir=self.tmp.name, write_cache=write_cache
+            )
+
+    def cache_files(self):
+        return sorted(name for name in os.listdir(self.tmp.name) if name.endswith(".npz"))
+
+    def test_cache_key(self):
+        """Test that the cache key follows the examples, tokenizer and max length and nothing else."""
+        key = self.dataset._cache_key()
+        self.assertEqual(self.load()._cache_key(), key)
+        self.assertNotEqual(self.load(tokenizer=FakeTokenizer(size=100))._cache_key(), key)
+        self.assertNotEqual(self.load(max_length=8)._cache_key(), key)
+        self.assertNotEqual(self.load(BOOK.replace("range(1)", "range(10)"))._cache_key(), key)
+
+    def test_cache_is_reused_and_invalidated(self):
+        """Test that an unchanged book loads from the cache and an edited one is tokenized again."""
+        self.assertEqual(self.cache_files(), [f"{self.dataset._cache_key()}.npz"])
+        tokenizer = FakeTokenizer()
+        cached = self.load(tokenizer=tokenizer)
+        self.assertEqual(tokenizer.calls, 0)
+        self.assertEqual([ids.tolist() for ids in cached.input_ids], [ids.tolist() for ids in self.dataset.input_ids])
+        self.assertEqual(cached.prompt_lengths.tolist(), self.dataset.prompt_lengths.tolist())
+        edited = self.load(BOOK.replace("range(1)", "range(10)"), tokenizer=tokenizer)
+        self.assertEqual(tokenizer.calls, 2)
+        self.assertEqual(self.cache_files(), sorted([f"{self.dataset._cache_key()}.npz", f"{edited._cache_key()}.npz"]))
+        self.assertFalse([name for name in os.listdir(self.tmp.name) if name.endswith(".tmp")])
+
+    def test_only_the_writer_saves_the_cache(self):
+        """Test that a process without write_cache tokenizes in memory and leaves the cache alone."""
+        dataset = self.load(BOOK.replace("range(1)", "range(10)"), write_cache=False)
+        self.assertEqual(len(dataset), 3)
+        self.assertEqual(self.cache_files(), [f"{self.dataset._cache_key()}.npz"])
+
+    def test_examples_end_with_eos(self):
+        """Test that every tokenized example ends with a single EOS and stays within max_length."""
+        dataset = self.load(max_length=40)
+        for ids in dataset.input_ids:
+            self.assertEqual(len(ids), 40)
+            self.assertEqual(ids[-1], EOS)
+            self.assertNotIn(EOS, ids[:-1].tolist())
+
+    def char_tokenizer(self):
+        vocab = {char: i for i, char in enumerate(sorted(set(string.printable) | {"<eos>"}))}
+        tokenizer = PreTrainedTokenizerFast(
+            tokenizer_object=Tokenizer(WordLevel(vocab, unk_token="<eos>")), eos_token="<eos>", pad_token="<eos>"
+        )
+        tokenizer.backend_tokenizer.pre_tokenizer = Split("", "isolated")
+        return tokenizer
+
+    def test_dynamic_padding(self):
+        """Test that the collator pads each batch to its longest example and masks the padding out of the labels."""
+        tokenizer = self.char_tokenizer()
+        dataset = self.load(tokenizer=tokenizer, max_length=1024)
+        lengths = [len(ids) for ids in dataset.input_ids]
+        batch = pad_collate([dataset[0], dataset[2]], tokenizer.eos_token_id)
+        self.assertEqual(tuple(batch["input_ids"].shape), (2, max(lengths[0], lengths[2])))
+        self.assertLess(batch["input_ids"].shape[1], dataset.max_length)
+        short = 0 if lengths[0] < lengths[2] else 1
+        padding = batch["attention_mask"][short] == 0
+        self.assertEqual(int(padding.sum()), abs(lengths[0] - lengths[2]))
+        self.assertTrue((batch["labels"][short][padding] == -100).all())
+
+    def test_collated_batch_keeps_one_eos_label_per_example(self):
+        """Test that padding with the EOS token still leaves each example's own EOS in the labels."""
+        tokenizer = self.char_tokenizer()
+        dataset = self.load(tokenizer=tokenizer, max_length=1024)
+        batch = pad_collate([dataset[i] for i in range(len(dataset))], tokenizer.eos_token_id)
+        for i, ids in enumerate(dataset.input_ids):
+            self.assertEqual(int((batch["labels"][i] == tokenizer.eos_token_id).sum()), 1)
+            self.assertEqual(int(batch["labels"][i][len(ids) - 1]), tokenizer.eos_token_id)
+
+class TestTrainModel(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model_dir = os.path.join(self.tmp.name, "model")
+        self.manifest_path = os.path.join(self.tmp.name, "model.manifest.json")
+        os.makedirs(self.model_dir)
+        open(os.path.join(self.model_dir, "config.json"), "w").close()
+        with mock.patch.object(train, "code_block_offsets", find_code_blocks):
+            examples = BookCodeDataset(write_book(self.tmp.name), FakeTokenizer(), cache_dir=self.tmp.name).examples
+        self.hashes = [example_hash(example) for example in examples]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def train(self, mode, main_process=True):
+        trainer = mock.MagicMock()
+        trainer.train.return_value = SimpleNamespace(metrics={"train_runtime": 1.0, "epoch": 1.0})
+        trainer.is_world_process_zero.return_value = main_process
+        model = mock.MagicMock()
+        with mock.patch.object(train, "FINETUNED_MODEL_PATH", self.model_dir), \
+             mock.patch.object(train, "MANIFEST_PATH", self.manifest_path), \
+             mock.patch.object(train, "BOOK_TEXT_PATH", os.path.join(self.tmp.name, "book_text.txt")), \
+             mock.patch.object(train, "TRAIN_CACHE_DIR", self.tmp.name), \
+             mock.patch.object(train, "code_block_offsets", find_code_blocks), \
+             mock.patch.object(train, "load_config", return_value={"training": {"epochs": 1}}), \
+             mock.patch.object(train, "configure_cpu_threads", return_value=1), \
+             mock.patch.object(train.GPT2Tokenizer, "from_pretrained", return_value=FakeTokenizer()), \
+             mock.patch.object(train.GPT2LMHeadModel, "from_pretrained", return_value=model) as load_model, \
+             mock.patch.object(train, "Trainer", return_value=trainer) as make_trainer:
+            train.train_model(mode, resume=False)
+        return make_trainer, load_model, model
+
+    def test_incremental_trains_only_new_examples(self):
+        """Test that an incremental run continues the fine-tuned model on the examples missing from the manifest."""
+        save_manifest({"examples": self.hashes[:2] + [example_hash("removed example")]}, self.manifest_path)
+        make_trainer, load_model, model = self.train("incremental")
+        self.assertEqual(load_model.call_args.args[0], self.model_dir)
+        train_dataset = make_trainer.call_args.kwargs["train_dataset"]
+        self.assertEqual([example_hash(example) for example in train_dataset.examples], self.hashes[2:])
+        model.save_pretrained.assert_called_once_with(self.model_dir)
+        manifest = load_manifest(self.manifest_path)
+        self.assertEqual((manifest["mode"], manifest["trained_examples"]), ("incremental", 1))
+        self.assertEqual(manifest["examples"], sorted(self.hashes))
+        self.assertNotIn("in_progress", manifest)
+
+    def test_only_the_main_process_saves(self):
+        """Test that other processes leave the model and the finished manifest to the main process."""
+        _, _, model = self.train("full", main_process=False)
+        model.save_pretrained.assert_not_called()
+        self.assertIn("in_progress", load_manifest(self.manifest_path))
+
+    def test_unknown_mode(self):
+        """Test that an unknown training mode is rejected instead of running a full retrain."""
+        with self.assertRaises(ValueError):
+            self.train("partial")
+
+    def test_manifest_is_outside_the_watched_model_dir(self):
+        """Test that writing the manifest cannot trigger a hot reload of the fine-tuned model."""
+        self.assertNotEqual(os.path.dirname(train.MANIFEST_PATH), train.FINETUNED_MODEL_PATH)
+
+class TestTrainingConfig(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def arguments(self, training_config, bf16_cpu=False):
+        with mock.patch.object(train, "cpu_supports_bf16", return_value=bf16_cpu):
+            return training_arguments(training_config, self.tmp.name)
+
+    def test_config_maps_to_training_arguments(self):
+        """Test that every training setting reaches TrainingArguments."""
+        args = self.arguments({
+            "epochs": 2, "batch_size": 4, "gradient_accumulation_steps": 3, "learning_rate": "1e-4",
+            "save_steps": 50, "save_total_limit": 1, "dataloader_workers": 2, "bf16": False,
+        })
+        self.assertEqual(args.output_dir, self.tmp.name)
+        self.assertEqual((args.num_train_epochs, args.per_device_train_batch_size, args.gradient_accumulation_steps), (2, 4, 3))
+        self.assertEqual((args.save_steps, args.save_total_limit), (50, 1))
+        self.assertEqual(args.learning_rate, 1e-4)
+        self.assertEqual((args.dataloader_num_workers, args.dataloader_persistent_workers), (2, True))
+        self.assertTrue(args.use_cpu)
+        self.assertTrue(args.group_by_length)
+        self.assertIsNone(args.ddp_backend)
+
+    def test_defaults_and_packing(self):
+        """Test the defaults of an empty training section, and that packed blocks are not length-grouped."""
+        args = self.arguments({})
+        self.assertEqual((args.num_train_epochs, args.per_device_train_batch_size, args.learning_rate), (3, 8, 5e-5))
+        self.assertEqual((args.dataloader_num_workers, args.dataloader_persistent_workers), (0, False))
+        self.assertFalse(self.arguments({"packing": True}).group_by_length)
+
+    def test_bf16_auto_follows_the_cpu(self):
+        """Test that bf16 "auto" (the default) is on only with native bf16 support and explicit values win."""
+        self.assertTrue(self.arguments({"bf16": "auto"}, bf16_cpu=True).bf16)
+        self.assertFalse(self.arguments({"bf16": "auto"}, bf16_cpu=False).bf16)
+        self.assertTrue(self.arguments({}, bf16_cpu=True).bf16)
+        self.assertFalse(self.arguments({"bf16": False}, bf16_cpu=True).bf16)
+
+    def test_cpu_supports_bf16(self):
+        """Test that bf16 support is read from the CPU flags."""
+        with mock.patch("builtins.open", mock.mock_open(read_data="flags\t: fpu avx512f amx_bf16 amx_tile")):
+            self.assertTrue(cpu_supports_bf16())
+        with mock.patch("builtins.open", mock.mock_open(read_data="flags\t: fpu avx2")):
+            self.assertFalse(cpu_supports_bf16())
+        with mock.patch("builtins.open", side_effect=OSError):
+            self.assertFalse(cpu_supports_bf16())
+
+    def test_threads_are_split_between_local_processes(self):
+        """Test that cores are shared out between local DDP processes unless num_threads is set."""
+        with mock.patch.object(train.torch, "set_num_threads") as set_threads, \
+             mock.patch.object(train.torch, "set_num_interop_threads") as set_interop, \
+             mock.patch.object(train.os, "cpu_count", return_value=8), \
+             mock.patch.dict(os.environ, {"LOCAL_WORLD_SIZE": "2"}):
+            self.assertEqual(configure_cpu_threads({}), 4)
+            set_threads.assert_called_with(4)
+            set_interop.assert_not_called()
+            self.assertEqual(configure_cpu_threads({"num_threads": 6, "interop_threads": 2}), 6)
+            set_threads.assert_called_with(6)
+            set_interop.assert_called_once_with(2)
+
+    def test_late_interop_threads_are_not_fatal(self):
+        """Test that torch refusing to change inter-op threads after startup only logs a warning."""
+        with mock.patch.object(train.torch, "set_num_threads"), \
+             mock.patch.object(train.torch, "set_num_interop_threads", side_effect=RuntimeError("already started")), \
+             mock.patch.object(train, "log_message") as log:
+            self.assertEqual(configure_cpu_threads({"num_threads": 2, "interop_threads": 2}), 2)
+        self.assertEqual(log.call_args.args[1], "warning")
+
+class TestTrainingManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output_dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_checkpoints(self, *steps):
+        for step in steps:
+            os.makedirs(os.path.join(self.output_dir, f"checkpoint-{step}"))
+
+    def test_manifest_round_trip(self):
+        """Test that a saved manifest loads back and a missing one loads as None."""
+        path = os.path.join(self.output_dir, "training_manifest.json")
+        self.assertIsNone(load_manifest(path))
+        save_manifest({"examples": ["a", "b"]}, path)
+        self.assertEqual(load_manifest(path), {"examples": ["a", "b"]})
+        self.assertFalse(os.path.exists(f"{path}.tmp"))
+
+    def test_new_examples(self):
+        """Test that only examples whose content is not in the manifest are selected."""
+        examples = ["first example", "edited example", "new example"]
+        manifest = {"examples": [example_hash("first example"), example_hash("original example")]}
+        self.assertEqual(new_examples([example_hash(e) for e in examples], manifest), [1, 2])
+        self.assertEqual(new_examples([example_hash(e) for e in examples], None), [0, 1, 2])
+
+    def test_resume_only_the_same_run(self):
+        """Test that the latest checkpoint is resumed only for the run recorded as in progress."""
+        self.make_checkpoints(2, 10, 4)
+        run = {"mode": "incremental", "examples": ["a"]}
+        manifest = {"examples": [], "in_progress": dict(run)}
+        self.assertEqual(resumable_checkpoint(run, manifest, self.output_dir), os.path.join(self.output_dir, "checkpoint-10"))
+        self.assertIsNone(resumable_checkpoint({"mode": "incremental", "examples": ["b"]}, manifest, self.output_dir))
+        self.assertIsNone(resumable_checkpoint(run, {"examples": []}, self.output_dir))
+
+    def test_remove_checkpoints(self):
+        """Test that checkpoints of earlier runs are removed and the saved model is kept."""
+        self.make_checkpoints(100, 102)
+        open(os.path.join(self.output_dir, "config.json"), "w").close()
+        remove_checkpoints(self.output_dir)
+        self.assertEqual(os.listdir(self.output_dir), ["config.json"])
+
+    def test_time_saved_report(self):
+        """Test that time saved is measured against a full retrain at the same tokens/sec."""
+        report = time_saved_report("incremental", 2.0, 0.001, 10000)
+        self.assertEqual((report["full_retrain_seconds"], report["seconds_saved"]), (10.0, 8.0))
+
+if __name__ == "__main__":
+    unittest.main()
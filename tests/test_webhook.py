@@ -0,0 +1,37 @@
+import unittest
+import socket
+import threading
+import urllib.error
+from benchmarks.fake_telegram import fake_update, post_update
+from src.webhook import UpdateServer
+
+class TestUpdateServer(unittest.TestCase):
+    def setUp(self):
+        self.updates = []
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.server = UpdateServer(self.sock, self.updates.append, "/telegram", secret_token="s3cret")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.sock.getsockname()[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_dispatches_updates(self):
+        """Test that a posted update is acknowledged and handed to dispatch."""
+        update = fake_update(1, 42, "How do I filter a pandas DataFrame?")
+        self.assertEqual(post_update(self.url + "/telegram", update, "s3cret"), 200)
+        self.assertEqual(self.updates, [update])
+
+    def test_rejects_wrong_secret_and_path(self):
+        """Test that updates without the secret token or on another path are rejected."""
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            post_update(self.url + "/telegram", fake_update(1, 42, "hi"), "wrong")
+        self.assertEqual(raised.exception.code, 403)
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            post_update(self.url + "/other", fake_update(1, 42, "hi"), "s3cret")
+        self.assertEqual(raised.exception.code, 404)
+        self.assertEqual(self.updates, [])
+
+if __name__ == "__main__":
+    unittest.main()